@@ -2,4 +2,32 @@
 
 __version__ = '0.4.5'
 
-from .riba import Document, Receipt
+import importlib
+
+from .riba import Document, FrozenReceipt, Receipt
+
+
+# Submodules not needed to build and render a document: they are imported
+# only when they are accessed for the first time (e.g. ribalta.parser), so
+# that importing ribalta stays cheap for the Odoo workers
+_LAZY_SUBMODULES = frozenset((
+    'batch',
+    'flow_validator',
+    'parser',
+    'reconciliation',
+))
+
+
+def __getattr__(name):
+    if name in _LAZY_SUBMODULES:
+        # import_module also stores the submodule in the globals of the
+        # package, __getattr__ is then no longer called for it
+        return importlib.import_module(f'.{name}', __name__)
+    # end if
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+# end __getattr__
+
+
+def __dir__():
+    return sorted(set(globals()) | _LAZY_SUBMODULES)
+# end __dir__
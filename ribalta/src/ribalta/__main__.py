@@ -0,0 +1,10 @@
+"""Entry point of ``python -m ribalta``, see :mod:`ribalta.cli`"""
+
+import sys
+
+from .cli import main
+
+
+if __name__ == '__main__':
+    sys.exit(main())
+# end if
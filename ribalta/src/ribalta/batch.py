@@ -0,0 +1,298 @@
+"""Rendering of many CBI documents on a pool of processes.
+
+Each job describes one document: the creditor data, the receipts and,
+optionally, the creation date. The jobs hold snapshots only
+(class:`ribalta.riba.FrozenCreditor` and class:`ribalta.riba.FrozenReceipt`),
+so all the Odoo objects are read in the calling process and the workers get
+plain data that can be pickled.
+
+    jobs = [
+        BatchJob.from_records(key, company, bank_account, payment_lines)
+        for key, (company, bank_account, payment_lines) in ...
+    ]
+
+    for result in render_batch(jobs):
+        if result.ok:
+            store(result.key, result.name, result.cbi)
+        else:
+            report(result.key, result.error)
+        # end if
+    # end for
+"""
+
+from collections import defaultdict
+# ProcessPoolExecutor is resolved only when a pool is actually started:
+# concurrent.futures loads it (and multiprocessing) lazily
+from concurrent import futures
+from datetime import datetime
+import logging
+import typing
+
+from .riba import (
+    Document, FrozenCreditor, FrozenReceipt, Receipt, RENDER_BACKEND_MAKO, RENDER_BACKEND_RECORDS
+)
+from .templates import preload_templates
+from .utils import naming
+
+
+# Logging object initialization
+_logger = logging.getLogger(__name__)
+
+
+class BatchJob(typing.NamedTuple):
+    """
+    A document to be rendered by :func:`render_batch`
+
+    :param key: identifier of the job, returned unchanged in the result
+    :param creditor: the creditor data
+    :param receipts: the receipts of the document
+    :param creation_date: creation date of the document, defaults to the
+        time of the rendering
+    :param name: the "Nome supporto", defaults to the one built from the
+        creation date and the SIA code
+    """
+
+    key: typing.Hashable
+    creditor: FrozenCreditor
+    receipts: typing.Tuple[FrozenReceipt, ...]
+    creation_date: datetime = None
+    name: str = None
+
+    @classmethod
+    def from_records(cls, key, creditor_company, creditor_bank_account, payment_lines,
+                     creation_date: datetime = None) -> 'BatchJob':
+        """
+        Build a job reading the data from the Odoo objects. The payment lines
+        are loaded in bulk, as done by :meth:`Receipt.from_payment_lines`
+
+        :param key: identifier of the job
+        :param creditor_company: Odoo object representing the creditor's company
+        :type creditor_company: class:`res.company`
+        :param creditor_bank_account: the bank account of the creditor
+        :type creditor_bank_account: class:`res.partner.bank`
+        :param payment_lines: the payment lines of the receipts
+        :type payment_lines: recordset of class:`account.payment.line`
+        :param creation_date: creation date of the document
+        :type creation_date: datetime
+        :returns: the job
+        :rtype: class:`BatchJob`
+        """
+        return cls(
+            key=key,
+            creditor=FrozenCreditor.from_records(creditor_company, creditor_bank_account),
+            receipts=tuple(Receipt.from_payment_lines(payment_lines, snapshot=True)),
+            creation_date=creation_date,
+        )
+    # end from_records
+
+    @classmethod
+    def from_document(cls, key, doc: Document) -> 'BatchJob':
+        """
+        Build a job from the data of a document
+
+        :param key: identifier of the job
+        :param doc: the document
+        :type doc: class:`Document`
+        :returns: the job
+        :rtype: class:`BatchJob`
+        """
+        return cls(
+            key=key,
+            creditor=doc.creditor_snapshot,
+            receipts=tuple(rcpt.snapshot() for rcpt in doc.receipts),
+            creation_date=doc.creation_date,
+            name=doc.name,
+        )
+    # end from_document
+# end BatchJob
+
+
+class BatchResult(typing.NamedTuple):
+    """
+    Outcome of a class:`BatchJob`: either the rendered document or the error
+    raised while building or rendering it
+
+    :param key: identifier of the job
+    :param name: the "Nome supporto" of the document, None on error
+    :param cbi: the rendered document, None on error
+    :param error: the exception raised by the job, None on success
+    """
+
+    key: typing.Hashable
+    name: typing.Optional[str] = None
+    cbi: typing.Optional[str] = None
+    error: typing.Optional[BaseException] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+    # end ok
+# end BatchResult
+
+
+def render_job(job: BatchJob, group=False, backend: str = RENDER_BACKEND_RECORDS) -> BatchResult:
+    """
+    Build and render the document of a job. The errors are returned in the
+    result instead of being raised
+
+    :param job: the job to be rendered
+    :type job: class:`BatchJob`
+    :param group: the grouping of the receipts, see :meth:`Document.render_cbi`
+    :param backend: the rendering backend, see :meth:`Document.render_cbi`
+    :type backend: str
+    :returns: the result of the job
+    :rtype: class:`BatchResult`
+    """
+    try:
+        doc = Document.from_snapshot(job.creditor, job.creation_date, job.name)
+        for rcpt in job.receipts:
+            doc.add_receipt(rcpt)
+        # end for
+
+        return BatchResult(key=job.key, name=doc.name, cbi=doc.render_cbi(group=group, backend=backend))
+
+    except Exception as e:
+        _logger.debug('Error rendering batch job %r', job.key, exc_info=True)
+        return BatchResult(key=job.key, error=e)
+    # end try / except
+# end render_job
+
+
+def render_batch(jobs: typing.Iterable[BatchJob], group=False, backend: str = RENDER_BACKEND_RECORDS,
+                 max_workers: int = None, executor: futures.Executor = None,
+                 names=None) -> typing.List[BatchResult]:
+    """
+    Render many documents in parallel, one job for each document.
+
+    The jobs without a creation date get the current time, taken once in
+    the calling process. Jobs without a name that would get the same one
+    (same creditor and creation date) get unique names, made of the common
+    name followed by a sequence number, reserved in the calling process too.
+
+    By default a new pool with a process for each CPU is created for the
+    call, passing an executor the pool can be reused for many calls. With
+    max_workers=1 the jobs are rendered in the current process.
+
+    The grouping policy (if any) is sent to the workers, so it must be
+    picklable: the policies of class:`ribalta.grouping` defined at module level
+    can be used, the ones built by factories (e.g. by_duedate_window) can't.
+
+    :param jobs: the jobs to be rendered
+    :type jobs: iterable of class:`BatchJob`
+    :param group: the grouping of the receipts, see :meth:`Document.render_cbi`
+    :param backend: the rendering backend, see :meth:`Document.render_cbi`
+    :type backend: str
+    :param max_workers: number of processes, defaults to the number of CPUs
+    :type max_workers: int
+    :param executor: the executor used to run the jobs instead of a new pool
+    :type executor: class:`concurrent.futures.Executor`
+    :param names: the registry reserving the names of the documents, see
+        :meth:`Document.split`
+    :returns: the results, in the same order of the jobs
+    :rtype: list of class:`BatchResult`
+    """
+
+    jobs = _prepare_jobs(jobs, names or naming.support_names)
+
+    if executor is None and (max_workers == 1 or len(jobs) <= 1):
+        return [render_job(job, group, backend) for job in jobs]
+    # end if
+
+    if executor is None:
+        # With the Mako backend each worker compiles the template once at start
+        initializer = preload_templates if backend == RENDER_BACKEND_MAKO else None
+        with futures.ProcessPoolExecutor(max_workers=max_workers, initializer=initializer) as pool:
+            return _run_jobs(pool, jobs, group, backend)
+        # end with
+    else:
+        return _run_jobs(executor, jobs, group, backend)
+    # end if
+# end render_batch
+
+
+def render_split(doc: Document, max_receipts: int, group=False, backend: str = RENDER_BACKEND_RECORDS,
+                 max_workers: int = None, executor: futures.Executor = None,
+                 names=None) -> typing.List[BatchResult]:
+    """
+    Split a document into supports of bounded size (see :meth:`Document.split`)
+    and render them in parallel. The names of the supports are reserved in
+    the current process, so they're unique even if the supports are rendered
+    by other processes.
+
+    :param doc: the document to be split
+    :type doc: class:`Document`
+    :param max_receipts: maximum number of disposizioni in each support
+    :type max_receipts: int
+    :param group: the grouping of the receipts, see :meth:`Document.render_cbi`
+    :param backend: the rendering backend, see :meth:`Document.render_cbi`
+    :type backend: str
+    :param max_workers: number of processes, defaults to the number of CPUs
+    :type max_workers: int
+    :param executor: the executor used to run the jobs instead of a new pool
+    :type executor: class:`concurrent.futures.Executor`
+    :param names: the registry reserving the names of the supports, see
+        :meth:`Document.split`
+    :returns: the results, one for each support, the key of each result is
+        the name of the support
+    :rtype: list of class:`BatchResult`
+    """
+    jobs = [
+        BatchJob.from_document(support.name, support)
+        for support in doc.split(max_receipts, group, names)
+    ]
+    return render_batch(jobs, group, backend, max_workers, executor, names)
+# end render_split
+
+
+def _prepare_jobs(jobs: typing.Iterable[BatchJob], names) -> typing.List[BatchJob]:
+    """Fix the creation date and the name of the jobs before they're sent
+    to the workers, see :func:`render_batch`"""
+
+    now = datetime.now()
+    jobs = [job if job.creation_date else job._replace(creation_date=now) for job in jobs]
+
+    # Name -> positions of the jobs getting it
+    positions = defaultdict(list)
+    for position, job in enumerate(jobs):
+        positions[job.name or naming.support_name(job.creation_date, job.creditor.sia_code)].append(position)
+    # end for
+
+    for name, same_name in positions.items():
+        unnamed = [position for position in same_name if not jobs[position].name]
+        if len(same_name) < 2 or not unnamed:
+            continue
+        # end if
+
+        try:
+            reserved = names.reserve(name, len(unnamed))
+        except ValueError as e:
+            _logger.warning('Jobs %s get the same name %s: %s', [jobs[p].key for p in unnamed], name, e)
+            continue
+        # end try / except
+
+        for position, reserved_name in zip(unnamed, reserved):
+            jobs[position] = jobs[position]._replace(name=reserved_name)
+        # end for
+    # end for
+
+    return jobs
+# end _prepare_jobs
+
+
+def _run_jobs(executor: futures.Executor, jobs: typing.List[BatchJob], group, backend: str) -> typing.List[BatchResult]:
+
+    submitted = [executor.submit(render_job, job, group, backend) for job in jobs]
+
+    results = list()
+    for job, future in zip(jobs, submitted):
+        try:
+            results.append(future.result())
+        except Exception as e:
+            # The job couldn't be run at all (e.g. data not picklable or
+            # broken pool): report it as a failure of the job
+            results.append(BatchResult(key=job.key, error=e))
+        # end try / except
+    # end for
+
+    return results
+# end _run_jobs
@@ -0,0 +1,471 @@
+"""Content-addressed cache of the rendered CBI documents.
+
+The records of the disposizioni depend only on the creditor data and on the
+receipts: the creation date and the name of the document are written in the
+IB and EF records only. The cache stores the records of the disposizioni
+(the body of the flow) under a SHA-256 hash of the creditor data, of the
+normalized receipts and of the grouping, so rendering again a document with
+the same receipts only formats its IB and EF records.
+
+    cache = MemoryRenderCache(max_bytes=64 * 1024 * 1024)
+
+    cbi_str = riba_doc.render_cbi(cache=cache)
+
+The cache can be kept in memory (class:`MemoryRenderCache`) or in a local
+directory shared by many processes (class:`DirectoryRenderCache`). Both evict
+the least recently used bodies when their total size exceeds the bound: the
+directory cache scans the directory when it stores a body, so the bound
+applies to the bodies stored by all the processes.
+"""
+
+import collections
+from datetime import datetime
+import hashlib
+import operator
+import os
+import tempfile
+import threading
+import typing
+
+from . import __version__, grouping
+from .profiling import NULL_PROFILER, PHASE_GROUPING, PHASE_RENDERING, RenderProfiler
+from .records import CBIRecordsRenderer
+from .records.cbi import CBI_ENCODING
+
+
+# Default bound of the size of the cached bodies
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+
+# Changed when the cached data changes: old entries are no longer found
+CACHE_FORMAT_VERSION = 1
+
+# Receipt fields not written in the flow
+KEY_IGNORED_FIELDS = frozenset(('move_line_id', 'amount'))
+
+# Extension of the files of class:`DirectoryRenderCache`
+BODY_EXTENSION = '.cbibody'
+
+
+class CachedBody(typing.NamedTuple):
+    """
+    Records of the disposizioni of a flow
+
+    :param body: the records, terminators included
+    :param num_disposizioni: number of disposizioni
+    :param total_amount_cents: total amount of the disposizioni in cents
+    """
+
+    body: str
+    num_disposizioni: int
+    total_amount_cents: int
+
+    @property
+    def size(self) -> int:
+        return len(self.body)
+    # end size
+# end CachedBody
+
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+# Keys
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+def grouping_name(group) -> typing.Optional[str]:
+    """
+    Stable name of a grouping argument of :meth:`ribalta.riba.Document.render_cbi`
+
+    :param group: False, True or a grouping policy
+    :returns: the name, None for policies without a stable name (e.g.
+     lambdas and nested functions): they can't be cached
+    :rtype: str
+    """
+    if not callable(group):
+        return grouping.by_debtor_bank_duedate.__name__ if group else 'none'
+    # end if
+
+    module = getattr(group, '__module__', None)
+    qualname = getattr(group, '__qualname__', None)
+    if not module or not qualname or '<locals>' in qualname or '<lambda>' in qualname:
+        return None
+    # end if
+
+    return f'{module}.{qualname}'
+# end grouping_name
+
+
+def document_key(doc, group=False) -> typing.Optional[str]:
+    """
+    Content hash of the data determining the body of the flow of a document:
+    creditor data, receipts (in order) and grouping. The creation date and
+    the name of the document are not part of the key.
+
+    :param doc: the document
+    :type doc: class:`ribalta.riba.Document`
+    :param group: the grouping, see :meth:`ribalta.riba.Document.render_cbi`
+    :returns: the hexadecimal SHA-256 digest, None if the grouping can't be
+     cached
+    :rtype: str
+    """
+    from .riba import FrozenCreditor, FrozenReceipt
+
+    group_name = grouping_name(group)
+    if group_name is None:
+        return None
+    # end if
+
+    digest = hashlib.sha256()
+    digest.update(f'ribalta {__version__} {CACHE_FORMAT_VERSION} {group_name}\n'.encode())
+
+    creditor = doc.creditor_snapshot
+    digest.update(repr(tuple(getattr(creditor, name) for name in FrozenCreditor.FIELDS)).encode())
+
+    get_values = operator.attrgetter(
+        'amount_cents', *(name for name in FrozenReceipt.FIELDS if name not in KEY_IGNORED_FIELDS)
+    )
+    for rcpt in doc.receipts:
+        values = get_values(rcpt)
+        if isinstance(values[1], datetime):
+            # The due date is written without the time
+            values = (values[0], values[1].date()) + values[2:]
+        # end if
+        digest.update(repr(values).encode())
+    # end for
+
+    return digest.hexdigest()
+# end document_key
+
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+# Rendering
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+def render_cached(doc, cache: 'RenderCache', group=False, profiler: RenderProfiler = None) -> str:
+    """
+    Render a document reusing the body of the flow if it's in the cache,
+    the same as :meth:`ribalta.riba.Document.render_cbi` with a cache
+
+    :param doc: the document
+    :type doc: class:`ribalta.riba.Document`
+    :param cache: the cache
+    :type cache: class:`RenderCache`
+    :param group: the grouping, see :meth:`ribalta.riba.Document.render_cbi`
+    :param profiler: records the grouping and the rendering of the bodies
+     not found in the cache
+    :returns: the CBI document
+    :rtype: str
+    """
+
+    profiler = profiler or NULL_PROFILER
+    renderer = CBIRecordsRenderer(doc)
+
+    key = document_key(doc, group)
+    cached = cache.get(key) if key is not None else None
+
+    if cached is None:
+        with profiler.phase(PHASE_GROUPING, doc.receipts_count):
+            lines = doc.dispositions(group)
+        # end with
+        with profiler.phase(PHASE_RENDERING, len(lines)):
+            cached = CachedBody(
+                body=''.join(renderer.iter_receipt_blocks(lines)),
+                num_disposizioni=len(lines),
+                total_amount_cents=sum(line.amount_cents for line in lines),
+            )
+        # end with
+        if key is not None:
+            cache.put(key, cached)
+        # end if
+    # end if
+
+    return (
+        renderer.header()
+        + cached.body
+        + renderer.trailer(cached.num_disposizioni, cached.total_amount_cents)
+    )
+# end render_cached
+
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+# Caches
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+class RenderCache:
+    """
+    Base class of the caches: a least recently used cache of the bodies of
+    the flows, bounded by the total size of the bodies
+
+    :param max_bytes: maximum total size of the cached bodies, bodies
+     larger than the bound are not cached
+    :type max_bytes: int
+    """
+
+    def __init__(self, max_bytes: int = DEFAULT_MAX_BYTES):
+        if max_bytes < 0:
+            raise ValueError(f'Invalid cache size: {max_bytes}')
+        # end if
+        self._max_bytes = max_bytes
+        self._lock = threading.Lock()
+
+        # Key -> size, from the least to the most recently used
+        self._sizes = collections.OrderedDict()
+        self._size = 0
+
+        self.hits = 0
+        self.misses = 0
+    # end __init__
+
+    @property
+    def max_bytes(self) -> int:
+        return self._max_bytes
+    # end max_bytes
+
+    @property
+    def size(self) -> int:
+        """Total size of the cached bodies"""
+        return self._size
+    # end size
+
+    def __len__(self):
+        return len(self._sizes)
+    # end __len__
+
+    def __contains__(self, key: str):
+        return key in self._sizes
+    # end __contains__
+
+    def get(self, key: str) -> typing.Optional[CachedBody]:
+        """
+        Return the body stored with a key, None if it isn't cached
+
+        :param key: the key, see :func:`document_key`
+        :type key: str
+        :rtype: class:`CachedBody`
+        """
+        with self._lock:
+            if key not in self._sizes:
+                # Stored by another process?
+                size = self._find(key)
+                if size is not None:
+                    self._sizes[key] = size
+                    self._size += size
+                # end if
+            # end if
+
+            cached = self._load(key) if key in self._sizes else None
+            if cached is None:
+                self._forget(key)
+                self.misses += 1
+            else:
+                self._sizes.move_to_end(key)
+                self.hits += 1
+            # end if
+            return cached
+        # end with
+    # end get
+
+    def put(self, key: str, cached: CachedBody) -> None:
+        """
+        Store a body, evicting the least recently used ones if needed
+
+        :param key: the key, see :func:`document_key`
+        :type key: str
+        :param cached: the body
+        :type cached: class:`CachedBody`
+        """
+        if cached.size > self._max_bytes:
+            return
+        # end if
+
+        with self._lock:
+            self._forget(key)
+            size = self._store(key, cached)
+            self._sizes[key] = size
+            self._size += size
+
+            if self._size > self._max_bytes:
+                self._refresh()
+            # end if
+
+            while self._size > self._max_bytes:
+                evicted, size = self._sizes.popitem(last=False)
+                self._size -= size
+                self._delete(evicted)
+            # end while
+        # end with
+    # end put
+
+    def clear(self) -> None:
+        """Remove all the bodies"""
+        with self._lock:
+            for key in list(self._sizes):
+                self._forget(key)
+            # end for
+        # end with
+    # end clear
+
+    # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+    # Storage, implemented by the subclasses
+    # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+    def _load(self, key: str) -> typing.Optional[CachedBody]:
+        raise NotImplementedError()
+    # end _load
+
+    def _store(self, key: str, cached: CachedBody) -> int:
+        """Store a body, return the size it takes"""
+        raise NotImplementedError()
+    # end _store
+
+    def _delete(self, key: str) -> None:
+        raise NotImplementedError()
+    # end _delete
+
+    def _find(self, key: str) -> typing.Optional[int]:
+        """Size of a body stored by someone else, None if not found"""
+        return None
+    # end _find
+
+    def _refresh(self) -> None:
+        """Update the sizes with the bodies stored or removed by someone
+        else, when a body stored would exceed the bound and before evicting
+        the least recently used ones"""
+        pass
+    # end _refresh
+
+    def _forget(self, key: str) -> None:
+        size = self._sizes.pop(key, None)
+        if size is not None:
+            self._size -= size
+            self._delete(key)
+        # end if
+    # end _forget
+# end RenderCache
+
+
+class MemoryRenderCache(RenderCache):
+    """
+    Cache keeping the bodies in the memory of the process
+
+    :param max_bytes: maximum total size of the cached bodies
+    :type max_bytes: int
+    """
+
+    def __init__(self, max_bytes: int = DEFAULT_MAX_BYTES):
+        super().__init__(max_bytes)
+        self._bodies = dict()
+    # end __init__
+
+    def _load(self, key):
+        return self._bodies.get(key)
+    # end _load
+
+    def _store(self, key, cached):
+        self._bodies[key] = cached
+        return cached.size
+    # end _store
+
+    def _delete(self, key):
+        self._bodies.pop(key, None)
+    # end _delete
+# end MemoryRenderCache
+
+
+class DirectoryRenderCache(RenderCache):
+    """
+    Cache keeping the bodies in files of a local directory, so they survive
+    the process and can be shared by many processes. The modification time
+    of the files is updated when a body is used. The directory is scanned
+    when the cache is opened, and again only when a body stored would exceed
+    the bound: then the least recently used files of all the processes are
+    removed until the bound is met. Bodies stored by other processes are
+    found on disk.
+
+    :param directory: the directory, created if needed
+    :type directory: str
+    :param max_bytes: maximum total size of the cached files
+    :type max_bytes: int
+    """
+
+    def __init__(self, directory: str, max_bytes: int = DEFAULT_MAX_BYTES):
+        super().__init__(max_bytes)
+        self._directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+        self._refresh()
+    # end __init__
+
+    @property
+    def directory(self) -> str:
+        return self._directory
+    # end directory
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self._directory, key + BODY_EXTENSION)
+    # end _path
+
+    def _load(self, key):
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as fp:
+                header = fp.readline().split()
+                body = fp.read().decode(CBI_ENCODING)
+            # end with
+            os.utime(path)
+            return CachedBody(body, int(header[0]), int(header[1]))
+        except OSError:
+            # Removed by another process
+            return None
+        except (IndexError, ValueError):
+            # Malformed file: it's removed and the body rendered again
+            return None
+        # end try / except
+    # end _load
+
+    def _store(self, key, cached):
+        with tempfile.NamedTemporaryFile(dir=self._directory, suffix='.tmp', delete=False) as fp:
+            # Header line: number of disposizioni and total amount
+            fp.write(f'{cached.num_disposizioni} {cached.total_amount_cents}\n'.encode())
+            fp.write(cached.body.encode(CBI_ENCODING))
+            size = fp.tell()
+        # end with
+        os.replace(fp.name, self._path(key))
+        return size
+    # end _store
+
+    def _delete(self, key):
+        try:
+            os.unlink(self._path(key))
+        except FileNotFoundError:
+            pass
+        # end try / except
+    # end _delete
+
+    def _find(self, key):
+        try:
+            return os.stat(self._path(key)).st_size
+        except OSError:
+            return None
+        # end try / except
+    # end _find
+
+    def _refresh(self):
+        entries = list()
+        for entry in os.scandir(self._directory):
+            if entry.name.endswith(BODY_EXTENSION):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    # Removed by another process
+                    continue
+                # end try / except
+                entries.append((stat.st_mtime, entry.name[:-len(BODY_EXTENSION)], stat.st_size))
+            # end if
+        # end for
+
+        # From the least to the most recently used
+        self._sizes.clear()
+        for _, key, size in sorted(entries):
+            self._sizes[key] = size
+        # end for
+        self._size = sum(self._sizes.values())
+    # end _refresh
+# end DirectoryRenderCache
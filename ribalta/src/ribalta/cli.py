@@ -0,0 +1,415 @@
+"""Command line interface, to generate CBI flows outside of Odoo.
+
+    python -m ribalta render --creditor creditor.json receipts.jsonl -o riba.cbi
+
+The creditor and the receipts are read from plain data files, see
+:mod:`ribalta.plain_data`. Without grouping and splitting the receipts are
+read, validated and rendered one at a time, so the memory used doesn't
+depend on the number of receipts. Grouping and splitting need all the
+receipts: they're loaded in a columnar document (see :mod:`ribalta.table`).
+
+Each flow is written to a temporary file renamed (or copied to the standard
+output) only when the flow is complete and all the receipts are valid, so a
+failed run never leaves a partial flow behind.
+"""
+
+import argparse
+from datetime import date, datetime, timedelta
+import os
+import shutil
+import sys
+import tempfile
+import typing
+
+from .plain_data import FORMAT_JSONL, FORMATS, detect_format, iter_receipts, load_creditor
+from .records import CBIRecordsRenderer
+from .records.cbi import CBI_ENCODING
+from .riba import Document
+from .utils.odoo_stuff import UserError
+from .utils.validators import ValidationIssue, check_receipt
+
+
+# Exit codes
+EXIT_OK = 0
+EXIT_INVALID_DATA = 1
+
+# Path meaning standard input or output
+STDIO_PATH = '-'
+
+# Maximum number of validation errors printed
+MAX_PRINTED_ISSUES = 50
+
+# Extension of the files written when splitting the flow
+CBI_EXTENSION = '.cbi'
+
+
+def build_parser() -> argparse.ArgumentParser:
+
+    parser = argparse.ArgumentParser(
+        prog='python -m ribalta',
+        description='RiBa CBI flows generator',
+    )
+    commands = parser.add_subparsers(dest='command', metavar='command')
+    commands.required = True
+
+    render = commands.add_parser(
+        'render', help='render a CBI flow from plain data files',
+        description=(
+            'Render a CBI flow reading the creditor from a JSON file and the '
+            'receipts from a JSON Lines or CSV file'
+        ),
+    )
+    render.add_argument(
+        'receipts',
+        help=f'receipts file, "{STDIO_PATH}" to read from the standard input',
+    )
+    render.add_argument(
+        '--creditor', required=True,
+        help='JSON file containing the creditor data',
+    )
+    render.add_argument(
+        '--format', choices=FORMATS, dest='data_format',
+        help='format of the receipts file, defaults to the one of its extension',
+    )
+    render.add_argument(
+        '-o', '--output', default=STDIO_PATH,
+        help=(
+            'the CBI file, the standard output by default; with --split the '
+            'directory where the supports are written'
+        ),
+    )
+    render.add_argument(
+        '--group', action='store_true',
+        help='group the receipts with the same debtor, bank and due date',
+    )
+    render.add_argument(
+        '--split', type=_positive_int, metavar='N',
+        help='split the flow in supports of at most N disposizioni',
+    )
+    render.add_argument(
+        '--jobs', type=_positive_int, default=1, metavar='N',
+        help='render the supports on N processes (with --split)',
+    )
+    render.add_argument(
+        '--name', help='the "Nome supporto", defaults to the creation date and the SIA code',
+    )
+    render.add_argument(
+        '--creation-date', type=_parse_datetime,
+        help='creation date of the flow (YYYY-MM-DD or YYYY-MM-DDTHH:MM:SS), defaults to now',
+    )
+    render.add_argument(
+        '--check-duedate', action='store_true',
+        help='refuse the receipts due before tomorrow',
+    )
+    render.set_defaults(handler=render_command)
+
+    return parser
+# end build_parser
+
+
+def main(argv: typing.List[str] = None) -> int:
+    """
+    Run the command line interface
+
+    :param argv: the arguments, defaults to the ones of the process
+    :returns: the exit code
+    :rtype: int
+    """
+    parser = build_parser()
+    args = parser.parse_args(argv)
+
+    try:
+        return args.handler(args)
+    except (UserError, ValueError) as e:
+        _print(f'error: {e}')
+        return EXIT_INVALID_DATA
+    # end try / except
+# end main
+
+
+def render_command(args: argparse.Namespace) -> int:
+
+    if args.split and args.output == STDIO_PATH:
+        raise ValueError('--split requires an output directory (-o)')
+    # end if
+    if args.jobs > 1 and not args.split:
+        raise ValueError('--jobs requires --split')
+    # end if
+
+    data_format = args.data_format
+    if data_format is None:
+        data_format = FORMAT_JSONL if args.receipts == STDIO_PATH else detect_format(args.receipts)
+    # end if
+
+    creditor = load_creditor(args.creditor)
+    doc = Document.from_snapshot(
+        creditor, args.creation_date, args.name,
+        # Grouping and splitting need all the receipts in memory
+        columnar=bool(args.group or args.split),
+    )
+
+    tomorrow = date.today() + timedelta(days=1) if args.check_duedate else None
+    validator = StreamValidator(tomorrow)
+
+    with _open_input(args.receipts) as fp:
+        # The invalid receipts aren't kept in memory for grouping or
+        # splitting: they're only reported when the stream ends
+        receipts = validator.check(iter_receipts(fp, data_format), skip_invalid=doc.columnar)
+
+        if not doc.columnar:
+            # Streaming: the receipts are rendered as soon as they're read
+            with FlowOutput(args.output) as output:
+                records = CBIRecordsRenderer(doc).iter_records(receipts)
+                records_count = _write_records(output.file, records)
+                if not validator.is_valid:
+                    output.discard()
+                # end if
+            # end with
+            return _report(validator, [(args.output, records_count)])
+        # end if
+
+        for rcpt in receipts:
+            doc.add_receipt(rcpt)
+        # end for
+    # end with
+
+    if not validator.is_valid:
+        return _report(validator, [])
+    # end if
+
+    if args.split:
+        written = _write_supports(doc, args.output, args.split, args.group, args.jobs)
+    else:
+        with FlowOutput(args.output) as output:
+            written = [(args.output, doc.write_cbi(output.file, args.group))]
+        # end with
+    # end if
+
+    return _report(validator, written)
+# end render_command
+
+
+class StreamValidator:
+    """
+    Check the receipts while they are streamed, keeping only the first
+    errors found
+
+    :param tomorrow: first valid due date, None to skip the check
+    :type tomorrow: date
+    :param max_issues: number of errors kept
+    :type max_issues: int
+    """
+
+    def __init__(self, tomorrow: date = None, max_issues: int = MAX_PRINTED_ISSUES):
+        self._tomorrow = tomorrow
+        self._max_issues = max_issues
+        self.issues = list()
+        self.issues_count = 0
+        self.receipts_count = 0
+    # end __init__
+
+    @property
+    def is_valid(self) -> bool:
+        return self.issues_count == 0
+    # end is_valid
+
+    def check(self, receipts: typing.Iterable, skip_invalid: bool = False) -> typing.Iterator:
+        """
+        Check the receipts returning them unchanged
+
+        :param receipts: the receipts
+        :param skip_invalid: don't return the receipts with errors, they're
+         only counted and reported
+        :type skip_invalid: bool
+        """
+        for index, rcpt in enumerate(receipts):
+            issues = check_receipt(index, rcpt, self._tomorrow)
+            self.receipts_count += 1
+            if issues:
+                self.issues_count += len(issues)
+                self.issues.extend(issues[:self._max_issues - len(self.issues)])
+                if skip_invalid:
+                    continue
+                # end if
+            # end if
+            yield rcpt
+        # end for
+    # end check
+# end StreamValidator
+
+
+class FlowOutput:
+    """
+    Destination of a flow: a temporary file renamed to the final path, or
+    copied to the standard output, when the with block ends without errors
+
+    :param path: path of the file, STDIO_PATH for the standard output
+    :type path: str
+    """
+
+    def __init__(self, path: str):
+        self._path = path
+        self._discarded = False
+        self.file = None
+    # end __init__
+
+    def discard(self) -> None:
+        """Don't write the file"""
+        self._discarded = True
+    # end discard
+
+    def __enter__(self) -> 'FlowOutput':
+        if self._path == STDIO_PATH:
+            # Deleted when closed
+            self.file = tempfile.TemporaryFile(prefix='.ribalta-', suffix='.tmp')
+        else:
+            directory = os.path.dirname(os.path.abspath(self._path))
+            self.file = tempfile.NamedTemporaryFile(
+                dir=directory, prefix='.ribalta-', suffix='.tmp', delete=False
+            )
+        # end if
+        return self
+    # end __enter__
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self._path == STDIO_PATH:
+            if exc_type is None and not self._discarded:
+                self.file.seek(0)
+                shutil.copyfileobj(self.file, sys.stdout.buffer)
+                sys.stdout.buffer.flush()
+            # end if
+            self.file.close()
+            return
+        # end if
+
+        self.file.close()
+        if exc_type is None and not self._discarded:
+            # Temporary files are private, the flow gets the usual permissions
+            os.chmod(self.file.name, 0o666 & ~_umask())
+            os.replace(self.file.name, self._path)
+        else:
+            os.unlink(self.file.name)
+        # end if
+    # end __exit__
+# end FlowOutput
+
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+# Private functions
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+def _write_records(fp, records: typing.Iterable[str]) -> int:
+    records_count = 0
+    for record in records:
+        fp.write(record.encode(CBI_ENCODING))
+        records_count += 1
+    # end for
+    return records_count
+# end _write_records
+
+
+def _write_supports(
+        doc: Document, directory: str, max_receipts: int, group: bool, jobs: int
+) -> typing.List[typing.Tuple[str, int]]:
+    """Split the document and write a file for each support"""
+
+    os.makedirs(directory, exist_ok=True)
+    supports = doc.split(max_receipts, group)
+    written = list()
+
+    if jobs > 1 and len(supports) > 1:
+        # Imported here: only this path needs the process pool
+        from .batch import BatchJob, render_batch
+
+        results = render_batch(
+            [BatchJob.from_document(support.name, support) for support in supports],
+            group=group, max_workers=jobs,
+        )
+        for result in results:
+            if not result.ok:
+                raise result.error
+            # end if
+            path = os.path.join(directory, result.name + CBI_EXTENSION)
+            with FlowOutput(path) as output:
+                output.file.write(result.cbi.encode(CBI_ENCODING))
+            # end with
+            written.append((path, result.cbi.count('\n')))
+        # end for
+
+    else:
+        for support in supports:
+            path = os.path.join(directory, support.name + CBI_EXTENSION)
+            with FlowOutput(path) as output:
+                written.append((path, support.write_cbi(output.file, group)))
+            # end with
+        # end for
+    # end if
+
+    return written
+# end _write_supports
+
+
+def _open_input(path: str):
+    if path == STDIO_PATH:
+        # The standard input must stay open
+        return open(sys.stdin.fileno(), encoding='utf-8', newline='', closefd=False)
+    # end if
+    return open(path, encoding='utf-8', newline='')
+# end _open_input
+
+
+def _report(validator: StreamValidator, written: typing.List[typing.Tuple[str, int]]) -> int:
+
+    if not validator.is_valid:
+        _print(f'{validator.issues_count} errors in {validator.receipts_count} receipts:')
+        for issue in validator.issues:
+            _print(f'  {_format_issue(issue)}')
+        # end for
+        if validator.issues_count > len(validator.issues):
+            _print(f'  ... {validator.issues_count - len(validator.issues)} more errors')
+        # end if
+        return EXIT_INVALID_DATA
+    # end if
+
+    for path, records_count in written:
+        _print(f'{path}: {records_count} records')
+    # end for
+
+    return EXIT_OK
+# end _report
+
+
+def _format_issue(issue: ValidationIssue) -> str:
+    return f'receipt {issue.index + 1} ({issue.receipt.debtor_name}) {issue.field}: {issue.message}'
+# end _format_issue
+
+
+def _umask() -> int:
+    # The umask can only be read by changing it
+    umask = os.umask(0)
+    os.umask(umask)
+    return umask
+# end _umask
+
+
+def _print(message: str) -> None:
+    print(message, file=sys.stderr)
+# end _print
+
+
+def _positive_int(value: str) -> int:
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError(f'{value} is not a positive number')
+    # end if
+    return number
+# end _positive_int
+
+
+def _parse_datetime(value: str) -> datetime:
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f'invalid date "{value}"')
+    # end try / except
+# end _parse_datetime
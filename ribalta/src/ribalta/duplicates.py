@@ -0,0 +1,355 @@
+"""Detection of the duplicated receipts of a document.
+
+A payment order may contain the same due date move line twice, or two
+receipts charging the same amount to the same debtor bank account on the
+same due date: both would produce duplicated RiBa charges. The receipts are
+indexed by hash on the move line and on a fingerprint made of the debtor
+fiscal code or VAT number, ABI, CAB, due date and amount in cents, so each
+receipt is checked in constant time.
+
+    index = DuplicateIndex()
+    for rcpt in receipts:
+        duplicate = index.add(rcpt)
+        if duplicate:
+            ...  # duplicate.receipt repeats duplicate.original
+        # end if
+    # end for
+
+Documents can run the check while the receipts are added, see the duplicates
+argument of class:`ribalta.riba.Document`.
+"""
+
+import bisect
+from datetime import datetime
+import heapq
+import typing
+
+
+# Kinds of duplicate
+DUPLICATE_MOVE_LINE = 'move_line'
+DUPLICATE_FINGERPRINT = 'fingerprint'
+
+
+def receipt_fingerprint(rcpt) -> tuple:
+    """
+    Data identifying the charge of a receipt: debtor fiscal code or VAT
+    number, ABI, CAB, due date and amount in cents
+
+    :param rcpt: the receipt
+    :type rcpt: class:`ribalta.riba.Receipt` or class:`ribalta.riba.FrozenReceipt`
+    :returns: the fingerprint, a hashable tuple
+    :rtype: tuple
+    """
+
+    duedate = rcpt.duedate
+    if isinstance(duedate, datetime):
+        duedate = duedate.date()
+    # end if
+
+    return (
+        str(rcpt.debtor_fiscode_or_vat or '').strip().upper(),
+        rcpt.debtor_bank_abi,
+        rcpt.debtor_bank_cab,
+        duedate,
+        rcpt.amount_cents,
+    )
+# end receipt_fingerprint
+
+
+class Duplicate(typing.NamedTuple):
+    """
+    A receipt repeating another receipt
+
+    :param kind: DUPLICATE_MOVE_LINE if the receipts have the same move
+     line, DUPLICATE_FINGERPRINT if they charge the same amount to the same
+     debtor bank account on the same due date
+    :param receipt: the duplicated receipt
+    :param position: position of the duplicated receipt (from 0)
+    :param original: the first receipt with the same move line or fingerprint
+    :param original_position: position of the original receipt (from 0)
+    """
+
+    kind: str
+    receipt: typing.Any
+    position: int
+    original: typing.Any
+    original_position: int
+
+    def __str__(self):
+        if self.kind == DUPLICATE_MOVE_LINE:
+            reason = 'same move line'
+        else:
+            reason = 'same debtor, bank, due date and amount'
+        # end if
+        return (
+            f'Receipt {self.position + 1} ({self.receipt.debtor_name}) duplicates '
+            f'receipt {self.original_position + 1}: {reason}'
+        )
+    # end __str__
+# end Duplicate
+
+
+class _Entry:
+    """A receipt of the index, with the keys computed when it was added"""
+
+    __slots__ = ('receipt', 'move_line_key', 'fingerprint', 'kind', 'original')
+
+    def __init__(self, receipt, move_line_key, fingerprint):
+        self.receipt = receipt
+        self.move_line_key = move_line_key
+        self.fingerprint = fingerprint
+        # Kind of duplicate and serial of the original, None for originals
+        self.kind = None
+        self.original = None
+    # end __init__
+# end _Entry
+
+
+class DuplicateIndex:
+    """
+    Hash index of the receipts by move line and by fingerprint (see
+    :func:`receipt_fingerprint`). Each receipt is reported against the first
+    receipt, not duplicating another one, with the same move line or
+    fingerprint. Receipts without a move line id (e.g. built from plain
+    data) are checked by fingerprint only.
+
+    Each receipt gets a serial number, increasing in the order of the
+    receipts, so :meth:`remove` updates only the receipts sharing a key with
+    the removed one: the positions are the ranks of the serials.
+
+    :param receipts: receipts to be indexed, the duplicates among them are
+     available in :attr:`duplicates`
+    :type receipts: iterable of class:`ribalta.riba.Receipt`
+    """
+
+    def __init__(self, receipts: typing.Iterable = ()):
+
+        # Move line id -> serials of the receipts, in increasing order
+        self._by_move_line = dict()
+
+        # Fingerprint -> serials of the receipts, in increasing order
+        self._by_fingerprint = dict()
+
+        # Serial -> entry
+        self._entries = dict()
+
+        # Serials of the receipts in the order of the receipts: the position
+        # of a receipt is the index of its serial
+        self._serials = list()
+        self._next_serial = 0
+
+        # Serials of the duplicated receipts
+        self._duplicated = set()
+
+        for rcpt in receipts:
+            self.add(rcpt)
+        # end for
+    # end __init__
+
+    @property
+    def duplicates(self) -> typing.List[Duplicate]:
+        """The duplicates, in the order of the receipts"""
+        return [self._duplicate(serial) for serial in sorted(self._duplicated)]
+    # end duplicates
+
+    def __len__(self):
+        return len(self._serials)
+    # end __len__
+
+    def check(self, rcpt) -> typing.Optional[Duplicate]:
+        """
+        Look for a receipt already indexed that is repeated by the given
+        receipt, without adding it to the index
+
+        :param rcpt: the receipt
+        :returns: the duplicate, None if the receipt is not a duplicate
+        :rtype: class:`Duplicate`
+        """
+
+        entry = _Entry(rcpt, self._move_line_key(rcpt), receipt_fingerprint(rcpt))
+        found = self._find_original(entry, self._next_serial)
+        if found is None:
+            return None
+        # end if
+
+        kind, original = found
+        return Duplicate(
+            kind, rcpt, len(self._serials),
+            self._entries[original].receipt, self._position(original)
+        )
+    # end check
+
+    def add(self, rcpt) -> typing.Optional[Duplicate]:
+        """
+        Check a receipt and add it to the index
+
+        :param rcpt: the receipt
+        :returns: the duplicate, None if the receipt is not a duplicate
+        :rtype: class:`Duplicate`
+        """
+
+        entry = _Entry(rcpt, self._move_line_key(rcpt), receipt_fingerprint(rcpt))
+        serial = self._next_serial
+        self._next_serial += 1
+
+        found = self._find_original(entry, serial)
+
+        self._entries[serial] = entry
+        self._serials.append(serial)
+        if entry.move_line_key is not None:
+            self._by_move_line.setdefault(entry.move_line_key, []).append(serial)
+        # end if
+        self._by_fingerprint.setdefault(entry.fingerprint, []).append(serial)
+
+        if found is None:
+            return None
+        # end if
+
+        entry.kind, entry.original = found
+        self._duplicated.add(serial)
+        return self._duplicate(serial)
+    # end add
+
+    def remove(self, position: int) -> None:
+        """
+        Remove a receipt from the index, the following receipts move back by
+        one position. Only the receipts sharing the move line or the
+        fingerprint of the removed receipt are checked again: a receipt
+        duplicating the removed one is reported against the next original,
+        or becomes an original itself.
+
+        :param position: position of the receipt (from 0, negative values
+         count from the end)
+        :raises IndexError: if there's no receipt at the position
+        """
+
+        serial = self._serials.pop(position)
+        entry = self._entries.pop(serial)
+
+        for keys, key in ((self._by_move_line, entry.move_line_key), (self._by_fingerprint, entry.fingerprint)):
+            if key is not None:
+                serials = keys[key]
+                serials.remove(serial)
+                if not serials:
+                    del keys[key]
+                # end if
+            # end if
+        # end for
+
+        if entry.original is not None:
+            # No receipt is reported against a duplicate
+            self._duplicated.discard(serial)
+        else:
+            self._recheck(other for other in self._sharing_keys(entry) if other > serial)
+        # end if
+    # end remove
+
+    def clear(self) -> None:
+        """Remove all the receipts from the index"""
+        self._by_move_line.clear()
+        self._by_fingerprint.clear()
+        self._entries.clear()
+        self._serials.clear()
+        self._duplicated.clear()
+    # end clear
+
+    # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+    # Private methods
+    # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+    @staticmethod
+    def _move_line_key(rcpt):
+        # Empty Odoo records have id False
+        return getattr(rcpt, 'move_line_id', None) or None
+    # end _move_line_key
+
+    def _position(self, serial: int) -> int:
+        return bisect.bisect_left(self._serials, serial)
+    # end _position
+
+    def _duplicate(self, serial: int) -> Duplicate:
+        entry = self._entries[serial]
+        return Duplicate(
+            entry.kind, entry.receipt, self._position(serial),
+            self._entries[entry.original].receipt, self._position(entry.original)
+        )
+    # end _duplicate
+
+    def _sharing_keys(self, entry: _Entry) -> typing.Iterator[int]:
+        """The serials of the receipts with the move line or the fingerprint
+        of the entry"""
+        if entry.move_line_key is not None:
+            yield from self._by_move_line.get(entry.move_line_key, ())
+        # end if
+        yield from self._by_fingerprint.get(entry.fingerprint, ())
+    # end _sharing_keys
+
+    def _find_original(self, entry: _Entry, serial: int) -> typing.Optional[typing.Tuple[str, int]]:
+        """The kind of duplicate and the serial of the first original
+        receipt before the given serial sharing a key with the entry"""
+
+        for kind, keys, key in (
+                (DUPLICATE_MOVE_LINE, self._by_move_line, entry.move_line_key),
+                (DUPLICATE_FINGERPRINT, self._by_fingerprint, entry.fingerprint),
+        ):
+            if key is None:
+                continue
+            # end if
+            for other in keys.get(key, ()):
+                if other >= serial:
+                    break
+                # end if
+                if self._entries[other].original is None:
+                    return kind, other
+                # end if
+            # end for
+        # end for
+
+        return None
+    # end _find_original
+
+    def _recheck(self, serials: typing.Iterable[int]) -> None:
+        """
+        Check again the receipts following a removed original, in the order
+        of the receipts: a receipt becoming an original, or a duplicate,
+        changes the receipts following it with the same keys
+        """
+
+        pending = list(set(serials))
+        heapq.heapify(pending)
+        while pending:
+            serial = heapq.heappop(pending)
+            entry = self._entries[serial]
+            found = self._find_original(entry, serial)
+            was_original = entry.original is None
+
+            if found is None:
+                entry.kind = entry.original = None
+                self._duplicated.discard(serial)
+            else:
+                entry.kind, entry.original = found
+                self._duplicated.add(serial)
+            # end if
+
+            if was_original != (found is None):
+                for other in self._sharing_keys(entry):
+                    if other > serial:
+                        heapq.heappush(pending, other)
+                    # end if
+                # end for
+            # end if
+        # end while
+    # end _recheck
+# end DuplicateIndex
+
+
+def find_duplicates(receipts: typing.Iterable) -> typing.List[Duplicate]:
+    """
+    Find the duplicated receipts in a single pass
+
+    :param receipts: the receipts
+    :type receipts: iterable of class:`ribalta.riba.Receipt`
+    :returns: the duplicates, in the order of the receipts
+    :rtype: list of class:`Duplicate`
+    """
+    return DuplicateIndex(receipts).duplicates
+# end find_duplicates
@@ -0,0 +1,597 @@
+"""Structural validation of the CBI flows before they're sent to the bank.
+
+The flow is checked in a single pass, one record at a time:
+
+- each record is 120 characters long, printable ASCII, terminated by CR LF;
+- the records follow the sequence IB, (14, 20, 30, 40, 50, 51, 70)*, EF;
+- the constant parts of each record (fillers, codes) and the numeric fields
+  match the layouts of :mod:`ribalta.records.cbi`;
+- the disposizioni are numbered from 1 without gaps;
+- the EF record matches the IB record and the detail records: number of
+  disposizioni, total amount and number of records.
+
+Optionally each record can be compared with the corresponding record of a
+reference flow, ignoring the creation date and the name of the support.
+
+    report = validate_flow(riba_doc.render_cbi_bytes())
+    report.raise_if_invalid()
+"""
+
+import contextlib
+import mmap
+import os
+import re
+import typing
+
+from .parser import INTEGER_FIELDS
+from .records.cbi import (
+    R_14, R_EF, R_IB, RECEIPT_LAYOUTS, RECORD_END, RECORD_LENGTH, RECORD_SIZE, RECORDS_IN_EACH_RIBA,
+)
+from .records.layout import Field, RecordLayout
+from .utils.errors import CBIFormatError
+
+
+# Maximum number of issues collected, the validation stops when it's reached
+MAX_ISSUES = 100
+
+# Issue codes
+ISSUE_LENGTH = 'length'
+ISSUE_SEQUENCE = 'sequence'
+ISSUE_FIELD = 'field'
+ISSUE_PROGRESSIVE = 'progressive'
+ISSUE_TOTALS = 'totals'
+
+# Fields of the IB and EF records ignored comparing a flow with a reference
+# flow: creation date and name of the support (first and last character)
+REFERENCE_IGNORED_FIELDS = ((14, 19), (20, 39))
+
+# Data common to the IB and EF records: SIA code, ABI, date and name
+IB_EF_COMMON_SLICE = slice(3, 39)
+
+# Position of the progressive number in the records of each disposizione
+PROGRESSIVE_NUMBER_SLICE = slice(3, 10)
+
+# Position of the second progressive number of the record 51
+R51_PROGRESSIVE_NUMBER_SLICE = slice(10, 20)
+
+# Position of the amount in the record 14
+AMOUNT_SLICE = slice(33, 46)
+
+# Position of the totals in the EF record
+EF_DISPOSITIONS_SLICE = slice(45, 52)
+EF_AMOUNT_SLICE = slice(52, 67)
+EF_RECORDS_SLICE = slice(82, 89)
+
+RECORD_END_BYTES = RECORD_END.encode('ascii')
+
+# Number of records compared at once with the reference flow
+COMPARE_CHUNK_RECORDS = 1024
+
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+# Report
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+class FlowIssue(typing.NamedTuple):
+    """Error found validating a flow"""
+
+    # Position of the record in the flow (starting from 0), None for the
+    # errors concerning the whole flow
+    index: typing.Optional[int]
+    # Type of the record ('IB', '14', ... 'EF') or None
+    record_type: typing.Optional[str]
+    # One of the ISSUE_* codes
+    code: str
+    message: str
+
+    def __str__(self):
+        if self.index is None:
+            return f'{self.code}: {self.message}'
+        # end if
+        return f'record {self.index + 1} ({self.record_type}) {self.code}: {self.message}'
+    # end __str__
+# end FlowIssue
+
+
+class RecordDifference(typing.NamedTuple):
+    """Record differing from the corresponding record of the reference flow"""
+
+    # Position of the record in the flow (starting from 0)
+    index: int
+    # The record of the reference flow, None if the flow is longer
+    expected: typing.Optional[str]
+    # The record of the validated flow, None if the flow is shorter
+    found: typing.Optional[str]
+
+    def __str__(self):
+        return f'record {self.index + 1}: expected {self.expected!r}, found {self.found!r}'
+    # end __str__
+# end RecordDifference
+
+
+class FlowValidationReport:
+    """
+    Result of the validation of a flow
+
+    :param issues: the errors found
+    :type issues: List of class:`FlowIssue`
+    :param differences: the records differing from the reference flow
+    :type differences: List of class:`RecordDifference`
+    :param records_count: number of records of the flow
+    :type records_count: int
+    :param dispositions_count: number of disposizioni of the flow
+    :type dispositions_count: int
+    :param total_amount_cents: sum of the amounts of the records 14
+    :type total_amount_cents: int
+    :param truncated: True if the validation stopped after MAX_ISSUES errors
+    :type truncated: bool
+    """
+
+    def __init__(
+            self, issues: typing.List[FlowIssue], differences: typing.List[RecordDifference],
+            records_count: int, dispositions_count: int, total_amount_cents: int,
+            truncated: bool = False
+    ):
+        self._issues = issues
+        self._differences = differences
+        self._records_count = records_count
+        self._dispositions_count = dispositions_count
+        self._total_amount_cents = total_amount_cents
+        self._truncated = truncated
+    # end __init__
+
+    @property
+    def issues(self) -> typing.List[FlowIssue]:
+        return self._issues
+    # end issues
+
+    @property
+    def differences(self) -> typing.List[RecordDifference]:
+        return self._differences
+    # end differences
+
+    @property
+    def records_count(self) -> int:
+        return self._records_count
+    # end records_count
+
+    @property
+    def dispositions_count(self) -> int:
+        return self._dispositions_count
+    # end dispositions_count
+
+    @property
+    def total_amount_cents(self) -> int:
+        return self._total_amount_cents
+    # end total_amount_cents
+
+    @property
+    def truncated(self) -> bool:
+        return self._truncated
+    # end truncated
+
+    @property
+    def is_valid(self) -> bool:
+        return not self._issues and not self._differences
+    # end is_valid
+
+    def as_dicts(self) -> typing.List[typing.Dict[str, typing.Any]]:
+        """The errors as plain dictionaries (e.g. to be serialized)"""
+        return [issue._asdict() for issue in self._issues] + [
+            dict(difference._asdict(), code='reference') for difference in self._differences
+        ]
+    # end as_dicts
+
+    def raise_if_invalid(self) -> None:
+        """Raise a single exception listing all the errors found"""
+        if not self.is_valid:
+            raise CBIFormatError(str(self))
+        # end if
+    # end raise_if_invalid
+
+    def __str__(self):
+        if self.is_valid:
+            return f'Flusso valido: {self._dispositions_count} disposizioni, {self._records_count} record'
+        # end if
+
+        lines = [
+            f'Flusso non valido ({len(self._issues)} errori'
+            f'{" o piu" if self._truncated else ""}, '
+            f'{len(self._differences)} record diversi dal riferimento):'
+        ]
+        lines.extend(str(issue) for issue in self._issues)
+        lines.extend(str(difference) for difference in self._differences)
+        return '\n'.join(lines)
+    # end __str__
+# end FlowValidationReport
+
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+# Records checks
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+def _field_pattern(field: Field) -> bytes:
+    """Regular expression matching the valid values of a field: constant
+    fields must match exactly, numeric fields must contain digits only, the
+    other fields printable ASCII characters"""
+    if field.is_constant:
+        return re.escape(field.value.encode('ascii'))
+    elif field.name in INTEGER_FIELDS:
+        return b'[0-9]{%d}' % field.width
+    else:
+        return b'[\x20-\x7e]{%d}' % field.width
+    # end if
+# end _field_pattern
+
+
+def _record_pattern(layout: RecordLayout) -> typing.Pattern[bytes]:
+    """Regular expression matching the valid records of a layout, terminator
+    included"""
+    return re.compile(
+        b''.join(_field_pattern(field) for field in layout.fields) + re.escape(RECORD_END_BYTES)
+    )
+# end _record_pattern
+
+
+def _disposition_pattern() -> typing.Pattern[bytes]:
+    """Regular expression matching the valid disposizioni: all the records
+    of the disposizione at once, with the same progressive number. The
+    progressive numbers and the amount are captured to be checked"""
+    parts = list()
+    for layout in RECEIPT_LAYOUTS:
+        for field in layout.fields:
+            if field.name == 'num_progr' and field.start == PROGRESSIVE_NUMBER_SLICE.start + 1:
+                if layout is R_14:
+                    parts.append(b'(?P<progressive>[0-9]{%d})' % field.width)
+                else:
+                    parts.append(b'(?P=progressive)')
+                # end if
+            elif field.name == 'num_progr':
+                parts.append(b'(?P<progressive_51>[0-9]{%d})' % field.width)
+            elif field.name == 'amount_cents':
+                parts.append(b'(?P<amount>[0-9]{%d})' % field.width)
+            else:
+                parts.append(_field_pattern(field))
+            # end if
+        # end for
+        parts.append(re.escape(RECORD_END_BYTES))
+    # end for
+    return re.compile(b''.join(parts))
+# end _disposition_pattern
+
+
+def _diagnose_record(layout: RecordLayout, record: bytes) -> typing.List[str]:
+    """Describe why a record doesn't match its layout"""
+
+    if record[RECORD_LENGTH:] != RECORD_END_BYTES:
+        return [f'record not terminated by CR LF after {RECORD_LENGTH} characters']
+    # end if
+
+    problems = list()
+    for field in layout.fields:
+        value = record[field.start - 1:field.end]
+        text = value.decode('ascii', 'replace')
+        position = f'{field.start}-{field.end}'
+
+        if field.is_constant:
+            if value != field.value.encode('ascii'):
+                problems.append(f'{position}: expected {field.value!r}, found {text!r}')
+            # end if
+        elif field.name in INTEGER_FIELDS:
+            if not value.isdigit():
+                problems.append(f'{position} {field.name}: not a number {text!r}')
+            # end if
+        elif not all(0x20 <= c <= 0x7e for c in value):
+            problems.append(f'{position} {field.name}: invalid characters {text!r}')
+        # end if
+    # end for
+
+    return problems or ['invalid record']
+# end _diagnose_record
+
+
+# Record type -> (layout, pattern)
+_RECORD_CHECKS = {
+    layout.record_type.encode('ascii'): (layout, _record_pattern(layout))
+    for layout in (R_IB,) + RECEIPT_LAYOUTS + (R_EF,)
+}
+
+# Record types of each disposizione, in order
+_RECEIPT_RECORD_TYPES = tuple(layout.record_type.encode('ascii') for layout in RECEIPT_LAYOUTS)
+
+_DISPOSITION_PATTERN = _disposition_pattern()
+
+# Size in bytes of each disposizione
+DISPOSITION_SIZE = RECORD_SIZE * RECORDS_IN_EACH_RIBA
+
+
+def _blank_fields(record: bytes, fields) -> bytes:
+    for start, end in fields:
+        record = record[:start - 1] + b' ' * (end - start + 1) + record[end:]
+    # end for
+    return record
+# end _blank_fields
+
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+# Validation
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+def validate_flow(
+        data: typing.Union[bytes, bytearray, memoryview, str],
+        reference: typing.Union[bytes, bytearray, memoryview, str] = None,
+        max_issues: int = MAX_ISSUES
+) -> FlowValidationReport:
+    """
+    Check the structure of a CBI flow
+
+    :param data: the flow, e.g. the result of
+     :meth:`ribalta.riba.Document.render_cbi_bytes`
+    :type data: bytes-like or str
+    :param reference: a flow to compare the records with, the creation date
+     and the name of the support are ignored
+    :type reference: bytes-like or str
+    :param max_issues: number of errors after which the validation stops
+    :type max_issues: int
+    :returns: the report listing the errors found
+    :rtype: class:`FlowValidationReport`
+    """
+
+    issues = list()
+
+    def add_issue(index, record_type, code, message):
+        issues.append(FlowIssue(
+            index, record_type.decode('ascii', 'replace') if record_type else None, code, message
+        ))
+    # end add_issue
+
+    if isinstance(data, str):
+        try:
+            data = data.encode('ascii')
+        except UnicodeEncodeError as e:
+            add_issue(None, None, ISSUE_FIELD, f'non ASCII character at position {e.start}')
+            data = data.encode('ascii', 'replace')
+        # end try / except
+    # end if
+
+    if isinstance(reference, str):
+        reference = reference.encode('ascii', 'replace')
+    # end if
+
+    size = len(data)
+    records_count = size // RECORD_SIZE
+    last = records_count - 1
+
+    if size % RECORD_SIZE:
+        add_issue(
+            None, None, ISSUE_LENGTH,
+            f'{size} bytes are not a whole number of records of {RECORD_SIZE} bytes'
+        )
+    # end if
+
+    if records_count < 2:
+        add_issue(None, None, ISSUE_SEQUENCE, 'IB and EF records required')
+    # end if
+
+    dispositions_count, remainder = divmod(max(records_count - 2, 0), RECORDS_IN_EACH_RIBA)
+    if remainder:
+        add_issue(
+            None, None, ISSUE_SEQUENCE,
+            f'{records_count - 2} detail records are not a whole number of '
+            f'disposizioni of {RECORDS_IN_EACH_RIBA} records'
+        )
+    # end if
+
+    total_amount_cents = 0
+    first_record = last_record = b''
+    progressive = b''
+
+    # Records already checked with their disposizione
+    next_index = 0
+
+    for index in range(records_count):
+        if index < next_index:
+            continue
+        # end if
+
+        if len(issues) >= max_issues:
+            break
+        # end if
+
+        offset = index * RECORD_SIZE
+
+        # Fast path: check the whole disposizione at once, the records of
+        # the invalid ones are then checked one by one to find the errors
+        if index % RECORDS_IN_EACH_RIBA == 1 and index + RECORDS_IN_EACH_RIBA <= last:
+            match = _DISPOSITION_PATTERN.fullmatch(data, offset, offset + DISPOSITION_SIZE)
+            number = (index - 1) // RECORDS_IN_EACH_RIBA + 1
+            if (match is not None and int(match['progressive']) == number
+                    and int(match['progressive_51']) == number):
+                total_amount_cents += int(match['amount'])
+                next_index = index + RECORDS_IN_EACH_RIBA
+                continue
+            # end if
+        # end if
+        record = bytes(data[offset:offset + RECORD_SIZE])
+
+        # Expected record type
+        if index == 0:
+            expected_type = b'IB'
+            first_record = record
+        elif index == last:
+            expected_type = b'EF'
+            last_record = record
+        else:
+            position = (index - 1) % RECORDS_IN_EACH_RIBA
+            expected_type = _RECEIPT_RECORD_TYPES[position]
+            if position == 0:
+                progressive = b'%07d' % ((index - 1) // RECORDS_IN_EACH_RIBA + 1)
+            # end if
+        # end if
+
+        record_type = record[1:3]
+        if record_type != expected_type:
+            add_issue(
+                index, record_type, ISSUE_SEQUENCE,
+                f'expected record {expected_type.decode()}'
+            )
+            continue
+        # end if
+
+        layout, pattern = _RECORD_CHECKS[record_type]
+        if pattern.fullmatch(record) is None:
+            for problem in _diagnose_record(layout, record):
+                add_issue(index, record_type, ISSUE_FIELD, problem)
+            # end for
+            continue
+        # end if
+
+        if expected_type in (b'IB', b'EF'):
+            continue
+        # end if
+
+        if record[PROGRESSIVE_NUMBER_SLICE] != progressive:
+            add_issue(
+                index, record_type, ISSUE_PROGRESSIVE,
+                f'expected {progressive.decode()}, found {record[PROGRESSIVE_NUMBER_SLICE].decode()}'
+            )
+        # end if
+
+        if record_type == b'14':
+            total_amount_cents += int(record[AMOUNT_SLICE])
+        elif record_type == b'51' and int(record[R51_PROGRESSIVE_NUMBER_SLICE]) != int(progressive):
+            add_issue(
+                index, record_type, ISSUE_PROGRESSIVE,
+                f'expected {int(progressive)}, found {record[R51_PROGRESSIVE_NUMBER_SLICE].decode()}'
+            )
+        # end if
+    # end for
+
+    truncated = len(issues) >= max_issues
+
+    # EF totals
+    if not truncated and last_record[1:3] == b'EF' and _RECORD_CHECKS[b'EF'][1].fullmatch(last_record):
+        if first_record[IB_EF_COMMON_SLICE] != last_record[IB_EF_COMMON_SLICE]:
+            add_issue(last, b'EF', ISSUE_TOTALS, 'SIA code, ABI, date or name differ from the IB record')
+        # end if
+
+        for name, field_slice, expected in [
+            ('number of disposizioni', EF_DISPOSITIONS_SLICE, dispositions_count),
+            ('total amount', EF_AMOUNT_SLICE, total_amount_cents),
+            ('number of records', EF_RECORDS_SLICE, records_count),
+        ]:
+            found = int(last_record[field_slice])
+            if found != expected:
+                add_issue(last, b'EF', ISSUE_TOTALS, f'{name}: expected {expected}, found {found}')
+            # end if
+        # end for
+    # end if
+
+    differences = list()
+    if reference is not None:
+        differences = _compare_records(data, reference, records_count, max_issues)
+    # end if
+
+    return FlowValidationReport(
+        issues, differences, records_count, dispositions_count, total_amount_cents, truncated
+    )
+# end validate_flow
+
+
+def validate_flow_file(
+        path: typing.Union[str, os.PathLike],
+        reference_path: typing.Union[str, os.PathLike] = None,
+        max_issues: int = MAX_ISSUES
+) -> FlowValidationReport:
+    """
+    Check the structure of a CBI flow stored in a file. The file is
+    memory-mapped, so it's never loaded into memory as a whole
+
+    :param path: the path of the file
+    :type path: str or os.PathLike
+    :param reference_path: the path of a flow to compare the records with
+    :type reference_path: str or os.PathLike
+    :param max_issues: number of errors after which the validation stops
+    :type max_issues: int
+    :returns: the report listing the errors found
+    :rtype: class:`FlowValidationReport`
+    """
+    with contextlib.ExitStack() as stack:
+        data = stack.enter_context(_map_file(path))
+        reference = stack.enter_context(_map_file(reference_path)) if reference_path else None
+        return validate_flow(data, reference, max_issues)
+    # end with
+# end validate_flow_file
+
+
+@contextlib.contextmanager
+def _map_file(path):
+    with open(path, 'rb') as fp:
+        if os.fstat(fp.fileno()).st_size == 0:
+            # Empty files can't be mapped
+            yield b''
+        else:
+            with mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                yield data
+            # end with
+        # end if
+    # end with
+# end _map_file
+
+
+def _compare_records(data, reference, records_count: int, max_differences: int) -> typing.List[RecordDifference]:
+    """Compare the records of a flow with the ones of a reference flow"""
+
+    differences = list()
+    reference_count = len(reference) // RECORD_SIZE
+    common_count = min(records_count, reference_count)
+
+    # Records already compared with their chunk
+    next_index = 0
+
+    for index in range(max(records_count, reference_count)):
+        if index < next_index:
+            continue
+        # end if
+
+        if len(differences) >= max_differences:
+            break
+        # end if
+
+        # Fast path: compare many detail records at once
+        if 0 < index and index + COMPARE_CHUNK_RECORDS < common_count - 1:
+            start = index * RECORD_SIZE
+            end = start + COMPARE_CHUNK_RECORDS * RECORD_SIZE
+            if bytes(data[start:end]) == bytes(reference[start:end]):
+                next_index = index + COMPARE_CHUNK_RECORDS
+                continue
+            # end if
+        # end if
+
+        offset = index * RECORD_SIZE
+        found = bytes(data[offset:offset + RECORD_LENGTH]) if index < records_count else None
+        expected = bytes(reference[offset:offset + RECORD_LENGTH]) if index < reference_count else None
+
+        if found is not None and expected is not None:
+            if found[1:3] in (b'IB', b'EF'):
+                equal = (
+                    _blank_fields(found, REFERENCE_IGNORED_FIELDS)
+                    == _blank_fields(expected, REFERENCE_IGNORED_FIELDS)
+                )
+            else:
+                equal = found == expected
+            # end if
+            if equal:
+                continue
+            # end if
+        # end if
+
+        differences.append(RecordDifference(
+            index,
+            expected.decode('ascii', 'replace') if expected is not None else None,
+            found.decode('ascii', 'replace') if found is not None else None,
+        ))
+    # end for
+
+    return differences
+# end _compare_records
@@ -0,0 +1,166 @@
+"""Policies and engine used to group the receipts of a RiBa document.
+
+A grouping policy is a function returning the grouping key of a receipt:
+receipts having the same key are rendered as a single line of the CBI
+document. The engine computes the key of each receipt once and groups the
+receipts in linear time using a dictionary; groups are returned in the order
+their first receipt was found, receipts in each group keep their order.
+
+A group is rendered with the due date of its first receipt. Policies that
+may group receipts with different due dates declare how the engine handles
+them in their mixed_duedates attribute: MIXED_DUEDATES_RAISE refuses them,
+MIXED_DUEDATES_LOG merges them logging the due dates of each group.
+"""
+
+from datetime import datetime
+import logging
+import typing
+
+from .utils.errors import MixedDuedatesError
+from .utils.odoo_stuff import _
+
+
+# Handling of the groups with receipts of different due dates
+MIXED_DUEDATES_RAISE = 'raise'
+MIXED_DUEDATES_LOG = 'log'
+
+# Function returning the grouping key of a receipt
+GroupingPolicy = typing.Callable[[typing.Any], typing.Hashable]
+
+# Logging object initialization
+_logger = logging.getLogger(__name__)
+
+
+def by_debtor_bank_duedate(rcpt) -> typing.Hashable:
+    """Default policy: same debtor, same debtor's bank (ABI and CAB) and
+    same due date"""
+    return rcpt.grouping_key
+# end by_debtor_bank_duedate
+
+
+def by_debtor_bank(rcpt) -> typing.Hashable:
+    """Same debtor and same debtor's bank (ABI and CAB). The receipts of a
+    group must have the same due date: grouping receipts with different due
+    dates raises MixedDuedatesError, see :func:`by_debtor_bank_any_duedate`
+    to merge them."""
+    return rcpt.debtor_partner_id, rcpt.debtor_bank_abi, rcpt.debtor_bank_cab
+# end by_debtor_bank
+
+
+by_debtor_bank.mixed_duedates = MIXED_DUEDATES_RAISE
+
+
+def by_debtor_bank_any_duedate(rcpt) -> typing.Hashable:
+    """Same debtor and same debtor's bank (ABI and CAB), regardless of the
+    due date. The due date of the group is the one of its first receipt:
+    the due dates merged by each group are logged."""
+    return rcpt.debtor_partner_id, rcpt.debtor_bank_abi, rcpt.debtor_bank_cab
+# end by_debtor_bank_any_duedate
+
+
+by_debtor_bank_any_duedate.mixed_duedates = MIXED_DUEDATES_LOG
+
+
+def by_duedate_window(days: int) -> GroupingPolicy:
+    """
+    Build a policy grouping the receipts of the same debtor and debtor's
+    bank whose due dates fall in the same window of days. Windows are
+    aligned to fixed dates, so the result doesn't depend on the order of
+    the receipts.
+
+    Like :func:`by_debtor_bank_any_duedate` this is an explicit opt-in to
+    merge different due dates: the due date of the group is the one of its
+    first receipt, so the debtor may be charged before the other receipts
+    are due. The due dates merged by each group are logged.
+
+    :param days: width of the windows in days
+    :type days: int
+    :returns: the grouping policy
+    """
+
+    if days < 1:
+        raise ValueError('The window must be at least one day wide')
+    # end if
+
+    def policy(rcpt) -> typing.Hashable:
+        return (
+            rcpt.debtor_partner_id,
+            rcpt.debtor_bank_abi,
+            rcpt.debtor_bank_cab,
+            _duedate(rcpt).toordinal() // days,
+        )
+    # end policy
+
+    # The same name for the same width: the flows grouped by different
+    # policy objects of the same width share the caches of the rendering
+    policy.__name__ = policy.__qualname__ = f'{by_duedate_window.__name__}({days})'
+    policy.mixed_duedates = MIXED_DUEDATES_LOG
+
+    return policy
+# end by_duedate_window
+
+
+def group(
+    receipts: typing.Iterable, policy: GroupingPolicy = by_debtor_bank_duedate
+) -> typing.List[typing.List]:
+    """
+    Group the receipts according to a policy
+
+    :param receipts: the receipts to be grouped
+    :param policy: the function computing the grouping key of a receipt
+    :returns: the groups, as lists of receipts, in order of first appearance
+    :rtype: List of List
+    """
+
+    groups = dict()
+
+    for rcpt in receipts:
+        key = policy(rcpt)
+        try:
+            groups[key].append(rcpt)
+        except KeyError:
+            groups[key] = [rcpt]
+        # end try / except
+    # end for
+
+    mixed_duedates = getattr(policy, 'mixed_duedates', None)
+    if mixed_duedates is not None:
+        _check_duedates(groups.values(), mixed_duedates)
+    # end if
+
+    # Dictionaries keep the insertion order
+    return list(groups.values())
+# end group
+
+
+def _check_duedates(groups: typing.Iterable[typing.List], mixed_duedates: str) -> None:
+    """Refuse or log the groups with receipts of different due dates"""
+
+    for receipts in groups:
+        duedates = {_duedate(rcpt) for rcpt in receipts} if len(receipts) > 1 else ()
+        if len(duedates) < 2:
+            continue
+        # end if
+
+        first = receipts[0]
+        listed = ', '.join(map(str, sorted(duedates)))
+        if mixed_duedates == MIXED_DUEDATES_RAISE:
+            raise MixedDuedatesError(
+                _('Receipts with different due dates in the same group: ') + f'{first.debtor_name} ({listed})'
+            )
+        # end if
+
+        _logger.info(
+            'Receipts of %s with due dates %s grouped as due on %s', first.debtor_name, listed, _duedate(first)
+        )
+    # end for
+# end _check_duedates
+
+
+def _duedate(rcpt):
+    duedate = rcpt.duedate
+    if isinstance(duedate, datetime):
+        duedate = duedate.date()
+    # end if
+    return duedate
+# end _duedate
@@ -0,0 +1,427 @@
+"""Reader of CBI RiBa flows.
+
+The flows are read from memory-mapped files, one fixed-width record at a
+time, so even very large archives are scanned without loading them into
+memory. The records are typed using the same layouts used to write them
+(:data:`ribalta.records.cbi.LAYOUTS`): each record type has its own class
+exposing the fields of the layout as properties, decoded only when they're
+accessed.
+
+    with CBIReader('riba.cbi') as reader:
+        for record in reader:
+            if record.record_type == '14':
+                print(record.num_progr, record.duedate, record.amount_cents)
+            # end if
+        # end for
+    # end with
+
+The record terminator is detected from the data: records can be terminated
+by CR LF (as written by ribalta), by a single CR or LF, or not at all.
+"""
+
+from datetime import datetime
+import functools
+import mmap
+import os
+import typing
+
+from .records.cbi import LAYOUTS, RECORD_LENGTH, t_date
+from .records.layout import Field
+from .utils.errors import CBIFormatError
+
+
+# Fields decoded as integers, the other fields are decoded as stripped strings
+INTEGER_FIELDS = frozenset((
+    'num_progr',
+    'amount_cents',
+    'num_disposizioni',
+    'total_amount_cents',
+    'num_records',
+))
+
+# Format of the fields written by t_date()
+DATE_FORMAT = '%d%m%y'
+
+# Number of distinct dates kept by the cache of the decoded dates: the flows
+# contain few distinct due dates, repeated in many records
+DATES_CACHE_SIZE = 1024
+
+# Position of the progressive number in the records of each disposizione
+PROGRESSIVE_NUMBER_SLICE = slice(3, 10)
+
+# Record types delimiting each disposizione
+FIRST_RECORD_OF_RIBA = '14'
+LAST_RECORD_OF_RIBA = '70'
+
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+# Records
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+class CBIRecord:
+    """
+    A record of a CBI flow. The fields are decoded from the raw data only
+    when they're read: records of the known types are instances of a subclass
+    of this class with a property for each field of the layout, fields can
+    also be read by name with :meth:`get` or ``record[name]``.
+
+    :param raw: the record data, without terminator
+    :type raw: bytes
+    """
+
+    __slots__ = ('_raw',)
+
+    # Layout of the record, None for unknown record types
+    layout = None
+
+    # Field name -> function decoding the value of the field from the record
+    _decoders = dict()
+
+    def __init__(self, raw: bytes):
+        self._raw = raw
+    # end __init__
+
+    @property
+    def record_type(self) -> str:
+        """The type of the record: 'IB', '14', ..., '70', 'EF'"""
+        return self._raw[1:3].decode('ascii', 'replace')
+    # end record_type
+
+    @property
+    def raw(self) -> bytes:
+        return self._raw
+    # end raw
+
+    @property
+    def text(self) -> str:
+        return self._raw.decode('ascii', 'replace')
+    # end text
+
+    @property
+    def field_names(self) -> typing.Tuple[str, ...]:
+        return tuple(self._decoders)
+    # end field_names
+
+    def get(self, name: str, default=None):
+        """Return the value of a field, default if the record has no such field"""
+        decoder = self._decoders.get(name)
+        if decoder is None:
+            return default
+        # end if
+        return decoder(self._raw)
+    # end get
+
+    def as_dict(self) -> typing.Dict[str, typing.Any]:
+        """Decode all the fields of the record"""
+        return {name: decoder(self._raw) for name, decoder in self._decoders.items()}
+    # end as_dict
+
+    def __getitem__(self, name: str):
+        try:
+            decoder = self._decoders[name]
+        except KeyError:
+            raise KeyError(f'Record {self.record_type} has no field "{name}"') from None
+        # end try / except
+        return decoder(self._raw)
+    # end __getitem__
+
+    def __eq__(self, other):
+        if not isinstance(other, CBIRecord):
+            return NotImplemented
+        # end if
+        return self._raw == other._raw
+    # end __eq__
+
+    def __hash__(self):
+        return hash(self._raw)
+    # end __hash__
+
+    def __repr__(self):
+        return f'{type(self).__name__}({self.text!r})'
+    # end __repr__
+# end CBIRecord
+
+
+def _build_field_decoder(field: Field) -> typing.Callable[[bytes], typing.Any]:
+    """Build the function decoding a field from the raw record"""
+
+    field_slice = slice(field.start - 1, field.end)
+
+    if field.name in INTEGER_FIELDS:
+        def decoder(raw):
+            text = raw[field_slice].strip()
+            return int(text) if text.isdigit() else None
+        # end decoder
+
+    elif field.transform is t_date:
+        def decoder(raw):
+            return _decode_date(raw[field_slice])
+        # end decoder
+
+    else:
+        def decoder(raw):
+            return raw[field_slice].decode('ascii', 'replace').strip()
+        # end decoder
+    # end if
+
+    return decoder
+# end _build_field_decoder
+
+
+@functools.lru_cache(maxsize=DATES_CACHE_SIZE)
+def _decode_date(data: bytes):
+    text = data.decode('ascii', 'replace').strip()
+    if not text:
+        return None
+    # end if
+    try:
+        return datetime.strptime(text, DATE_FORMAT).date()
+    except ValueError:
+        raise CBIFormatError(f'Invalid date {text!r}, expected DDMMYY') from None
+    # end try
+# end _decode_date
+
+
+def _build_record_class(layout) -> typing.Type[CBIRecord]:
+    """Build the class of the records of a layout"""
+
+    decoders = dict()
+    for field in layout.fields:
+        # Some fields are repeated (e.g. num_progr in record 51), the first
+        # occurrence is used
+        if not field.is_constant and field.name not in decoders:
+            decoders[field.name] = _build_field_decoder(field)
+        # end if
+    # end for
+
+    namespace = {
+        '__slots__': (),
+        '__doc__': f'Record {layout.record_type} of a CBI flow',
+        'layout': layout,
+        '_decoders': decoders,
+    }
+    for name, decoder in decoders.items():
+        namespace[name] = property(
+            lambda self, decoder=decoder: decoder(self._raw),
+            doc=f'Field "{name}" of the record',
+        )
+    # end for
+
+    return type(f'Record{layout.record_type}', (CBIRecord,), namespace)
+# end _build_record_class
+
+
+# Record type -> class of the records of that type
+RECORD_CLASSES = {
+    record_type: _build_record_class(layout)
+    for record_type, layout in LAYOUTS.items()
+}
+
+
+def make_record(raw: bytes) -> CBIRecord:
+    """
+    Build the typed record object for the raw data of a record
+
+    :param raw: the record data, without terminator
+    :type raw: bytes
+    :returns: the record, a plain class:`CBIRecord` for unknown record types
+    :rtype: class:`CBIRecord`
+    """
+    record_class = RECORD_CLASSES.get(raw[1:3].decode('ascii', 'replace'), CBIRecord)
+    return record_class(raw)
+# end make_record
+
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+# Flows
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+def detect_stride(data) -> int:
+    """
+    Return the distance between the beginning of two consecutive records:
+    the record length plus the length of the terminator
+
+    :param data: the flow data, or at least its beginning
+    :type data: bytes-like
+    :rtype: int
+    """
+    terminator = data[RECORD_LENGTH:RECORD_LENGTH + 2]
+    if terminator == b'\r\n':
+        return RECORD_LENGTH + 2
+    elif terminator[:1] in (b'\r', b'\n'):
+        return RECORD_LENGTH + 1
+    else:
+        return RECORD_LENGTH
+    # end if
+# end detect_stride
+
+
+class CBIReader:
+    """
+    Reader of a CBI flow stored in a file. The file is memory-mapped and the
+    records are read one at a time while iterating, they can also be read by
+    position with ``reader[index]``.
+
+    :param path: the path of the file
+    :type path: str or os.PathLike
+    """
+
+    def __init__(self, path: typing.Union[str, os.PathLike]):
+        self._file = open(path, 'rb')
+
+        try:
+            size = os.fstat(self._file.fileno()).st_size
+
+            # Empty files can't be mapped
+            if size:
+                data = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+                if hasattr(mmap, 'MADV_SEQUENTIAL'):
+                    data.madvise(mmap.MADV_SEQUENTIAL)
+                # end if
+            else:
+                data = b''
+            # end if
+
+            self._setup(data)
+
+        except Exception:
+            self.close()
+            raise
+        # end try / except
+    # end __init__
+
+    @classmethod
+    def from_bytes(cls, data: typing.Union[bytes, str]) -> 'CBIReader':
+        """
+        Build a reader of a flow already in memory, e.g. the result of
+        :meth:`ribalta.riba.Document.render_cbi`
+
+        :param data: the flow
+        :type data: bytes or str
+        :rtype: class:`CBIReader`
+        """
+        reader = cls.__new__(cls)
+        reader._file = None
+        reader._setup(data.encode('ascii') if isinstance(data, str) else data)
+        return reader
+    # end from_bytes
+
+    def _setup(self, data):
+        self._data = data
+        self._stride = detect_stride(data)
+
+        # The terminator of the last record may be missing
+        size = len(data)
+        padding = self._stride - RECORD_LENGTH
+        if size % self._stride == 0:
+            self._count = size // self._stride
+        elif (size + padding) % self._stride == 0:
+            self._count = (size + padding) // self._stride
+        else:
+            raise CBIFormatError(
+                f'Invalid CBI flow: {size} bytes are not a whole number of '
+                f'records of {self._stride} bytes'
+            )
+        # end if
+    # end _setup
+
+    @property
+    def stride(self) -> int:
+        """Length of the records including their terminator"""
+        return self._stride
+    # end stride
+
+    def __len__(self):
+        return self._count
+    # end __len__
+
+    def __getitem__(self, index: int) -> CBIRecord:
+        if index < 0:
+            index += self._count
+        # end if
+        if not 0 <= index < self._count:
+            raise IndexError('CBI record index out of range')
+        # end if
+
+        offset = index * self._stride
+        return make_record(self._data[offset:offset + RECORD_LENGTH])
+    # end __getitem__
+
+    def __iter__(self) -> typing.Iterator[CBIRecord]:
+        data = self._data
+        for offset in range(0, self._count * self._stride, self._stride):
+            yield make_record(data[offset:offset + RECORD_LENGTH])
+        # end for
+    # end __iter__
+
+    def close(self) -> None:
+        if isinstance(self._data, mmap.mmap):
+            self._data.close()
+        # end if
+        if self._file is not None:
+            self._file.close()
+        # end if
+    # end close
+
+    def __enter__(self):
+        return self
+    # end __enter__
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+    # end __exit__
+# end CBIReader
+
+
+def iter_records(path: typing.Union[str, os.PathLike]) -> typing.Iterator[CBIRecord]:
+    """
+    Read the records of a CBI flow stored in a file, closing the file when
+    all the records have been read
+
+    :param path: the path of the file
+    :type path: str or os.PathLike
+    :rtype: iterator of class:`CBIRecord`
+    """
+    with CBIReader(path) as reader:
+        yield from reader
+    # end with
+# end iter_records
+
+
+def iter_dispositions(
+        records: typing.Iterable[CBIRecord]
+) -> typing.Iterator[typing.Tuple[CBIRecord, ...]]:
+    """
+    Collect the records of each disposizione, from record 14 to record 70.
+    The other records (IB, EF) are skipped.
+
+    :param records: the records of a flow
+    :type records: iterable of class:`CBIRecord`
+    :returns: the records of each disposizione, in the order they're found
+    :rtype: iterator of tuples of class:`CBIRecord`
+    """
+    current = None
+    for record in records:
+        record_type = record.record_type
+
+        if record_type == FIRST_RECORD_OF_RIBA:
+            if current:
+                raise CBIFormatError(
+                    f'Record {LAST_RECORD_OF_RIBA} missing before record {record.text!r}'
+                )
+            # end if
+            current = [record]
+
+        elif current is not None:
+            current.append(record)
+            if record_type == LAST_RECORD_OF_RIBA:
+                yield tuple(current)
+                current = None
+            # end if
+        # end if
+    # end for
+
+    if current:
+        raise CBIFormatError('Flow ended before the last record of a disposizione')
+    # end if
+# end iter_dispositions
@@ -0,0 +1,296 @@
+"""Creditor and receipts read from plain data instead of Odoo objects.
+
+The creditor is a JSON object with the fields of
+class:`ribalta.riba.FrozenCreditor`, the receipts are JSON Lines (one object
+for each line) or CSV rows with the fields of
+class:`ribalta.riba.FrozenReceipt`:
+
+    {"debtor_name": "Kissa Komics S.R.L.", "debtor_fiscalcode": "04483400281",
+     "debtor_bank_iban": "IT52X0501812101123450054321",
+     "duedate": "2020-12-28", "amount": "36.60", ...}
+
+Dates are written as YYYY-MM-DD, amounts in Euro (or in cents using the
+amount_cents field). The ABI and CAB of the debtor bank can be given
+directly or extracted from the debtor_bank_iban field. Missing optional
+fields are left empty. The receipts are read one at a time, so files of any
+size can be processed.
+"""
+
+import csv
+from datetime import date, datetime
+from decimal import Decimal, InvalidOperation
+import json
+import os
+import re
+import typing
+
+from .riba import FrozenCreditor, FrozenReceipt
+from .utils.errors import InvalidRecordError
+from .utils.money import from_cents
+
+
+# Formats of the receipts files
+FORMAT_JSONL = 'jsonl'
+FORMAT_CSV = 'csv'
+FORMATS = (FORMAT_JSONL, FORMAT_CSV)
+
+# File extensions -> format
+FORMAT_EXTENSIONS = {
+    '.jsonl': FORMAT_JSONL,
+    '.ndjson': FORMAT_JSONL,
+    '.json': FORMAT_JSONL,
+    '.csv': FORMAT_CSV,
+}
+
+# Receipt fields left empty when missing
+RECEIPT_OPTIONAL_FIELDS = (
+    'debtor_client_code',
+    'debtor_fiscalcode',
+    'debtor_address',
+    'debtor_city',
+    'debtor_state',
+    'debtor_zip',
+    'debtor_bank_name',
+    'invoice_number',
+    'communication',
+)
+
+# Creditor fields left empty when missing
+CREDITOR_OPTIONAL_FIELDS = (
+    'creditor_fiscalcode',
+    'creditor_company_ref',
+    'creditor_company_addr_street',
+    'creditor_company_addr_zip',
+    'creditor_company_addr_city',
+    'creditor_company_addr_state',
+    'creditor_bank_name',
+)
+
+
+def detect_format(path: str) -> str:
+    """
+    Format of a receipts file, from its extension
+
+    :param path: path of the file
+    :type path: str
+    :returns: FORMAT_JSONL or FORMAT_CSV
+    :rtype: str
+    """
+    extension = os.path.splitext(str(path))[1].lower()
+    try:
+        return FORMAT_EXTENSIONS[extension]
+    except KeyError:
+        raise ValueError(
+            f'Unknown format of "{path}", valid extensions are: '
+            f'{", ".join(FORMAT_EXTENSIONS)}'
+        )
+    # end try / except
+# end detect_format
+
+
+def creditor_from_record(record: typing.Mapping[str, typing.Any]) -> FrozenCreditor:
+    """
+    Build the creditor snapshot from plain data
+
+    :param record: the creditor fields
+    :returns: the creditor snapshot
+    :rtype: class:`ribalta.riba.FrozenCreditor`
+    :raises InvalidRecordError: if a required field is missing
+    """
+    fields = {name: record.get(name) or '' for name in CREDITOR_OPTIONAL_FIELDS}
+    fields.update(
+        creditor_company_name=_required(record, 'creditor_company_name'),
+        creditor_vat_number=record.get('creditor_vat_number') or False,
+        creditor_bank_iban=_normalize_iban(_required(record, 'creditor_bank_iban')),
+        sia_code=str(_required(record, 'sia_code')).strip(),
+    )
+    return FrozenCreditor(**fields)
+# end creditor_from_record
+
+
+def receipt_from_record(record: typing.Mapping[str, typing.Any]) -> FrozenReceipt:
+    """
+    Build a receipt snapshot from plain data. The data is converted, not
+    validated: see :func:`ribalta.utils.validators.check_receipt`.
+
+    :param record: the receipt fields
+    :returns: the receipt snapshot
+    :rtype: class:`ribalta.riba.FrozenReceipt`
+    :raises InvalidRecordError: if a required field is missing or a value
+     can't be converted
+    """
+
+    fields = {name: record.get(name) or '' for name in RECEIPT_OPTIONAL_FIELDS}
+
+    # Same rules of class:`ribalta.riba.Receipt`
+    vat_number = record.get('debtor_vat_number') or False
+    fields['debtor_vat_number'] = vat_number
+    fields['debtor_fiscode_or_vat'] = (
+        re.sub('^IT', '', vat_number or '') or fields['debtor_fiscalcode']
+    )
+
+    fields['debtor_name'] = _required(record, 'debtor_name')
+
+    # Partner used to group the receipts, defaults to the fiscal code
+    fields['debtor_partner_id'] = (
+        record.get('debtor_partner_id') or fields['debtor_fiscode_or_vat'] or fields['debtor_name']
+    )
+
+    iban = _normalize_iban(record.get('debtor_bank_iban') or '')
+    fields['debtor_bank_abi'] = str(record.get('debtor_bank_abi') or iban[5:10])
+    fields['debtor_bank_cab'] = str(record.get('debtor_bank_cab') or iban[10:15])
+
+    fields['duedate'] = _parse_date(_required(record, 'duedate'), 'duedate')
+    invoice_date = record.get('invoice_date')
+    fields['invoice_date'] = _parse_date(invoice_date, 'invoice_date') if invoice_date else False
+
+    if record.get('amount_cents') not in (None, ''):
+        fields['amount'] = from_cents(_parse_int(record['amount_cents'], 'amount_cents'))
+    else:
+        fields['amount'] = _parse_amount(_required(record, 'amount'))
+    # end if
+
+    move_line_id = record.get('move_line_id')
+    fields['move_line_id'] = _parse_int(move_line_id, 'move_line_id') if move_line_id else None
+
+    return FrozenReceipt(**fields)
+# end receipt_from_record
+
+
+def load_creditor(path: str) -> FrozenCreditor:
+    """
+    Read the creditor from a JSON file
+
+    :param path: path of the file
+    :type path: str
+    :returns: the creditor snapshot
+    :rtype: class:`ribalta.riba.FrozenCreditor`
+    """
+    with open(path, encoding='utf-8') as fp:
+        try:
+            record = json.load(fp)
+        except ValueError as e:
+            raise InvalidRecordError(f'{path}: {e}')
+        # end try / except
+    # end with
+    return creditor_from_record(record)
+# end load_creditor
+
+
+def iter_plain_records(
+        fp: typing.TextIO, data_format: str
+) -> typing.Iterator[typing.Tuple[int, typing.Dict[str, typing.Any]]]:
+    """
+    Read the records of a JSON Lines or CSV file one at a time
+
+    :param fp: the file, opened in text mode (with newline='' for CSV)
+    :param data_format: FORMAT_JSONL or FORMAT_CSV
+    :type data_format: str
+    :returns: iterator over the line number of each record and the record
+    """
+
+    if data_format == FORMAT_JSONL:
+        for line_number, line in enumerate(fp, 1):
+            if not line.strip():
+                continue
+            # end if
+            try:
+                record = json.loads(line)
+            except ValueError as e:
+                raise InvalidRecordError(f'Line {line_number}: {e}')
+            # end try / except
+            if not isinstance(record, dict):
+                raise InvalidRecordError(f'Line {line_number}: a JSON object is required')
+            # end if
+            yield line_number, record
+        # end for
+
+    elif data_format == FORMAT_CSV:
+        reader = csv.DictReader(fp)
+        for record in reader:
+            yield reader.line_num, record
+        # end for
+
+    else:
+        raise ValueError(
+            f'Invalid format "{data_format}", valid formats are: {", ".join(FORMATS)}'
+        )
+    # end if
+# end iter_plain_records
+
+
+def iter_receipts(fp: typing.TextIO, data_format: str) -> typing.Iterator[FrozenReceipt]:
+    """
+    Read the receipts of a JSON Lines or CSV file one at a time
+
+    :param fp: the file, opened in text mode (with newline='' for CSV)
+    :param data_format: FORMAT_JSONL or FORMAT_CSV
+    :type data_format: str
+    :returns: iterator over the receipts
+    :raises InvalidRecordError: on the first record that can't be read,
+     the message contains its line number
+    """
+    for line_number, record in iter_plain_records(fp, data_format):
+        try:
+            yield receipt_from_record(record)
+        except InvalidRecordError as e:
+            raise InvalidRecordError(f'Line {line_number}: {e}')
+        # end try / except
+    # end for
+# end iter_receipts
+
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+# Conversion of the values
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+def _required(record: typing.Mapping[str, typing.Any], name: str):
+    value = record.get(name)
+    if value in (None, ''):
+        raise InvalidRecordError(f'Missing field "{name}"')
+    # end if
+    return value
+# end _required
+
+
+def _normalize_iban(iban: str) -> str:
+    return str(iban).replace(' ', '').upper()
+# end _normalize_iban
+
+
+def _parse_date(value, name: str) -> date:
+    if isinstance(value, date):
+        return value.date() if isinstance(value, datetime) else value
+    # end if
+    try:
+        return datetime.strptime(str(value).strip(), '%Y-%m-%d').date()
+    except ValueError:
+        raise InvalidRecordError(f'Invalid date "{value}" for "{name}", the format is YYYY-MM-DD')
+    # end try / except
+# end _parse_date
+
+
+def _parse_amount(value) -> Decimal:
+    try:
+        # Floats from JSON are converted using their shortest representation
+        amount = Decimal(str(value).strip())
+    except InvalidOperation:
+        raise InvalidRecordError(f'Invalid amount "{value}"')
+    # end try / except
+
+    # NaN and Infinity are valid decimals, not amounts
+    if not amount.is_finite():
+        raise InvalidRecordError(f'Invalid amount "{value}"')
+    # end if
+
+    return amount
+# end _parse_amount
+
+
+def _parse_int(value, name: str) -> int:
+    try:
+        return int(value)
+    except (TypeError, ValueError, OverflowError):
+        raise InvalidRecordError(f'Invalid integer "{value}" for "{name}"')
+    # end try / except
+# end _parse_int
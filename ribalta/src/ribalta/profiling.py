@@ -0,0 +1,333 @@
+"""Per-phase profiling of the generation of the CBI documents.
+
+A class:`RenderProfiler` passed to the functions building and rendering the
+documents records the duration, the number of processed items and,
+optionally, the peak of the memory allocated by each phase:
+
+    profiler = RenderProfiler(trace_memory=True)
+
+    receipts = Receipt.from_payment_lines(payment_lines, profiler=profiler)
+    ...
+    cbi_str = riba_doc.render_cbi(group=True, profiler=profiler)
+
+    _logger.info('RiBa rendering profile: %s', profiler.report().as_json())
+
+The phases recorded by ribalta are listed in the PHASE_* constants. Without a
+profiler the phases are not measured at all.
+
+Phases can be nested: the peak of a phase includes the peaks of the phases
+nested in it, the total duration of the report sums the outermost phases
+only. Before Python 3.9 tracemalloc can't reset the peak: the
+profiler restarts the tracing it started itself, if the tracing was started
+by someone else the peaks of the phases are measured since then (an upper
+bound).
+"""
+
+import contextlib
+import time
+import typing
+
+# Phases recorded by ribalta, defined in utils so that the validators can
+# record them too
+from .utils.phases import (  # noqa: F401
+    PHASE_PREFETCH, PHASE_RECEIPTS, PHASE_SNAPSHOTS, PHASE_VALIDATION,
+    PHASE_GROUPING, PHASE_RENDERING, PHASE_WRITING,
+)
+
+
+class PhaseStats(typing.NamedTuple):
+    """Measures of a phase"""
+
+    name: str
+    # Duration in seconds
+    duration: float
+    # Number of items processed by the phase (receipts, records...), None
+    # if not known
+    items: typing.Optional[int] = None
+    # Peak of the memory allocated during the phase in bytes, None if the
+    # memory is not traced
+    peak_memory: typing.Optional[int] = None
+    # Number of the phases the phase is nested in, 0 for the outermost ones
+    depth: int = 0
+
+    @property
+    def items_per_second(self) -> typing.Optional[float]:
+        if self.items is None or self.duration <= 0:
+            return None
+        # end if
+        return self.items / self.duration
+    # end items_per_second
+
+    def as_dict(self) -> typing.Dict[str, typing.Any]:
+        return dict(self._asdict(), items_per_second=self.items_per_second)
+    # end as_dict
+
+    def __str__(self):
+        text = f'{self.name}: {self.duration * 1000:.1f} ms'
+        if self.items is not None:
+            text += f', {self.items} items'
+        # end if
+        if self.peak_memory is not None:
+            text += f', peak {self.peak_memory / 1024:.1f} KiB'
+        # end if
+        return text
+    # end __str__
+# end PhaseStats
+
+
+class ProfileReport:
+    """
+    Measures of all the phases recorded by a profiler
+
+    :param phases: the phases, in the order they ended
+    :type phases: List of class:`PhaseStats`
+    """
+
+    def __init__(self, phases: typing.List[PhaseStats]):
+        self._phases = phases
+    # end __init__
+
+    @property
+    def phases(self) -> typing.List[PhaseStats]:
+        return self._phases
+    # end phases
+
+    @property
+    def total_duration(self) -> float:
+        """Duration of the outermost phases: the nested ones are part of them"""
+        return sum(phase.duration for phase in self._phases if phase.depth == 0)
+    # end total_duration
+
+    def by_name(self) -> typing.Dict[str, PhaseStats]:
+        """The phases by name, the phases recorded many times are summed"""
+        result = dict()
+        for phase in self._phases:
+            previous = result.get(phase.name)
+            if previous is not None:
+                phase = PhaseStats(
+                    phase.name,
+                    previous.duration + phase.duration,
+                    _sum_optional(previous.items, phase.items),
+                    _max_optional(previous.peak_memory, phase.peak_memory),
+                    min(previous.depth, phase.depth),
+                )
+            # end if
+            result[phase.name] = phase
+        # end for
+        return result
+    # end by_name
+
+    def as_dict(self) -> typing.Dict[str, typing.Any]:
+        """The report as plain data (e.g. to be serialized)"""
+        return {
+            'total_duration': self.total_duration,
+            'phases': [phase.as_dict() for phase in self._phases],
+        }
+    # end as_dict
+
+    def as_json(self) -> str:
+        """The report as a single line of JSON, suitable for the logs"""
+        import json
+        return json.dumps(self.as_dict(), separators=(',', ':'))
+    # end as_json
+
+    def __str__(self):
+        lines = [f'total: {self.total_duration * 1000:.1f} ms']
+        lines.extend(str(phase) for phase in self._phases)
+        return '\n'.join(lines)
+    # end __str__
+# end ProfileReport
+
+
+class RenderProfiler:
+    """
+    Collect the measures of the phases of the generation of the documents
+
+    :param trace_memory: measure the peak of the memory allocated by each
+     phase using tracemalloc (slows down the measured code)
+    :type trace_memory: bool
+    :param callback: function called with the class:`PhaseStats` of each
+     phase as soon as the phase ends
+    :type callback: callable
+    """
+
+    def __init__(
+            self, trace_memory: bool = False,
+            callback: typing.Callable[[PhaseStats], None] = None
+    ):
+        self._trace_memory = trace_memory
+        self._callback = callback
+        self._phases = list()
+
+        # Number of the open phases
+        self._depth = 0
+
+        # Memory measures of the open phases, the innermost last
+        self._memory_phases = list()
+        # The profiler started the tracing of the memory
+        self._owns_tracing = False
+        # Memory traced before the tracing was restarted (Python < 3.9)
+        self._memory_offset = 0
+    # end __init__
+
+    @contextlib.contextmanager
+    def phase(self, name: str, items: int = None):
+        """
+        Measure the code executed in the with block. The number of items can
+        be passed when the phase starts or set on the yielded
+        class:`PhaseCounter` while the phase runs.
+
+        :param name: name of the phase
+        :type name: str
+        :param items: number of items processed by the phase
+        :type items: int
+        """
+        counter = PhaseCounter(items)
+
+        memory_phase = self._start_memory_phase() if self._trace_memory else None
+
+        depth = self._depth
+        self._depth += 1
+
+        start = time.perf_counter()
+        try:
+            yield counter
+        finally:
+            duration = time.perf_counter() - start
+            self._depth = depth
+
+            peak_memory = None
+            if memory_phase is not None:
+                peak_memory = self._end_memory_phase(memory_phase)
+            # end if
+
+            self.record(PhaseStats(name, duration, counter.items, peak_memory, depth))
+        # end try / finally
+    # end phase
+
+    def _start_memory_phase(self) -> '_MemoryPhase':
+        # Imported here: tracemalloc pulls in pickle and friends, which are
+        # not needed when the memory is not traced
+        import tracemalloc
+
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._owns_tracing = True
+            self._memory_offset = 0
+        # end if
+
+        current, peak = tracemalloc.get_traced_memory()
+
+        # The peak is going to be reset: keep it in the enclosing phases
+        for memory_phase in self._memory_phases:
+            memory_phase.peak = max(memory_phase.peak, self._memory_offset + peak)
+        # end for
+
+        if hasattr(tracemalloc, 'reset_peak'):
+            tracemalloc.reset_peak()
+        elif self._owns_tracing:
+            # Python < 3.9: restarting the tracing resets the peak
+            tracemalloc.stop()
+            tracemalloc.start()
+            self._memory_offset += current
+            current = 0
+        # end if
+
+        memory_phase = _MemoryPhase(self._memory_offset + current)
+        self._memory_phases.append(memory_phase)
+        return memory_phase
+    # end _start_memory_phase
+
+    def _end_memory_phase(self, memory_phase: '_MemoryPhase') -> int:
+        """End the measure of the memory of the innermost open phase
+
+        :returns: the peak of the memory allocated during the phase
+        """
+        import tracemalloc
+
+        peak = max(memory_phase.peak, self._memory_offset + tracemalloc.get_traced_memory()[1])
+        self._memory_phases.pop()
+
+        # The enclosing phases include the peak of the nested one
+        for enclosing in self._memory_phases:
+            enclosing.peak = max(enclosing.peak, peak)
+        # end for
+
+        if not self._memory_phases and self._owns_tracing:
+            tracemalloc.stop()
+            self._owns_tracing = False
+            self._memory_offset = 0
+        # end if
+
+        return max(peak - memory_phase.start, 0)
+    # end _end_memory_phase
+
+    def record(self, stats: PhaseStats) -> None:
+        """Add the measures of a phase"""
+        self._phases.append(stats)
+        if self._callback is not None:
+            self._callback(stats)
+        # end if
+    # end record
+
+    def report(self) -> ProfileReport:
+        """The measures of the phases recorded so far"""
+        return ProfileReport(list(self._phases))
+    # end report
+
+    def reset(self) -> None:
+        """Forget the phases recorded so far"""
+        self._phases.clear()
+    # end reset
+# end RenderProfiler
+
+
+class PhaseCounter:
+    """Number of items processed by a phase, it can be updated while the
+    phase runs"""
+
+    __slots__ = ('items',)
+
+    def __init__(self, items: int = None):
+        self.items = items
+    # end __init__
+# end PhaseCounter
+
+
+class _MemoryPhase:
+    """Memory traced by an open phase, in bytes"""
+
+    __slots__ = ('start', 'peak')
+
+    def __init__(self, start: int):
+        self.start = start
+        self.peak = start
+    # end __init__
+# end _MemoryPhase
+
+
+class NullProfiler:
+    """Profiler measuring nothing, used when no profiler is given"""
+
+    @contextlib.contextmanager
+    def phase(self, name: str, items: int = None):
+        yield PhaseCounter(items)
+    # end phase
+
+    def record(self, stats: PhaseStats) -> None:
+        pass
+    # end record
+# end NullProfiler
+
+
+NULL_PROFILER = NullProfiler()
+
+
+def _sum_optional(a, b):
+    return b if a is None else a if b is None else a + b
+# end _sum_optional
+
+
+def _max_optional(a, b):
+    return b if a is None else a if b is None else max(a, b)
+# end _max_optional
@@ -0,0 +1,306 @@
+"""Reconciliation of the flows returned by the banks with the issued receipts.
+
+The issued disposizioni are indexed by the same data ribalta writes in the
+records 14 and 30: progressive number, debtor fiscal code or VAT number,
+amount in cents and due date. The returned flow is then scanned once, looking
+up each disposizione in the index.
+
+The progressive numbers of a returned flow may differ from the issued ones,
+so the disposizioni not found with the progressive number, or found only
+among the issued disposizioni already matched, are looked up again ignoring
+it. A disposizione returned twice is reported as repeated.
+
+    index = ReconciliationIndex.from_document(riba_doc)
+    result = index.reconcile(iter_records('returned.cbi'))
+
+    for match in result.matched:
+        ...  # match.issued is the class:`Receipt` (or group) issued
+    # end for
+"""
+
+from datetime import datetime
+import typing
+
+from .parser import FIRST_RECORD_OF_RIBA, PROGRESSIVE_NUMBER_SLICE, CBIRecord, iter_records
+
+
+# Record of the disposizione containing the debtor fiscal code or VAT number
+DEBTOR_RECORD = '30'
+
+# Length of the field of the record 30 containing the fiscal code or VAT number
+FISCODE_LENGTH = 16
+
+
+def normalize_fiscode(fiscode_or_vat) -> str:
+    """Fiscal code or VAT number as written in the record 30"""
+    return str(fiscode_or_vat or '').strip()[:FISCODE_LENGTH].upper()
+# end normalize_fiscode
+
+
+def normalize_duedate(duedate):
+    """Due date without the time, as written in the record 14"""
+    return duedate.date() if isinstance(duedate, datetime) else duedate
+# end normalize_duedate
+
+
+class ReturnedDisposition(typing.NamedTuple):
+    """
+    Disposizione read from a returned flow
+
+    :param progressive: the progressive number in the returned flow
+    :param fiscode_or_vat: the debtor fiscal code or VAT number, None if the
+     flow doesn't contain the record 30 of the disposizione
+    :param amount_cents: the amount in cents of Euro
+    :param duedate: the due date
+    :param records: the records of the disposizione
+    """
+
+    progressive: int
+    fiscode_or_vat: typing.Optional[str]
+    amount_cents: int
+    duedate: typing.Any
+    records: typing.Tuple[CBIRecord, ...]
+
+    @property
+    def key(self) -> tuple:
+        return self.progressive, self.fiscode_or_vat, self.amount_cents, self.duedate
+    # end key
+
+    @property
+    def fallback_key(self) -> tuple:
+        return self.fiscode_or_vat, self.amount_cents, self.duedate
+    # end fallback_key
+# end ReturnedDisposition
+
+
+class IssuedDisposition(typing.NamedTuple):
+    """
+    Disposizione of an issued flow
+
+    :param progressive: the progressive number in the issued flow
+    :param issued: the class:`Receipt` or class:`ReceiptGroup` rendered
+    """
+
+    progressive: int
+    issued: typing.Any
+# end IssuedDisposition
+
+
+class Match(typing.NamedTuple):
+    returned: ReturnedDisposition
+    issued: IssuedDisposition
+# end Match
+
+
+class AmbiguousMatch(typing.NamedTuple):
+    returned: ReturnedDisposition
+    candidates: typing.Tuple[IssuedDisposition, ...]
+# end AmbiguousMatch
+
+
+class RepeatedMatch(typing.NamedTuple):
+    returned: ReturnedDisposition
+    reconciled: typing.Tuple[IssuedDisposition, ...]
+# end RepeatedMatch
+
+
+class ReconciliationResult(typing.NamedTuple):
+    """
+    Outcome of :meth:`ReconciliationIndex.reconcile`
+
+    :param matched: returned disposizioni matching exactly one issued one
+    :param unmatched: returned disposizioni not matching any issued one
+    :param ambiguous: returned disposizioni matching many issued ones
+    :param repeated: returned disposizioni matching only issued ones already
+     matched by another returned disposizione (e.g. a disposizione returned
+     twice)
+    """
+
+    matched: typing.List[Match]
+    unmatched: typing.List[ReturnedDisposition]
+    ambiguous: typing.List[AmbiguousMatch]
+    repeated: typing.List[RepeatedMatch]
+# end ReconciliationResult
+
+
+class ReconciliationIndex:
+    """
+    Hash index of the issued disposizioni
+
+    :param dispositions: the receipts (or groups) of the issued flow, in the
+     order they were rendered (see :meth:`ribalta.riba.Document.dispositions`)
+    :type dispositions: iterable of class:`Receipt` or class:`ReceiptGroup`
+    """
+
+    def __init__(self, dispositions: typing.Iterable):
+
+        # Full key -> issued disposizioni
+        self._by_key = dict()
+
+        # Key without the progressive number -> issued disposizioni
+        self._by_fallback_key = dict()
+
+        self._count = 0
+
+        for progressive, line in enumerate(dispositions, 1):
+            issued = IssuedDisposition(progressive, line)
+
+            fallback_key = (
+                normalize_fiscode(line.debtor_fiscode_or_vat),
+                line.amount_cents,
+                normalize_duedate(line.duedate),
+            )
+
+            self._by_key.setdefault((progressive,) + fallback_key, []).append(issued)
+            self._by_fallback_key.setdefault(fallback_key, []).append(issued)
+            self._count += 1
+        # end for
+    # end __init__
+
+    @classmethod
+    def from_document(cls, doc, group=False) -> 'ReconciliationIndex':
+        """
+        Index the disposizioni of a document
+
+        :param doc: the issued document
+        :type doc: class:`ribalta.riba.Document`
+        :param group: the grouping used to render the document
+        :returns: the index
+        :rtype: class:`ReconciliationIndex`
+        """
+        return cls(doc.dispositions(group))
+    # end from_document
+
+    def __len__(self):
+        return self._count
+    # end __len__
+
+    def lookup(self, returned: ReturnedDisposition) -> typing.List[IssuedDisposition]:
+        """
+        Return the issued disposizioni matching a returned one: the ones with
+        the same progressive number if any, otherwise the ones matching the
+        other fields
+
+        :param returned: the returned disposizione
+        :type returned: class:`ReturnedDisposition`
+        :rtype: list of class:`IssuedDisposition`
+        """
+        candidates = self._by_key.get(returned.key)
+        if candidates is None:
+            candidates = self._by_fallback_key.get(returned.fallback_key, [])
+        # end if
+        return candidates
+    # end lookup
+
+    def reconcile(self, records: typing.Iterable[CBIRecord]) -> ReconciliationResult:
+        """
+        Match the disposizioni of a returned flow with the issued ones, each
+        issued disposizione is matched at most once: when all the ones with
+        the same progressive number are already matched, the others matching
+        the other fields are looked up
+
+        :param records: the records of the returned flow
+        :type records: iterable of class:`ribalta.parser.CBIRecord`
+        :returns: the matched, unmatched, ambiguous and repeated disposizioni
+        :rtype: class:`ReconciliationResult`
+        """
+
+        result = ReconciliationResult(matched=[], unmatched=[], ambiguous=[], repeated=[])
+
+        # Progressive numbers of the issued disposizioni already matched
+        reconciled = set()
+
+        for returned in iter_returned_dispositions(records):
+            candidates = self.lookup(returned)
+
+            if not candidates:
+                result.unmatched.append(returned)
+                continue
+            # end if
+
+            available = [c for c in candidates if c.progressive not in reconciled]
+            if not available and returned.key in self._by_key:
+                candidates = self._by_fallback_key[returned.fallback_key]
+                available = [c for c in candidates if c.progressive not in reconciled]
+            # end if
+
+            if len(available) == 1:
+                reconciled.add(available[0].progressive)
+                result.matched.append(Match(returned, available[0]))
+            elif not available:
+                result.repeated.append(RepeatedMatch(returned, tuple(candidates)))
+            else:
+                result.ambiguous.append(AmbiguousMatch(returned, tuple(candidates)))
+            # end if
+        # end for
+
+        return result
+    # end reconcile
+
+    def reconcile_file(self, path) -> ReconciliationResult:
+        """
+        Match the disposizioni of a returned flow stored in a file
+
+        :param path: the path of the file
+        :type path: str or os.PathLike
+        :returns: the matched, unmatched, ambiguous and repeated disposizioni
+        :rtype: class:`ReconciliationResult`
+        """
+        return self.reconcile(iter_records(path))
+    # end reconcile_file
+# end ReconciliationIndex
+
+
+def iter_returned_dispositions(
+        records: typing.Iterable[CBIRecord]
+) -> typing.Iterator[ReturnedDisposition]:
+    """
+    Extract the disposizioni from the records of a flow. Each disposizione
+    starts with a record 14, the debtor data is taken from the following
+    record 30 with the same progressive number, if any.
+
+    :param records: the records of the flow
+    :type records: iterable of class:`ribalta.parser.CBIRecord`
+    :rtype: iterator of class:`ReturnedDisposition`
+    """
+
+    def build(head, debtor, disposition_records):
+        return ReturnedDisposition(
+            progressive=head.num_progr,
+            fiscode_or_vat=normalize_fiscode(debtor.debtor_fiscode_or_vat) if debtor else None,
+            amount_cents=head.amount_cents,
+            duedate=head.duedate,
+            records=tuple(disposition_records),
+        )
+    # end build
+
+    head = debtor = progressive = None
+    disposition_records = list()
+
+    for record in records:
+        record_type = record.record_type
+
+        if record_type == FIRST_RECORD_OF_RIBA:
+            if head is not None:
+                yield build(head, debtor, disposition_records)
+            # end if
+            head, debtor, disposition_records = record, None, [record]
+            progressive = record.raw[PROGRESSIVE_NUMBER_SLICE]
+
+        elif head is not None and record.raw[PROGRESSIVE_NUMBER_SLICE] == progressive:
+            disposition_records.append(record)
+            if record_type == DEBTOR_RECORD:
+                debtor = record
+            # end if
+
+        elif head is not None:
+            # Records not belonging to the disposizione (e.g. EF)
+            yield build(head, debtor, disposition_records)
+            head, debtor, disposition_records = None, None, []
+        # end if
+    # end for
+
+    if head is not None:
+        yield build(head, debtor, disposition_records)
+    # end if
+# end iter_returned_dispositions
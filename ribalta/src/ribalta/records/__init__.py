@@ -0,0 +1,4 @@
+"""Template-free rendering of fixed-width records"""
+
+from .layout import Constant, Field, Filler, RecordLayout, JUSTIFY_LEFT, JUSTIFY_RIGHT, compile_records
+from .cbi import CBIRecordsRenderer
@@ -0,0 +1,485 @@
+"""Layouts of the records of a CBI RiBa flow and template-free renderer.
+
+The layouts describe the same records produced by the ``cbi.mako`` template
+and they are defined according to the technical standard described in the
+document:
+   Nome: CBI-ICI-001
+   Versione: v. 6.01 - Pagine 21
+   Ultimo aggiornamento 15-12-2006
+"""
+
+import functools
+import typing
+
+from ..utils.text import to_ascii
+
+from .layout import (
+    Constant, Field, Filler, RecordLayout, JUSTIFY_LEFT, JUSTIFY_RIGHT, compile_records
+)
+
+
+# Terminator of each record of the flow
+RECORD_END = '\r\n'
+
+# Length of each record (terminator excluded)
+RECORD_LENGTH = 120
+
+# Number of records composing each receipt (14, 20, 30, 40, 50, 51, 70)
+RECORDS_IN_EACH_RIBA = 7
+
+# Size in bytes of each record, terminator included
+RECORD_SIZE = RECORD_LENGTH + len(RECORD_END)
+
+# Encoding of the CBI flows
+CBI_ENCODING = 'ascii'
+
+
+def flow_size(lines_count: int) -> int:
+    """Size in bytes of a flow containing lines_count receipts (or groups):
+    the records of the receipts plus the IB and EF records"""
+    return RECORD_SIZE * (RECORDS_IN_EACH_RIBA * lines_count + 2)
+# end flow_size
+
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+# Values transformations
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+def t_text(content) -> str:
+    """Transliterate to ASCII and strip"""
+    return to_ascii(str(content)).strip()
+# end t_text
+
+
+def t_text_or_empty(content) -> str:
+    """Transliterate to ASCII and strip, empty values become empty strings"""
+    return to_ascii(str(content or '')).strip()
+# end t_text_or_empty
+
+
+def t_text_not_stripped(content) -> str:
+    """Transliterate to ASCII"""
+    return to_ascii(str(content))
+# end t_text_not_stripped
+
+
+def t_strip(content) -> str:
+    return str(content).strip()
+# end t_strip
+
+
+def t_date(content) -> str:
+    """Format a date as GGMMAA"""
+    # Same as strftime('%d%m%y'), without parsing the format each time
+    return '%02d%02d%02d' % (content.day, content.month, content.year % 100)
+# end t_date
+
+
+def t_acct_num(account_number) -> str:
+    # Take the last 12 characters of the supplied account number, this way
+    # Italian IBAN codes are managed correctly too
+    return str(account_number).strip().rjust(12, '0')[-12:]
+# end t_acct_num
+
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+# Records layouts
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+def _progressive() -> Field:
+    # 4-10 - Numero progressivo: numero della disposizione all'interno del flusso
+    return Field('num_progr', 4, 10, JUSTIFY_RIGHT, '0')
+# end _progressive
+
+
+R_IB = RecordLayout('IB', [
+    Constant(1, ' IB'),
+    # 4-8 - Mittente: codice SIA dell'azienda mittente
+    Field('sia_code', 4, 8, JUSTIFY_RIGHT, '!', t_text),
+    # 9-13 - Ricevente: ABI banca assuntrice
+    Field('creditor_bank_abi', 9, 13, JUSTIFY_RIGHT, '0', t_text),
+    # 14-19 - Data creazione (GGMMAA)
+    Field('creation_date', 14, 19, transform=t_date),
+    # 20-39 - Nome supporto
+    Field('name', 20, 39),
+    # 40-45 - Campo libero, 46-104 - Filler, 105-111 - Qualificatore di
+    # flusso (non utilizzato), 112-113 - Filler
+    Filler(40, 113),
+    # 114 - Codice divisa
+    Constant(114, 'E'),
+    # 115 - Filler, 116-120 - Non disponibile
+    Filler(115, 120),
+])
+
+R_14 = RecordLayout('14', [
+    Constant(1, ' 14'),
+    _progressive(),
+    Filler(11, 22),
+    # 23-28 - Data pagamento: data di scadenza (GGMMAA)
+    Field('duedate', 23, 28, transform=t_date),
+    # 29-33 - Causale
+    Constant(29, '30000'),
+    # 34-46 - Importo in centesimi di Euro
+    Field('amount_cents', 34, 46, JUSTIFY_RIGHT, '0'),
+    # 47 - Segno
+    Constant(47, '-'),
+    # 48-69 - Coordinate banca assuntrice: ABI, CAB, numero di conto
+    Field('creditor_bank_abi', 48, 52, JUSTIFY_RIGHT, '0', t_text),
+    Field('creditor_bank_cab', 53, 57, JUSTIFY_RIGHT, '0', t_text),
+    Field('creditor_bank_acc', 58, 69, JUSTIFY_RIGHT, '0', t_acct_num),
+    # 70-79 - Coordinate banca domiciliataria: ABI, CAB
+    Field('debtor_bank_abi', 70, 74, JUSTIFY_RIGHT, '0', t_text),
+    Field('debtor_bank_cab', 75, 79, JUSTIFY_RIGHT, '0', t_text),
+    Filler(80, 91),
+    # 92-96 - Codice SIA del cliente ordinante
+    Field('sia_code', 92, 96, JUSTIFY_RIGHT, '!', t_text),
+    # 97 - Tipo codice
+    Constant(97, '4'),
+    # 98-113 - Codice cliente debitore
+    Field('debtor_client_code', 98, 113, JUSTIFY_LEFT, ' ', t_text),
+    # 114 - Flag tipo debitore, 115-119 - Filler
+    Filler(114, 119),
+    # 120 - Codice divisa
+    Constant(120, 'E'),
+])
+
+R_20 = RecordLayout('20', [
+    Constant(1, ' 20'),
+    _progressive(),
+    # 11-106 - Descrizione del creditore (4 segmenti da 24 caratteri)
+    Field('creditor_company_name', 11, 34, JUSTIFY_LEFT, ' ', t_text),
+    Field('creditor_company_addr_street', 35, 58, JUSTIFY_LEFT, ' ', t_text),
+    Field('creditor_company_addr_zip', 59, 63, JUSTIFY_LEFT, ' ', t_text),
+    Filler(64, 64),
+    Field('creditor_company_addr_city', 65, 79, JUSTIFY_LEFT, ' ', t_text),
+    Filler(80, 80),
+    Field('creditor_company_addr_state', 81, 82, JUSTIFY_LEFT, ' ', t_text),
+    Field('creditor_fiscode_or_vat', 83, 106, JUSTIFY_RIGHT, ' ', t_text),
+    Filler(107, 120),
+])
+
+R_30 = RecordLayout('30', [
+    Constant(1, ' 30'),
+    _progressive(),
+    # 11-70 - Descrizione del debitore (2 segmenti da 30 caratteri)
+    Field('debtor_name', 11, 70, JUSTIFY_LEFT, ' ', t_text),
+    # 71-86 - Codifica fiscale del debitore
+    Field('debtor_fiscode_or_vat', 71, 86, JUSTIFY_LEFT, ' ', t_strip),
+    Filler(87, 120),
+])
+
+R_40 = RecordLayout('40', [
+    Constant(1, ' 40'),
+    _progressive(),
+    # 11-40 - Indirizzo
+    Field('debtor_address', 11, 40, JUSTIFY_LEFT, ' ', t_text),
+    # 41-45 - CAP
+    Field('debtor_zip', 41, 45, JUSTIFY_RIGHT, '0', t_text),
+    # 46-70 - Comune e sigla della provincia
+    Field('debtor_city', 46, 67, JUSTIFY_LEFT, ' ', t_text),
+    Filler(68, 68),
+    Field('debtor_state', 69, 70, JUSTIFY_RIGHT, ' '),
+    # 71-120 - Banca/sportello domiciliataria
+    Field('debtor_bank_name', 71, 120, JUSTIFY_LEFT, ' ', t_text_or_empty),
+])
+
+R_50 = RecordLayout('50', [
+    Constant(1, ' 50'),
+    _progressive(),
+    # 11-90 - Riferimento al debito (2 segmenti da 40 caratteri)
+    Field('communication', 11, 90, JUSTIFY_LEFT, ' ', t_text_not_stripped),
+    Filler(91, 100),
+    # 101-116 - Codifica fiscale del creditore
+    Field('creditor_fiscode_or_vat', 101, 116, JUSTIFY_LEFT, ' ', t_text),
+    Filler(117, 120),
+])
+
+R_51 = RecordLayout('51', [
+    Constant(1, ' 51'),
+    _progressive(),
+    # 11-20 - Numero ricevuta attribuito dal creditore
+    Field('num_progr', 11, 20, JUSTIFY_RIGHT, '0'),
+    # 21-40 - Denominazione creditore
+    Field('creditor_company_name', 21, 40, JUSTIFY_LEFT, ' ', t_text),
+    # 41-71 - Bollo virtuale (non implementato), 72-120 - Filler
+    Filler(41, 120),
+])
+
+R_70 = RecordLayout('70', [
+    Constant(1, ' 70'),
+    _progressive(),
+    # 11-88 - Filler, 89-120 - Indicatori di circuito, indicatore richiesta
+    # di incasso e chiavi di controllo (non implementati)
+    Filler(11, 120),
+])
+
+R_EF = RecordLayout('EF', [
+    Constant(1, ' EF'),
+    # 4-39 - Uguali ai campi corrispondenti del record IB
+    Field('sia_code', 4, 8, JUSTIFY_RIGHT, '!', t_text),
+    Field('creditor_bank_abi', 9, 13, JUSTIFY_RIGHT, '0', t_text),
+    Field('creation_date', 14, 19, transform=t_date),
+    Field('name', 20, 39),
+    Filler(40, 45),
+    # 46-52 - Numero disposizioni
+    Field('num_disposizioni', 46, 52, JUSTIFY_RIGHT, '0'),
+    # 53-67 - Totale importi negativi in centesimi di Euro
+    Field('total_amount_cents', 53, 67, JUSTIFY_RIGHT, '0'),
+    # 68-82 - Totale importi positivi
+    Filler(68, 82, '0'),
+    # 83-89 - Numero record, compresi i record IB ed EF
+    Field('num_records', 83, 89, JUSTIFY_RIGHT, '0'),
+    Filler(90, 113),
+    # 114 - Codice divisa
+    Constant(114, 'E'),
+    # 115-120 - Campo riservato
+    Filler(115, 120),
+])
+
+# Layouts of the records composing each receipt, in order
+RECEIPT_LAYOUTS = (R_14, R_20, R_30, R_40, R_50, R_51, R_70)
+
+# All the layouts indexed by record type
+LAYOUTS = {
+    layout.record_type: layout
+    for layout in (R_IB,) + RECEIPT_LAYOUTS + (R_EF,)
+}
+
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+# Renderer
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+# Names of the Document attributes containing the creditor data, the same
+# for all the receipts of the document
+CREDITOR_FIELDS = (
+    'sia_code',
+    'creditor_company_name', 'creditor_company_addr_street',
+    'creditor_company_addr_zip', 'creditor_company_addr_city',
+    'creditor_company_addr_state', 'creditor_fiscode_or_vat',
+    'creditor_bank_abi', 'creditor_bank_cab', 'creditor_bank_acc',
+)
+
+# Names of the Document attributes used by the records layouts
+DOCUMENT_FIELDS = CREDITOR_FIELDS + ('creation_date', 'name')
+
+# Names of the Receipt (or ReceiptGroup) attributes used by the records layouts
+LINE_FIELDS = (
+    'duedate', 'amount_cents',
+    'debtor_bank_abi', 'debtor_bank_cab', 'debtor_bank_name',
+    'debtor_client_code', 'debtor_name', 'debtor_fiscode_or_vat',
+    'debtor_address', 'debtor_zip', 'debtor_city', 'debtor_state',
+    'communication',
+)
+
+
+class CreditorSegments(typing.NamedTuple):
+    """Segments of the records containing the creditor data, already
+    formatted. Each segment is a group of adjacent fields."""
+
+    # IB 4-8, 14 92-96, EF 4-8 - Codice SIA
+    sia_code: str
+    # IB 9-13, EF 9-13 - ABI banca assuntrice
+    bank_abi: str
+    # 14 48-69 - Coordinate banca assuntrice: ABI, CAB, numero di conto
+    bank_coordinates: str
+    # 20 11-106 - Descrizione del creditore
+    description: str
+    # 50 101-116 - Codifica fiscale del creditore
+    fiscode: str
+    # 51 21-40 - Denominazione creditore
+    name: str
+# end CreditorSegments
+
+
+def build_creditor_segments(values: typing.Mapping[str, typing.Any]) -> CreditorSegments:
+    """
+    Format the segments of the records containing the creditor data
+
+    :param values: the creditor data, a value for each name in CREDITOR_FIELDS
+    :returns: the formatted segments
+    :rtype: class:`CreditorSegments`
+    """
+    return CreditorSegments(
+        sia_code=R_IB.format_span(values, 4, 8),
+        bank_abi=R_IB.format_span(values, 9, 13),
+        bank_coordinates=R_14.format_span(values, 48, 69),
+        description=R_20.format_span(values, 11, 106),
+        fiscode=R_50.format_span(values, 101, 116),
+        name=R_51.format_span(values, 21, 40),
+    )
+# end build_creditor_segments
+
+
+@functools.lru_cache(maxsize=32)
+def _bound_receipt_layouts(creditor_items: tuple) -> typing.Tuple[RecordLayout, ...]:
+    """Return the layouts of the records of the receipts with the creditor
+    fields already formatted. Documents of the same creditor share the
+    layouts, which are kept in a small process-wide cache."""
+    creditor_values = dict(creditor_items)
+    return tuple(layout.bind(creditor_values) for layout in RECEIPT_LAYOUTS)
+# end _bound_receipt_layouts
+
+
+@functools.lru_cache(maxsize=32)
+def _receipt_block_formatter(creditor_items: tuple) -> typing.Callable[..., str]:
+    """Return the function formatting the 7 records of a disposizione:
+    format(line, num_progr, amount_cents)"""
+    return compile_records(
+        _bound_receipt_layouts(creditor_items), RECORD_END, ('num_progr', 'amount_cents')
+    )
+# end _receipt_block_formatter
+
+
+class CBIRecordsRenderer:
+    """
+    Render a RiBa document in the CBI format using the records layouts
+    instead of the Mako template. The output is identical to the one
+    produced by the template.
+
+    :param doc: the document to be rendered
+    :type doc: class:`ribalta.riba.Document`
+    """
+
+    def __init__(self, doc):
+        self._doc = doc
+
+        # Document values are the same for all the records: read them once
+        self._doc_values = {name: getattr(doc, name) for name in DOCUMENT_FIELDS}
+
+        # The creditor fields of the receipts records are formatted only once
+        # and the records of each disposizione are formatted by a single call
+        self._format_block = _receipt_block_formatter(
+            tuple((name, self._doc_values[name]) for name in CREDITOR_FIELDS)
+        )
+    # end __init__
+
+    def iter_records(self, lines: typing.Iterable) -> typing.Iterator[str]:
+        """
+        Generate the records of the CBI flow, terminator included
+
+        :param lines: the receipts (or groups of receipts) to be rendered
+        :returns: iterator over the records
+        """
+        for block in self._iter_blocks(lines):
+            for start in range(0, len(block), RECORD_SIZE):
+                yield block[start:start + RECORD_SIZE]
+            # end for
+        # end for
+    # end iter_records
+
+    def header(self) -> str:
+        """The IB record, terminator included"""
+        return R_IB.format(self._doc_values) + RECORD_END
+    # end header
+
+    def trailer(self, num_disposizioni: int, total_amount_cents: int) -> str:
+        """
+        The EF record, terminator included
+
+        :param num_disposizioni: number of disposizioni of the flow
+        :param total_amount_cents: total amount of the disposizioni in cents
+        :returns: the EF record
+        """
+        values = dict(
+            self._doc_values,
+            num_disposizioni=num_disposizioni,
+            total_amount_cents=total_amount_cents,
+            num_records=num_disposizioni * RECORDS_IN_EACH_RIBA + 2,
+        )
+        return R_EF.format(values) + RECORD_END
+    # end trailer
+
+    def iter_receipt_blocks(
+            self, lines: typing.Iterable, start: int = 1
+    ) -> typing.Iterator[str]:
+        """
+        Generate the records of the disposizioni, without the IB and EF
+        records. The records don't depend on the creation date and on the
+        name of the document.
+
+        :param lines: the receipts (or groups of receipts) to be rendered
+        :param start: progressive number of the first line
+        :returns: iterator over the records of each line, joined in a single
+         string (7 records, terminators included)
+        """
+        return self._iter_receipt_blocks(lines, start, [0, 0])
+    # end iter_receipt_blocks
+
+    def render_block(self, line, num_progr: int) -> str:
+        """
+        Render the records of a single disposizione
+
+        :param line: the receipt (or group of receipts)
+        :param num_progr: progressive number of the disposizione in the flow
+        :returns: the 7 records, terminators included
+        """
+        amount_cents = line.amount_cents
+        return self._format_block(line, str(num_progr), amount_cents)
+    # end render_block
+
+    def _iter_blocks(self, lines: typing.Iterable) -> typing.Iterator[str]:
+        """Generate the records of the CBI flow in blocks: the IB record,
+        the records of each receipt, the EF record"""
+
+        yield self.header()
+
+        # Number of disposizioni and total amount, updated while rendering
+        counters = [0, 0]
+        yield from self._iter_receipt_blocks(lines, 1, counters)
+
+        yield self.trailer(*counters)
+    # end _iter_blocks
+
+    def _iter_receipt_blocks(self, lines, start: int, counters: typing.List[int]):
+
+        format_block = self._format_block
+
+        # Progressive number of the receipt (starting from 1)
+        for num_progr, line in enumerate(lines, start=start):
+            amount_cents = line.amount_cents
+            yield format_block(line, str(num_progr), amount_cents)
+
+            counters[0] += 1
+            counters[1] += amount_cents
+        # end for
+    # end _iter_receipt_blocks
+
+    def render(self, lines: typing.Iterable) -> str:
+        """
+        Render the CBI flow
+
+        :param lines: the receipts (or groups of receipts) to be rendered
+        :returns: the CBI document
+        :rtype: str
+        """
+        return ''.join(self._iter_blocks(lines))
+    # end render
+
+    def render_bytes(self, lines: typing.Sequence) -> memoryview:
+        """
+        Render the CBI flow as ASCII bytes. The size of the flow depends only
+        on the number of lines, so the whole buffer is allocated in advance:
+        the records of each disposizione are formatted as a string, encoded
+        and copied into it.
+
+        :param lines: the receipts (or groups of receipts) to be rendered
+        :returns: a view of the buffer containing the CBI document
+        :rtype: memoryview
+        """
+        buffer = bytearray(flow_size(len(lines)))
+
+        offset = 0
+        for block in self._iter_blocks(lines):
+            encoded = block.encode(CBI_ENCODING)
+            end = offset + len(encoded)
+            if len(encoded) % RECORD_SIZE or end > len(buffer):
+                raise ValueError(f'Invalid CBI records length: {block!r}')
+            # end if
+            buffer[offset:end] = encoded
+            offset = end
+        # end for
+
+        return memoryview(buffer)
+    # end render_bytes
+# end CBIRecordsRenderer
@@ -0,0 +1,383 @@
+"""Declarative description of fixed-width records.
+
+Each record type is described once as a list of fields, each field specifying
+the position of its first and last character (counting from 1, as in the CBI
+reference documents), how the value must be justified, the character used to
+fill the field and the transformation applied to the value before the
+justification. The layout is then compiled into a formatter: constant fields
+are merged into literal strings and each variable field gets its own
+formatting function, so formatting a record is a single expression
+concatenating literals and formatted values.
+
+Records always written together (e.g. the records of a disposizione) can be
+compiled into a single function with :func:`compile_records`.
+"""
+
+import typing
+
+
+JUSTIFY_LEFT = 'L'
+JUSTIFY_RIGHT = 'R'
+
+
+class Field(typing.NamedTuple):
+    """
+    Field of a fixed-width record
+
+    :param name: name of the value in the mapping passed to
+     :meth:`RecordLayout.format`, None for constant fields
+    :param start: position of the first character of the field (from 1)
+    :param end: position of the last character of the field (from 1)
+    :param justify: :data:`JUSTIFY_LEFT` or :data:`JUSTIFY_RIGHT`
+    :param fill: character used to fill the field
+    :param transform: function converting the value to a string before the
+     justification, if None the value is converted using str()
+    :param value: value of a constant field
+    """
+    name: typing.Optional[str]
+    start: int
+    end: int
+    justify: str = JUSTIFY_LEFT
+    fill: str = ' '
+    transform: typing.Optional[typing.Callable[[typing.Any], str]] = None
+    value: typing.Optional[str] = None
+
+    @property
+    def width(self) -> int:
+        return self.end - self.start + 1
+    # end width
+
+    @property
+    def is_constant(self) -> bool:
+        return self.name is None
+    # end is_constant
+# end Field
+
+
+def Constant(start: int, value: str) -> Field:
+    """Build a field containing a fixed value"""
+    return Field(None, start, start + len(value) - 1, value=value)
+# end Constant
+
+
+def Filler(start: int, end: int, fill: str = ' ') -> Field:
+    """Build a field filled with the fill character"""
+    return Field(None, start, end, value=fill * (end - start + 1))
+# end Filler
+
+
+def _build_field_formatter(field: Field) -> typing.Callable[[typing.Any], str]:
+    """Build the function that formats the values of a variable field"""
+
+    width = field.width
+    fill = field.fill
+    transform = field.transform or str
+
+    if field.justify == JUSTIFY_LEFT:
+        def formatter(value):
+            return transform(value).ljust(width, fill)[:width]
+        # end formatter
+
+    elif field.justify == JUSTIFY_RIGHT:
+        def formatter(value):
+            return transform(value).rjust(width, fill)[:width]
+        # end formatter
+
+    else:
+        raise ValueError(
+            f'Invalid justification "{field.justify}" for field "{field.name}"'
+        )
+    # end if
+
+    return formatter
+# end _build_field_formatter
+
+
+class RecordLayout:
+    """
+    Layout of a fixed-width record
+
+    :param record_type: code of the record type (e.g. 'IB', '14', 'EF')
+    :type record_type: str
+    :param fields: the fields of the record, sorted by position, covering the
+     whole record without gaps or overlaps
+    :type fields: List of class:`Field`
+    :param length: length of the record in characters
+    :type length: int
+    """
+
+    def __init__(self, record_type: str, fields: typing.List[Field], length: int = 120):
+
+        self._record_type = record_type
+        self._fields = tuple(fields)
+        self._length = length
+
+        # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+        # Sanity checks
+        # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+        next_start = 1
+        for field in self._fields:
+            if field.start != next_start:
+                raise ValueError(
+                    f'Record {record_type}: field "{field.name}" starts at '
+                    f'{field.start}, expected start is {next_start}'
+                )
+            elif field.end < field.start:
+                raise ValueError(
+                    f'Record {record_type}: field "{field.name}" ends '
+                    f'before its start'
+                )
+            elif field.is_constant and len(field.value) != field.width:
+                raise ValueError(
+                    f'Record {record_type}: the constant value of the field '
+                    f'at {field.start}-{field.end} does not fit the field'
+                )
+            # end if
+            next_start = field.end + 1
+        # end for
+
+        if next_start != length + 1:
+            raise ValueError(
+                f'Record {record_type}: fields cover {next_start - 1} '
+                f'characters, expected {length}'
+            )
+        # end if
+
+        # The formatter is compiled when the layout is used for the first
+        # time: importing the module doesn't pay for the compilation of all
+        # the layouts. Compiling it twice from two threads is harmless.
+        self._formatter = None
+    # end __init__
+
+    @property
+    def record_type(self) -> str:
+        return self._record_type
+    # end record_type
+
+    @property
+    def fields(self) -> typing.Tuple[Field, ...]:
+        return self._fields
+    # end fields
+
+    @property
+    def length(self) -> int:
+        return self._length
+    # end length
+
+    @property
+    def field_names(self) -> typing.List[str]:
+        """Names of the variable fields of the record"""
+        return [f.name for f in self._fields if not f.is_constant]
+    # end field_names
+
+    @property
+    def formatter(self) -> typing.Callable[[typing.Mapping[str, typing.Any]], str]:
+        """The compiled formatting function, same as :meth:`format`"""
+        if self._formatter is None:
+            self._formatter = self._compile()
+        # end if
+        return self._formatter
+    # end formatter
+
+    def format(self, values: typing.Mapping[str, typing.Any]) -> str:
+        """
+        Format a record
+
+        :param values: mapping containing a value for each variable field
+        :returns: the formatted record, without the record terminator
+        :rtype: str
+        """
+        return self.formatter(values)
+    # end format
+
+    def format_span(self, values: typing.Mapping[str, typing.Any], start: int, end: int) -> str:
+        """
+        Format only the fields between two positions of the record
+
+        :param values: mapping containing a value for each variable field
+         in the span
+        :param start: position of the first character (from 1), must be the
+         start of a field
+        :param end: position of the last character (from 1), must be the end
+         of a field
+        :returns: the formatted fields
+        :rtype: str
+        """
+
+        fields = [f for f in self._fields if f.start >= start and f.end <= end]
+
+        if not fields or fields[0].start != start or fields[-1].end != end:
+            raise ValueError(
+                f'Record {self._record_type}: {start}-{end} is not a span of fields'
+            )
+        # end if
+
+        return ''.join([
+            f.value if f.is_constant else _build_field_formatter(f)(values[f.name])
+            for f in fields
+        ])
+    # end format_span
+
+    def bind(self, values: typing.Mapping[str, typing.Any]) -> 'RecordLayout':
+        """
+        Build a new layout where the fields having a value in the supplied
+        mapping are formatted once and become constant fields. Used to
+        precompute the parts of a record that are the same for many records.
+
+        :param values: mapping containing the values of the fields to be bound
+        :returns: the new layout
+        :rtype: class:`RecordLayout`
+        """
+
+        fields = [
+            Constant(f.start, _build_field_formatter(f)(values[f.name]))
+            if not f.is_constant and f.name in values else f
+            for f in self._fields
+        ]
+
+        return RecordLayout(self._record_type, fields, self._length)
+    # end bind
+
+    # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+    # Private methods
+    # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+    def _segments(self) -> typing.List[typing.Union[str, Field]]:
+        """The fields of the record, adjacent constant fields merged in a
+        single literal string"""
+
+        segments = list()
+
+        for field in self._fields:
+            if field.is_constant:
+                if segments and isinstance(segments[-1], str):
+                    segments[-1] += field.value
+                else:
+                    segments.append(field.value)
+                # end if
+            else:
+                segments.append(field)
+            # end if
+        # end for
+
+        return segments
+    # end _segments
+
+    def _compile(self) -> typing.Callable[[typing.Mapping[str, typing.Any]], str]:
+        """Build the function formatting the record. Adjacent constant fields
+        are merged in a single literal string and each variable field gets
+        its own formatting function: the generated function is a single
+        expression concatenating literals and formatted values."""
+
+        segments = self._segments()
+
+        namespace = dict()
+        expressions = list()
+
+        for i, segment in enumerate(segments):
+            if isinstance(segment, str):
+                expressions.append(repr(segment))
+            else:
+                namespace[f'f_{i}'] = _build_field_formatter(segment)
+                expressions.append(f'f_{i}(values[{segment.name!r}])')
+            # end if
+        # end for
+
+        source = (
+            'def format_record(values):\n'
+            f'    return {" + ".join(expressions) or repr("")}\n'
+        )
+        exec(compile(source, f'<record layout {self._record_type}>', 'exec'), namespace)
+
+        return namespace['format_record']
+    # end _compile
+
+    def __repr__(self):
+        return f'<RecordLayout {self._record_type} ({len(self._fields)} fields)>'
+    # end __repr__
+# end RecordLayout
+
+
+def compile_records(
+        layouts: typing.Sequence[RecordLayout], terminator: str = '',
+        arguments: typing.Sequence[str] = ()
+) -> typing.Callable[..., str]:
+    """
+    Compile many layouts into a single function formatting all their records
+    at once, each record followed by the terminator. The generated function
+    reads each value once, formats the fields having the same name and
+    format (e.g. the progressive number repeated in each record) only once
+    and joins all the records in a single string.
+
+    :param layouts: layouts of the records, in order
+    :param terminator: string written after each record
+    :param arguments: names of the fields passed as arguments of the
+     function, the values of the other fields are read as attributes of its
+     first argument
+    :returns: function(obj, *arguments) returning the formatted records
+    """
+
+    namespace = dict()
+    body = list()
+    # Field name -> local variable holding its value
+    values = {name: name for name in arguments}
+    # Format of a field -> local variable holding the formatted value
+    formatted = dict()
+    # Literals and local variables to be joined
+    parts = list()
+
+    def add_literal(literal: str):
+        if parts and parts[-1][0] == 'literal':
+            parts[-1] = ('literal', parts[-1][1] + literal)
+        else:
+            parts.append(('literal', literal))
+        # end if
+    # end add_literal
+
+    for layout in layouts:
+        for segment in layout._segments():
+            if isinstance(segment, str):
+                add_literal(segment)
+                continue
+            # end if
+
+            if segment.justify not in (JUSTIFY_LEFT, JUSTIFY_RIGHT):
+                raise ValueError(
+                    f'Invalid justification "{segment.justify}" for field "{segment.name}"'
+                )
+            # end if
+
+            value = values.get(segment.name)
+            if value is None:
+                value = values[segment.name] = f'a_{len(values)}'
+                body.append(f'{value} = obj.{segment.name}')
+            # end if
+
+            key = (segment.name, segment.width, segment.justify, segment.fill, segment.transform)
+            variable = formatted.get(key)
+            if variable is None:
+                variable = formatted[key] = f'v_{len(formatted)}'
+                transform = f't_{len(formatted)}'
+                namespace[transform] = segment.transform or str
+                justify = 'ljust' if segment.justify == JUSTIFY_LEFT else 'rjust'
+                body.append(
+                    f'{variable} = {transform}({value}).{justify}'
+                    f'({segment.width}, {segment.fill!r})[:{segment.width}]'
+                )
+            # end if
+            parts.append(('variable', variable))
+        # end for
+        add_literal(terminator)
+    # end for
+
+    expressions = [repr(part) if kind == 'literal' else part for kind, part in parts if part]
+    body.append(f'return "".join(({", ".join(expressions)},))' if expressions else 'return ""')
+
+    source = (
+        f'def format_records({", ".join(("obj",) + tuple(arguments))}):\n'
+        + ''.join(f'    {line}\n' for line in body)
+    )
+    name = ' '.join(layout.record_type for layout in layouts)
+    exec(compile(source, f'<records layouts {name}>', 'exec'), namespace)
+
+    return namespace['format_records']
+# end compile_records
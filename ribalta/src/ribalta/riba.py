@@ -1,13 +1,20 @@
 from datetime import datetime, date
-import importlib.resources
-import itertools
+import io
 import logging
-from mako import exceptions
-from mako.template import Template
 import re
+import threading
 import typing
 
-from .utils.errors import FiscalcodeMissingError, FiscalcodeAndVATMissingError
+from .templates import CBI_TEMPLATE_FILE, get_template
+from .utils.errors import (
+    DuplicateReceiptError, FiscalcodeMissingError, FiscalcodeAndVATMissingError, RenderCancelledError
+)
+from .utils.money import from_cents, to_cents
+from .utils import naming
+from .profiling import (
+    NULL_PROFILER, PHASE_GROUPING, PHASE_PREFETCH, PHASE_RECEIPTS, PHASE_RENDERING,
+    PHASE_SNAPSHOTS, PHASE_WRITING, RenderProfiler,
+)
 from .utils.odoo_stuff import _
 from .utils.validators import (
     validate_abi,
@@ -17,9 +24,55 @@ from .utils.validators import (
     validate_sia
 )
 
-
-# Name of the Mako template file
-CBI_TEMPLATE_FILE = 'cbi.mako'
+# Grouping, duplicates detection, columnar storage and records layouts are
+# imported by the code paths using them: importing ribalta stays cheap
+if typing.TYPE_CHECKING:
+    from . import grouping
+    from .cache import RenderCache
+    from .duplicates import Duplicate
+    from .records import CBIRecordsRenderer
+    from .records.cbi import CreditorSegments
+# end if
+
+
+# Rendering backends: the Mako template or the records layouts
+RENDER_BACKEND_MAKO = 'mako'
+RENDER_BACKEND_RECORDS = 'records'
+RENDER_BACKENDS = (RENDER_BACKEND_MAKO, RENDER_BACKEND_RECORDS)
+
+# Handling of the duplicated receipts added to a document (see
+# class:`ribalta.duplicates.DuplicateIndex`): not checked, reported in
+# Document.duplicates or refused raising DuplicateReceiptError
+DUPLICATES_IGNORE = 'ignore'
+DUPLICATES_REPORT = 'report'
+DUPLICATES_RAISE = 'raise'
+DUPLICATES_POLICIES = (DUPLICATES_IGNORE, DUPLICATES_REPORT, DUPLICATES_RAISE)
+
+# Number of lines rendered between two checks of the cancellation of an
+# asynchronous rendering
+CANCEL_CHECK_INTERVAL = 256
+
+# Fields of the payment lines (and of the related records) read by the
+# class:`Receipt` objects: they're loaded in bulk when building many receipts
+PAYMENT_LINE_PREFETCH_PATHS = (
+    'communication',
+    'move_line_id.date_maturity',
+    'move_line_id.amount_residual',
+    'move_line_id.name',
+    'move_line_id.move_id.name',
+    'move_line_id.invoice_id.number',
+    'move_line_id.invoice_id.date_invoice',
+    'partner_id.name',
+    'partner_id.ref',
+    'partner_id.fiscalcode',
+    'partner_id.vat',
+    'partner_id.street',
+    'partner_id.city',
+    'partner_id.zip',
+    'partner_id.state_id.code',
+    'partner_bank_id.sanitized_acc_number',
+    'partner_bank_id.bank_name',
+)
 
 # Logging object initialization
 _logger = logging.getLogger(__name__)
@@ -33,9 +86,11 @@ class Receipt:
 
     :param payment_line: Odoo object representing the payment line or the payment order
     :type payment_line: class:`account.payment.line`
+    :param validate: check the receipt data, raising an exception on the first error
+    :type validate: bool
     """
 
-    def __init__(self, payment_line):
+    def __init__(self, payment_line, validate: bool = True):
 
         # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
         # Fields initialization
@@ -52,11 +107,7 @@ class Receipt:
             self._communication = payment_line.move_line_id.name
         # end if
 
-        # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
-        # Sanity checks
-        # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
-
-        # CAB and ABI required
+        # ABI and CAB extracted from the debtor's IBAN
         debtor_iban = self._debtor_bank_account.sanitized_acc_number.replace(
             ' ', ''
         ).upper()
@@ -64,6 +115,17 @@ class Receipt:
         self._debtor_bank_abi = debtor_iban[5:10]
         self._debtor_bank_cab = debtor_iban[10:15]
 
+        # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+        # Sanity checks
+        # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+        # Skipped when the receipts are validated all together
+        # using validators.validate_batch()
+        if not validate:
+            return
+        # end if
+
+        # CAB and ABI required
         validate_abi(self.debtor_bank_abi, self.debtor_name)
         validate_cab(self.debtor_bank_cab, self.debtor_name)
 
@@ -83,6 +145,53 @@ class Receipt:
         validate_zip(self.debtor_zip)
 
     # end __init__
+
+    @classmethod
+    def from_payment_lines(
+            cls, payment_lines, snapshot: bool = False, validate: bool = True,
+            profiler: RenderProfiler = None
+    ) -> typing.List:
+        """
+        Build the receipts for all the lines of a payment order. The fields
+        used by the receipts are read in bulk on the whole recordset before
+        building the receipts, avoiding the lazy loading of the related
+        records one payment line at a time.
+
+        :param payment_lines: the payment lines
+        :type payment_lines: recordset of class:`account.payment.line`
+        :param snapshot: return class:`FrozenReceipt` objects instead
+        :type snapshot: bool
+        :param validate: check the data of each receipt when it's built
+        :type validate: bool
+        :param profiler: records the duration of the phases
+        :type profiler: class:`ribalta.profiling.RenderProfiler`
+        :returns: the receipts, in the same order of the payment lines
+        :rtype: List of class:`Receipt` or class:`FrozenReceipt`
+        """
+
+        profiler = profiler or NULL_PROFILER
+
+        # One bulk read for each field path: the ORM keeps the values in
+        # cache, so building the receipts doesn't require further queries
+        with profiler.phase(PHASE_PREFETCH, len(PAYMENT_LINE_PREFETCH_PATHS)):
+            for path in PAYMENT_LINE_PREFETCH_PATHS:
+                payment_lines.mapped(path)
+            # end for
+        # end with
+
+        with profiler.phase(PHASE_RECEIPTS) as phase:
+            receipts = [cls(line, validate=validate) for line in payment_lines]
+            phase.items = len(receipts)
+        # end with
+
+        if snapshot:
+            with profiler.phase(PHASE_SNAPSHOTS, len(receipts)):
+                receipts = [rcpt.snapshot() for rcpt in receipts]
+            # end with
+        # end if
+
+        return receipts
+    # end from_payment_lines
     
     @property
     def is_group(self):
@@ -99,11 +208,26 @@ class Receipt:
         return self._duedate_move_line.amount_residual
     # end amount
 
+    @property
+    def amount_cents(self) -> int:
+        return to_cents(self.amount)
+    # end amount_cents
+
+    @property
+    def move_line_id(self):
+        return self._duedate_move_line.id
+    # end move_line_id
+
     @property
     def debtor_partner(self):
         return self._debtor_partner
     # end duedate
 
+    @property
+    def debtor_partner_id(self):
+        return self._debtor_partner.id
+    # end debtor_partner_id
+
     @property
     def debtor_name(self):
         return self._debtor_partner.name
@@ -135,7 +259,7 @@ class Receipt:
                 f'Fiscalcode and VAT missing for debtor {self.debtor_name}'
             )
         # end if
-        return re.sub('^IT', '', self.debtor_vat_number) or self.debtor_fiscalcode
+        return re.sub('^IT', '', self.debtor_vat_number or '') or self.debtor_fiscalcode
     # end debtor_fiscode_or_vat
 
     @property
@@ -208,7 +332,7 @@ class Receipt:
         """
         
         return (
-            str(self.debtor_partner.id),
+            str(self.debtor_partner_id),
             str(self.debtor_bank_abi),
             str(self.debtor_bank_cab),
             self.duedate
@@ -246,9 +370,251 @@ class Receipt:
     def __repr__(self):
         return self.__str__()
     # end __repr__
+
+    def snapshot(self) -> 'FrozenReceipt':
+        """
+        Build an immutable snapshot of the receipt: all the fields are read
+        from the Odoo objects once and stored in the snapshot
+
+        :returns: the snapshot of the receipt
+        :rtype: class:`FrozenReceipt`
+        """
+        return FrozenReceipt(**{
+            name: getattr(self, name) for name in FrozenReceipt.FIELDS
+        })
+    # end snapshot
 # end Receipt
 
 
+class FrozenReceipt:
+    """
+    Immutable snapshot of a class:`Receipt`, decoupled from the Odoo objects.
+    All the fields are resolved once when the snapshot is built, so reading
+    them is just an attribute access. Snapshots can be used wherever a
+    class:`Receipt` is accepted (documents, groups, rendering).
+
+    Snapshots are usually built with :meth:`Receipt.snapshot`, the
+    constructor requires a keyword argument for each name in :attr:`FIELDS`.
+    """
+
+    # Fields copied from the class:`Receipt` object
+    FIELDS = (
+        'move_line_id',
+        'duedate',
+        'amount',
+        'debtor_partner_id',
+        'debtor_name',
+        'debtor_client_code',
+        'debtor_fiscalcode',
+        'debtor_vat_number',
+        'debtor_fiscode_or_vat',
+        'debtor_address',
+        'debtor_city',
+        'debtor_state',
+        'debtor_zip',
+        'debtor_bank_abi',
+        'debtor_bank_cab',
+        'debtor_bank_name',
+        'invoice_number',
+        'invoice_date',
+        'communication',
+    )
+
+    __slots__ = FIELDS + ('amount_cents', 'grouping_key', 'description')
+
+    def __init__(self, **fields):
+
+        missing = set(self.FIELDS) - fields.keys()
+        unknown = fields.keys() - set(self.FIELDS)
+        if missing or unknown:
+            raise TypeError(
+                f'Invalid fields for {type(self).__name__}: '
+                f'missing {sorted(missing)}, unknown {sorted(unknown)}'
+            )
+        # end if
+
+        set_field = super().__setattr__
+
+        for name in self.FIELDS:
+            set_field(name, fields[name])
+        # end for
+
+        # Derived values
+        set_field('amount_cents', to_cents(fields['amount']))
+        set_field('grouping_key', Receipt.grouping_key.fget(self))
+        set_field('description', Receipt.description.fget(self))
+    # end __init__
+
+    @property
+    def is_group(self):
+        return False
+    # end is_group
+
+    def snapshot(self) -> 'FrozenReceipt':
+        # Already a snapshot
+        return self
+    # end snapshot
+
+    def as_dict(self) -> typing.Dict[str, typing.Any]:
+        """Return the fields of the snapshot as a dictionary"""
+        return {name: getattr(self, name) for name in self.FIELDS}
+    # end as_dict
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f'{type(self).__name__} objects are immutable')
+    # end __setattr__
+
+    def __delattr__(self, name):
+        raise AttributeError(f'{type(self).__name__} objects are immutable')
+    # end __delattr__
+
+    def __reduce__(self):
+        # The default pickling protocol would call __setattr__
+        return _build_frozen_receipt, (self.as_dict(),)
+    # end __reduce__
+
+    def __eq__(self, other):
+        if not isinstance(other, FrozenReceipt):
+            return NotImplemented
+        # end if
+        return all(
+            getattr(self, name) == getattr(other, name) for name in self.FIELDS
+        )
+    # end __eq__
+
+    def __hash__(self):
+        return hash(tuple(getattr(self, name) for name in self.FIELDS))
+    # end __hash__
+
+    __str__ = Receipt.__str__
+
+    def __repr__(self):
+        return self.__str__()
+    # end __repr__
+# end FrozenReceipt
+
+
+def _build_frozen_receipt(fields: typing.Dict[str, typing.Any]) -> FrozenReceipt:
+    return FrozenReceipt(**fields)
+# end _build_frozen_receipt
+
+
+class FrozenCreditor:
+    """
+    Immutable snapshot of the creditor data of a class:`Document`: the company
+    data and its bank account, decoupled from the Odoo objects. Snapshots can
+    be pickled and sent to other processes, where documents are built with
+    :meth:`Document.from_snapshot`.
+
+    Snapshots are usually built with :meth:`from_records`, the constructor
+    requires a keyword argument for each name in :attr:`FIELDS`.
+    """
+
+    # Creditor data read from the Odoo objects
+    FIELDS = (
+        'creditor_company_name',
+        'creditor_fiscalcode',
+        'creditor_vat_number',
+        'creditor_company_ref',
+        'creditor_company_addr_street',
+        'creditor_company_addr_zip',
+        'creditor_company_addr_city',
+        'creditor_company_addr_state',
+        'creditor_bank_name',
+        'creditor_bank_iban',
+        'sia_code',
+    )
+
+    __slots__ = FIELDS
+
+    def __init__(self, **fields):
+
+        missing = set(self.FIELDS) - fields.keys()
+        unknown = fields.keys() - set(self.FIELDS)
+        if missing or unknown:
+            raise TypeError(
+                f'Invalid fields for {type(self).__name__}: '
+                f'missing {sorted(missing)}, unknown {sorted(unknown)}'
+            )
+        # end if
+
+        for name in self.FIELDS:
+            super().__setattr__(name, fields[name])
+        # end for
+    # end __init__
+
+    @classmethod
+    def from_records(cls, creditor_company, creditor_bank_account) -> 'FrozenCreditor':
+        """
+        Read the creditor data from the Odoo objects
+
+        :param creditor_company: Odoo object representing the creditor's company
+        :type creditor_company: class:`res.company`
+        :param creditor_bank_account: the bank account of the creditor
+        :type creditor_bank_account: class:`res.partner.bank`
+        :returns: the snapshot of the creditor data
+        :rtype: class:`FrozenCreditor`
+        """
+        partner = creditor_company.partner_id
+        state = partner.state_id or False
+
+        return cls(
+            creditor_company_name=partner.name,
+            creditor_fiscalcode=partner.fiscalcode,
+            creditor_vat_number=partner.vat or False,
+            creditor_company_ref=partner.ref or '',
+            creditor_company_addr_street=partner.street or '',
+            creditor_company_addr_zip=partner.zip or '',
+            creditor_company_addr_city=partner.city or '',
+            creditor_company_addr_state=state and state.code or '',
+            creditor_bank_name=creditor_bank_account.bank_name,
+            creditor_bank_iban=creditor_bank_account.sanitized_acc_number.replace(
+                ' ', ''
+            ).upper(),
+            sia_code=str(creditor_company.sia_code).strip(),
+        )
+    # end from_records
+
+    def as_dict(self) -> typing.Dict[str, typing.Any]:
+        """Return the fields of the snapshot as a dictionary"""
+        return {name: getattr(self, name) for name in self.FIELDS}
+    # end as_dict
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f'{type(self).__name__} objects are immutable')
+    # end __setattr__
+
+    def __delattr__(self, name):
+        raise AttributeError(f'{type(self).__name__} objects are immutable')
+    # end __delattr__
+
+    def __reduce__(self):
+        # The default pickling protocol would call __setattr__
+        return _build_frozen_creditor, (self.as_dict(),)
+    # end __reduce__
+
+    def __eq__(self, other):
+        if not isinstance(other, FrozenCreditor):
+            return NotImplemented
+        # end if
+        return self.as_dict() == other.as_dict()
+    # end __eq__
+
+    def __hash__(self):
+        return hash(tuple(getattr(self, name) for name in self.FIELDS))
+    # end __hash__
+
+    def __repr__(self):
+        return f'{type(self).__name__}({self.creditor_company_name!r}, sia_code={self.sia_code!r})'
+    # end __repr__
+# end FrozenCreditor
+
+
+def _build_frozen_creditor(fields: typing.Dict[str, typing.Any]) -> FrozenCreditor:
+    return FrozenCreditor(**fields)
+# end _build_frozen_creditor
+
+
 class ReceiptGroup:
     """
     Class that represents a group of RiBa receipt to be rendered as a single line in the RiBa document.
@@ -280,9 +646,9 @@ class ReceiptGroup:
             map(lambda r: r.description, self._receipts)
         )
         
-        # Total amount of the group
-        self._amount = sum(
-            map(lambda r: r.amount, self._receipts)
+        # Total amount of the group in cents
+        self._amount_cents = sum(
+            map(lambda r: r.amount_cents, self._receipts)
         )
 
         # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
@@ -311,9 +677,14 @@ class ReceiptGroup:
 
     @property
     def amount(self):
-        return self._amount
+        return from_cents(self._amount_cents)
     # end amount
 
+    @property
+    def amount_cents(self):
+        return self._amount_cents
+    # end amount_cents
+
     @property
     def debtor_name(self):
         return self._r_ref.debtor_name
@@ -412,29 +783,123 @@ class Document:
     :type creditor_company: class:`res.company`
     :param creditor_bank_account:
     :type creditor_company: class:`res.partner.bank`
+    :param duplicates: handling of the duplicated receipts (same move line,
+     or same debtor, bank, due date and amount): DUPLICATES_IGNORE,
+     DUPLICATES_REPORT to collect them in :attr:`duplicates` or
+     DUPLICATES_RAISE to refuse them raising DuplicateReceiptError
+    :type duplicates: str
+    :param columnar: store the receipts in a class:`ribalta.table.ReceiptTable`
+     instead of a list, for very large documents: only the values of the
+     fields are kept and the receipts are returned as
+     class:`ribalta.table.ReceiptRow` objects
+    :type columnar: bool
     """
 
-    def __init__(self, creditor_company, creditor_bank_account):
+    def __init__(
+            self, creditor_company, creditor_bank_account,
+            duplicates: str = DUPLICATES_IGNORE, columnar: bool = False
+    ):
         """Constructor method"""
 
+        self._creditor_company = creditor_company
+        self._creditor_bank_account = creditor_bank_account
+
+        self._setup(
+            FrozenCreditor.from_records(creditor_company, creditor_bank_account),
+            datetime.now(),
+            duplicates,
+            columnar,
+        )
+    # end __init__
+
+    @classmethod
+    def from_snapshot(
+            cls, creditor: 'FrozenCreditor', creation_date: datetime = None, name: str = None,
+            duplicates: str = DUPLICATES_IGNORE, columnar: bool = False
+    ) -> 'Document':
+        """
+        Build a document from a snapshot of the creditor data instead of the
+        Odoo objects, e.g. in a process that has no access to the database
+
+        :param creditor: the creditor data
+        :type creditor: class:`FrozenCreditor`
+        :param creation_date: creation date of the document, defaults to now
+        :type creation_date: datetime
+        :param name: the "Nome supporto", defaults to the one built from the
+         creation date and the SIA code
+        :type name: str
+        :param duplicates: handling of the duplicated receipts, see
+         class:`Document`
+        :type duplicates: str
+        :param columnar: store the receipts in columns, see class:`Document`
+        :type columnar: bool
+        :returns: the new document, without receipts
+        :rtype: class:`Document`
+        """
+        doc = cls.__new__(cls)
+        doc._creditor_company = None
+        doc._creditor_bank_account = None
+        doc._setup(creditor, creation_date or datetime.now(), duplicates, columnar)
+        doc._name = name
+        return doc
+    # end from_snapshot
+
+    def _setup(
+            self, creditor: 'FrozenCreditor', creation_date: datetime, duplicates: str, columnar: bool
+    ):
+
         # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
         # Fields initialization
         # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
 
-        self._creditor_company = creditor_company
-        self._creditor_bank_account = creditor_bank_account
-        self._creation_date = datetime.now()
+        self._creditor = creditor
+        self._creation_date = creation_date
+        self._name = None
+
+        if columnar:
+            from .table import ReceiptTable
+            self._receipts = ReceiptTable()
+        else:
+            self._receipts = list()
+        # end if
+
+        # Running totals of the receipts, updated by add_receipt()
+        self._total_amount_cents = 0
+
+        # Creditor data formatted for the CBI records, computed on first use
+        self._creditor_segments = None
 
-        self._receipts = list()
+        # Set when an asynchronous rendering of the document is cancelled
+        self._cancel_event = None
+
+        # Blocks of records kept by the incremental rendering
+        self._rendered_blocks = None
+
+        # Snapshots of the receipts read by the incremental rendering:
+        # id of the receipt -> receipt, snapshot. Columnar documents read
+        # their columns, they don't need them
+        self._receipt_snapshots = dict()
+
+        # Index of the receipts used to detect the duplicates
+        if duplicates not in DUPLICATES_POLICIES:
+            raise ValueError(
+                f'Invalid duplicates policy "{duplicates}", '
+                f'valid policies are: {", ".join(DUPLICATES_POLICIES)}'
+            )
+        # end if
+        self._duplicates_policy = duplicates
+        self._duplicates_index = None
+        if duplicates != DUPLICATES_IGNORE:
+            from .duplicates import DuplicateIndex
+            self._duplicates_index = DuplicateIndex()
+        # end if
 
         # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
         # Sanity checks
         # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
 
         # CAB and ABI required
-        creditor_iban = self._creditor_bank_account.sanitized_acc_number.replace(
-            ' ', ''
-        ).upper()
+        creditor_iban = creditor.creditor_bank_iban
 
         self._creditor_bank_abi = creditor_iban[5:10]
         self._creditor_bank_cab = creditor_iban[10:15]
@@ -455,30 +920,32 @@ class Document:
 
         # Validate ZIP code
         validate_zip(self.creditor_company_addr_zip)
-    # end __init__
+    # end _setup
 
     @property
     def creditor_company(self):
         return self._creditor_company
     # end creditor_company
 
+    @property
+    def creditor_snapshot(self) -> 'FrozenCreditor':
+        """The creditor data of the document, detached from the Odoo objects"""
+        return self._creditor
+    # end creditor_snapshot
+
     @property
     def creditor_company_name(self):
-        return self._creditor_company.partner_id.name
+        return self._creditor.creditor_company_name
     # end creditor_company
 
     @property
     def creditor_fiscalcode(self):
-        return self._creditor_company.partner_id.fiscalcode
+        return self._creditor.creditor_fiscalcode
     # end creditor_fiscalcode
 
     @property
     def creditor_vat_number(self):
-        if not self._creditor_company.partner_id.vat:
-            return False
-        else:
-            return self._creditor_company.partner_id.vat
-        # end if
+        return self._creditor.creditor_vat_number
     # end creditor_vat_number
 
     @property
@@ -498,40 +965,37 @@ class Document:
 
     @property
     def creditor_company_ref(self):
-        return self._creditor_company.partner_id.ref or ''
+        return self._creditor.creditor_company_ref
     # end creditor_company
 
     @property
     def creditor_company_addr_street(self):
-        return self._creditor_company.partner_id.street or ''
+        return self._creditor.creditor_company_addr_street
     # end creditor_company
 
     @property
     def creditor_company_addr_zip(self):
-        zip_code = self._creditor_company.partner_id.zip or ''
-        return zip_code
+        return self._creditor.creditor_company_addr_zip
     # end creditor_company
 
     @property
     def creditor_company_addr_city(self):
-        city = self._creditor_company.partner_id.city or ''
-        return city
+        return self._creditor.creditor_company_addr_city
     # end creditor_company
 
     @property
     def creditor_company_addr_state(self):
-        state = self._creditor_company.partner_id.state_id or False
-        return state and state.code or ''
+        return self._creditor.creditor_company_addr_state
     # end creditor_company
 
     @property
     def creditor_company_addr_zip_city_state(self):
-        zip_code = self._creditor_company.partner_id.zip or ''
-        city = self._creditor_company.partner_id.city or ''
-        state = self._creditor_company.partner_id.state_id or False
+        zip_code = self.creditor_company_addr_zip
+        city = self.creditor_company_addr_city
+        state = self.creditor_company_addr_state
         
         if state:
-            return f'{zip_code} {city} {state.code}'
+            return f'{zip_code} {city} {state}'
         else:
             return f'{zip_code} {city}'
         # end if
@@ -554,9 +1018,23 @@ class Document:
 
     @property
     def creditor_bank_name(self):
-        return self._creditor_bank_account.bank_name
+        return self._creditor.creditor_bank_name
     # end creditor_bank_account
 
+    @property
+    def creditor_segments(self) -> 'CreditorSegments':
+        """The segments of the CBI records containing the creditor data,
+        already formatted. The creditor data is the same for all the
+        receipts, so it gets formatted only once for each document."""
+        if self._creditor_segments is None:
+            from .records.cbi import CREDITOR_FIELDS, build_creditor_segments
+            self._creditor_segments = build_creditor_segments(
+                {name: getattr(self, name) for name in CREDITOR_FIELDS}
+            )
+        # end if
+        return self._creditor_segments
+    # end creditor_segments
+
     @property
     def creation_date(self):
         return self._creation_date
@@ -564,87 +1042,660 @@ class Document:
 
     @property
     def sia_code(self):
-        return str(self._creditor_company.sia_code).strip()
+        return self._creditor.sia_code
     # end sia_code
 
     @property
     def name(self):
         """Return the "Nome supporto" as specified in the reference
          document CBI-ICI-001 Versione: v. 6.01"""
-        return self._creation_date.strftime('%d%m%y%H%M%S') + str(self.sia_code)
+        if self._name:
+            return self._name
+        # end if
+        return naming.support_name(self._creation_date, self.sia_code)
     # end support_name
 
     @property
     def total_amount(self):
-        # Since this function will probably be called just one time the
-        # computation can be done on the fly without any negative
-        # performance impact
-        receipts_amounts = map(lambda line: line.amount, self._receipts)
-        total_amount = sum(receipts_amounts)
-        return total_amount
+        """Total amount of the receipts in Euro"""
+        return from_cents(self._total_amount_cents)
     # end total_amount
 
+    @property
+    def total_amount_cents(self) -> int:
+        """Total amount of the receipts in cents of Euro"""
+        return self._total_amount_cents
+    # end total_amount_cents
+
+    @property
+    def receipts_count(self) -> int:
+        return len(self._receipts)
+    # end receipts_count
+
+    @property
+    def columnar(self) -> bool:
+        """True if the receipts are stored in a class:`ribalta.table.ReceiptTable`"""
+        # The table module is imported only by columnar documents
+        return not isinstance(self._receipts, list)
+    # end columnar
+
+    @property
+    def receipts(self) -> typing.Tuple[Receipt, ...]:
+        """The receipts of the document, in the order they were added"""
+        return tuple(self._receipts)
+    # end receipts
+
+    @property
+    def duplicates(self) -> typing.List['Duplicate']:
+        """The duplicated receipts, see class:`ribalta.duplicates.Duplicate`.
+        Unless the duplicates are checked while the receipts are added (see
+        the duplicates argument of the constructor) the receipts are checked
+        now, in a single pass"""
+        if self._duplicates_index is None:
+            from .duplicates import find_duplicates
+            return find_duplicates(self._receipts)
+        # end if
+        duplicates = self._duplicates_index.duplicates
+        if self.columnar:
+            # The rows indexed before a removal read the following receipt
+            duplicates = [
+                duplicate._replace(
+                    receipt=self._receipts[duplicate.position],
+                    original=self._receipts[duplicate.original_position],
+                )
+                for duplicate in duplicates
+            ]
+        # end if
+        return duplicates
+    # end duplicates
+
     def add_receipt(self, rcpt: Receipt):
         """
         Add a receipt to the RiBa document
         :return: nothing
         """
+        if self._duplicates_policy == DUPLICATES_RAISE:
+            duplicate = self._duplicates_index.check(rcpt)
+            if duplicate is not None:
+                raise DuplicateReceiptError(_('Duplicated receipt: ') + str(duplicate))
+            # end if
+        # end if
+
         self._receipts.append(rcpt)
+
+        if self._duplicates_index is not None:
+            # The stored receipt: a row of the table for columnar documents
+            self._duplicates_index.add(self._receipts[-1])
+        # end if
+
+        self._total_amount_cents += rcpt.amount_cents
     # end add_line
 
-    def render_cbi(self, group: bool = False):
+    def remove_receipt(self, position: int) -> Receipt:
+        """
+        Remove a receipt from the RiBa document. The following receipts
+        move back by one position; when duplicates are checked only the
+        receipts sharing the move line or the fingerprint of the removed
+        one are checked again, against the remaining receipts.
+        :param position: position of the receipt (from 0, negative values
+         count from the end)
+        :return: the removed receipt (a snapshot for columnar documents)
+        :raises IndexError: if there's no receipt at the position
+        """
+        rcpt = self._receipts[position]
+        if self.columnar:
+            # The row reads the table, which is going to change
+            rcpt = rcpt.snapshot()
+        # end if
+
+        del self._receipts[position]
+        self._receipt_snapshots.pop(id(rcpt), None)
+
+        if self._duplicates_index is not None:
+            self._duplicates_index.remove(position)
+        # end if
+
+        self._total_amount_cents -= rcpt.amount_cents
+
+        return rcpt
+    # end remove_receipt
+
+    def dispositions(
+            self, group: typing.Union[bool, 'grouping.GroupingPolicy'] = False
+    ) -> typing.List[typing.Union[Receipt, 'ReceiptGroup']]:
+        """
+        Return the lines rendered as disposizioni, in the order they're
+        rendered: the progressive number of each disposizione is its
+        position in the list, starting from 1
+        :param group: True to group the receipts with the same debtor, bank
+         and duedate or a grouping policy from :mod:`ribalta.grouping`
+        :return: the receipts or, if grouping is requested, the groups
+        :rtype: list of class:`Receipt` or class:`ReceiptGroup`
+        """
+        return list(self._lines(group))
+    # end dispositions
+
+    def split(
+            self, max_receipts: int,
+            group: typing.Union[bool, 'grouping.GroupingPolicy'] = False,
+            names: 'naming.SupportNameRegistry' = None
+    ) -> typing.List['Document']:
+        """
+        Split the document into supports containing at most max_receipts
+        disposizioni each. Grouped receipts are rendered as a single
+        disposizione, so the groups are never split across supports: the
+        supports must be rendered with the same group argument.
+        Each support gets a unique "Nome supporto", made of the name of this
+        document followed by a sequence number.
+        :param max_receipts: maximum number of disposizioni in each support
+        :param group: True to group the receipts with the same debtor, bank
+         and duedate or a grouping policy from :mod:`ribalta.grouping`
+        :param names: the registry reserving the names of the supports,
+         defaults to the one of the process (see :mod:`ribalta.utils.naming`)
+        :return: the supports, this document itself if no split is needed
+        :rtype: list of class:`Document`
+        """
+
+        if max_receipts < 1:
+            raise ValueError(f'Invalid number of receipts for each support: {max_receipts}')
+        # end if
+
+        from . import grouping
+
+        # Receipts rendered as a single disposizione
+        if callable(group):
+            blocks = grouping.group(self._receipts, group)
+        elif group:
+            blocks = grouping.group(self._receipts, grouping.by_debtor_bank_duedate)
+        else:
+            blocks = [[rcpt] for rcpt in self._receipts]
+        # end if
+
+        if len(blocks) <= max_receipts:
+            return [self]
+        # end if
+
+        chunks = [
+            blocks[start:start + max_receipts]
+            for start in range(0, len(blocks), max_receipts)
+        ]
+        names = (names or naming.support_names).reserve(self.name, len(chunks))
+
+        supports = list()
+        for name, chunk in zip(names, chunks):
+            support = Document.from_snapshot(
+                self._creditor, self._creation_date, name, columnar=self.columnar
+            )
+            support._creditor_company = self._creditor_company
+            support._creditor_bank_account = self._creditor_bank_account
+            for block in chunk:
+                for rcpt in block:
+                    support.add_receipt(rcpt)
+                # end for
+            # end for
+            supports.append(support)
+        # end for
+
+        return supports
+    # end split
+
+    def render_cbi(
+            self,
+            group: typing.Union[bool, 'grouping.GroupingPolicy'] = False,
+            backend: str = None,
+            profiler: RenderProfiler = None,
+            cache: 'RenderCache' = None,
+            incremental: bool = False
+    ):
         """
         Render the RiBa document in the CBI format
+        :param group: True to group the receipts with the same debtor, bank
+         and duedate or a grouping policy from :mod:`ribalta.grouping`
+        :param backend: the rendering backend, RENDER_BACKEND_MAKO (the
+         default) to render using the Mako template or RENDER_BACKEND_RECORDS
+         to render using the records layouts (faster, same output)
+        :param profiler: records the duration of the grouping and of the
+         rendering, see :mod:`ribalta.profiling`
+        :param cache: reuse the records of the disposizioni rendered for a
+         document with the same creditor and receipts, see :mod:`ribalta.cache`;
+         the records are always rendered using the records layouts
+        :param incremental: keep the records of each disposizione in the
+         document and render again only the disposizioni changed since the
+         previous incremental rendering (e.g. previews refreshed while the
+         receipts are added or removed); the records are rendered using the
+         records layouts, only RENDER_BACKEND_RECORDS can be requested. The
+         fields of each receipt are read once, when it's first rendered:
+         receipts changed after they were added must be removed and added
+         again
         :return: the CBI document representing the RiBa document
         :rtype: str
         """
-        
-        # Load the Mako template
-        cbi_template = Template(
-            text=importlib.resources.read_text(__package__ + '.templates', CBI_TEMPLATE_FILE)
+
+        if backend is None:
+            backend = RENDER_BACKEND_RECORDS if incremental else RENDER_BACKEND_MAKO
+        # end if
+
+        if backend not in RENDER_BACKENDS:
+            raise ValueError(
+                f'Invalid rendering backend "{backend}", '
+                f'valid backends are: {", ".join(RENDER_BACKENDS)}'
+            )
+        # end if
+
+        if incremental:
+            if cache is not None:
+                raise ValueError('A cache can\'t be used by the incremental rendering')
+            # end if
+            if backend != RENDER_BACKEND_RECORDS:
+                raise ValueError(f'The incremental rendering uses the "{RENDER_BACKEND_RECORDS}" backend')
+            # end if
+            return self._render_incremental(group, profiler or NULL_PROFILER)
+        # end if
+
+        if cache is not None:
+            # Imported here: hashlib and tempfile are needed only with a cache
+            from .cache import render_cached
+            return render_cached(self, cache, group, profiler)
+        # end if
+
+        profiler = profiler or NULL_PROFILER
+
+        lines_for_template = self._profiled_lines(group, profiler)
+
+        with profiler.phase(PHASE_RENDERING, len(lines_for_template)):
+            if backend == RENDER_BACKEND_RECORDS:
+                return self._records_renderer().render(lines_for_template)
+            # end if
+
+            # Get the compiled Mako template from the process-wide cache
+            cbi_template = get_template(CBI_TEMPLATE_FILE)
+
+            try:
+                cbi_document = cbi_template.render(doc=self, lines=lines_for_template)
+                return cbi_document
+
+            except RenderCancelledError:
+                # Not an error of the template
+                raise
+
+            except Exception as e:
+                from mako import exceptions
+                render_error_msg = exceptions.text_error_template().render()
+
+                _logger.error(render_error_msg)
+                print(render_error_msg)
+
+                raise e
+
+            # end try / except
+        # end with
+    # end render
+
+    def render_cbi_bytes(
+            self, group: typing.Union[bool, 'grouping.GroupingPolicy'] = False,
+            profiler: RenderProfiler = None
+    ) -> memoryview:
+        """
+        Render the RiBa document in the CBI format as ASCII bytes, in a
+        buffer allocated in advance with the exact size of the document:
+        the records of each disposizione are formatted as a string, encoded
+        and copied into the buffer, so the string of the whole document is
+        never built. The result can be written to a file or stored as an
+        attachment without further copies.
+        :param group: True to group the receipts with the same debtor, bank
+         and duedate or a grouping policy from :mod:`ribalta.grouping`
+        :param profiler: records the duration of the grouping and of the
+         rendering, see :mod:`ribalta.profiling`
+        :return: a view of the buffer containing the CBI document
+        :rtype: memoryview
+        """
+        profiler = profiler or NULL_PROFILER
+
+        lines = self._profiled_lines(group, profiler)
+
+        with profiler.phase(PHASE_RENDERING, len(lines)):
+            return self._records_renderer().render_bytes(lines)
+        # end with
+    # end render_cbi_bytes
+
+    async def render_cbi_async(
+            self,
+            group: typing.Union[bool, 'grouping.GroupingPolicy'] = False,
+            backend: str = RENDER_BACKEND_MAKO,
+            executor=None
+    ) -> str:
+        """
+        Render the RiBa document in the CBI format without blocking the
+        event loop: the document is copied to a snapshot (see
+        :meth:`snapshot`) in the calling thread, since the Odoo objects can't
+        be used from other threads, and the snapshot is rendered by the
+        executor. The result is the same returned by :meth:`render_cbi`.
+
+        Cancelling the awaiting task stops a rendering running in a thread
+        within CANCEL_CHECK_INTERVAL lines. A rendering running in another
+        process can be cancelled only if it didn't start yet, and the
+        grouping policy (if any) must be picklable.
+        :param group: True to group the receipts with the same debtor, bank
+         and duedate or a grouping policy from :mod:`ribalta.grouping`
+        :param backend: the rendering backend, see :meth:`render_cbi`
+        :param executor: a class:`concurrent.futures.ThreadPoolExecutor` or
+         class:`concurrent.futures.ProcessPoolExecutor`, defaults to the
+         default executor of the event loop
+        :return: the CBI document representing the RiBa document
+        :rtype: str
+        """
+
+        # asyncio is imported only by the applications actually using it
+        import asyncio
+
+        snapshot = self.snapshot()
+
+        # Events can't be sent to other processes
+        cancel_event = None if _is_process_pool(executor) else threading.Event()
+
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(
+            executor, _render_snapshot, snapshot, group, backend, cancel_event
         )
 
-        # Group the receipts if requested
-        if group:
-            receipt_groups = self._group_receipts()
-            lines_for_template = receipt_groups
+        try:
+            return await future
+        except asyncio.CancelledError:
+            if cancel_event is not None:
+                cancel_event.set()
+            # end if
+            raise
+        # end try / except
+    # end render_cbi_async
+
+    def snapshot(self) -> 'Document':
+        """
+        Return a copy of the document holding only snapshots of the creditor
+        data and of the receipts, that can be rendered in other threads or
+        sent to other processes
+        :return: the copy of the document
+        :rtype: class:`Document`
+        """
+        doc = Document.from_snapshot(
+            self._creditor, self._creation_date, self._name, columnar=self.columnar
+        )
+        if self.columnar:
+            # The columns hold plain values already
+            doc._receipts = self._receipts.copy()
+            doc._total_amount_cents = self._total_amount_cents
         else:
-            lines_for_template = self._receipts
+            for rcpt in self._receipts:
+                doc.add_receipt(rcpt.snapshot())
+            # end for
         # end if
+        return doc
+    # end snapshot
 
-        try:
-            cbi_document = cbi_template.render(doc=self, lines=lines_for_template)
-            return cbi_document
+    def iter_cbi_records(
+            self, group: typing.Union[bool, 'grouping.GroupingPolicy'] = False
+    ) -> typing.Iterator[str]:
+        """
+        Render the RiBa document in the CBI format one record at a time.
+        The records are generated one receipt at a time and the EF record
+        is computed from running counters, so the whole document is never
+        held in memory.
+        :param group: True to group the receipts with the same debtor, bank
+         and duedate or a grouping policy from :mod:`ribalta.grouping`
+        :return: iterator over the records of the CBI document, each record
+         includes its terminator
+        :rtype: Iterator of str
+        """
+        return self._records_renderer().iter_records(self._lines(group))
+    # end iter_cbi_records
+
+    def write_cbi(
+            self, fp,
+            group: typing.Union[bool, 'grouping.GroupingPolicy'] = False,
+            encoding: str = 'ascii',
+            profiler: RenderProfiler = None
+    ) -> int:
+        """
+        Render the RiBa document in the CBI format writing the records
+        to a file-like object as soon as they are generated
+        :param fp: the destination, a text or binary file-like object
+         (e.g. an open file or the result of socket.makefile('wb'))
+        :param group: True to group the receipts with the same debtor, bank
+         and duedate or a grouping policy from :mod:`ribalta.grouping`
+        :param encoding: encoding used when writing to binary destinations
+        :param profiler: records the duration of the grouping and of the
+         rendering and writing of the records, see :mod:`ribalta.profiling`
+        :return: the number of records written
+        :rtype: int
+        """
+
+        if isinstance(fp, io.TextIOBase):
+            def write(record): fp.write(record)
+        else:
+            def write(record): fp.write(record.encode(encoding))
+        # end if
 
-        except Exception as e:
-            render_error_msg = exceptions.text_error_template().render()
+        profiler = profiler or NULL_PROFILER
 
-            _logger.error(render_error_msg)
-            print(render_error_msg)
+        lines = self._profiled_lines(group, profiler)
 
-            raise e
+        records_count = 0
+        with profiler.phase(PHASE_WRITING) as phase:
+            for record in self._records_renderer().iter_records(lines):
+                write(record)
+                records_count += 1
+            # end for
+            phase.items = records_count
+        # end with
 
-        # end try / except
-    # end render
+        return records_count
+    # end write_cbi
     
     # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
     # Private methods
     # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
-    def _group_receipts(self):
-        
-        # Sort the receipts
-        def key_f(x): return x.grouping_key
-        
-        # Sort the receipts
-        rcpt_sorted = sorted(self._receipts, key=key_f)
-        
-        # Group the receipts (same debtor and same duedate)
-        rcpt_groups = [
-            # 'g' must be converted to a list because it's just an iterator
-            ReceiptGroup(list(g))
-            for _, g in itertools.groupby(rcpt_sorted, key=key_f)
+    def _lines(self, group: typing.Union[bool, 'grouping.GroupingPolicy']):
+        """Return the lines to be rendered: the receipts or, if grouping
+        is requested, the groups of receipts"""
+        if callable(group):
+            lines = self._group_receipts(group)
+        elif group:
+            lines = self._group_receipts()
+        else:
+            lines = self._receipts
+        # end if
+
+        if self._cancel_event is not None:
+            lines = _CancellableLines(lines, self._cancel_event)
+        # end if
+
+        return lines
+    # end _lines
+
+    def _profiled_lines(self, group, profiler) -> typing.Sequence:
+        """Return the lines to be rendered recording the grouping phase"""
+        with profiler.phase(PHASE_GROUPING, len(self._receipts)):
+            return self._lines(group)
+        # end with
+    # end _profiled_lines
+
+    def _render_incremental(self, group, profiler: RenderProfiler) -> str:
+        """Render the document reusing the blocks of records of the
+        previous incremental rendering with the same grouping"""
+
+        from .cache import grouping_name
+
+        # Policies with the same name group in the same way, even when they
+        # are different objects (e.g. built by grouping.by_duedate_window)
+        group_key = grouping_name(group) or group
+
+        blocks = self._rendered_blocks
+        if blocks is None or blocks.group_key != group_key:
+            blocks = self._rendered_blocks = _RenderedBlocks(group_key)
+        # end if
+
+        lines = self._profiled_lines(group, profiler)
+        renderer = self._records_renderer()
+
+        with profiler.phase(PHASE_RENDERING) as phase:
+            phase.items = blocks.update(renderer, lines, self._receipt_snapshot)
+            return (
+                renderer.header()
+                + blocks.body
+                + renderer.trailer(len(lines), self._total_amount_cents)
+            )
+        # end with
+    # end _render_incremental
+
+    def _receipt_snapshot(self, rcpt) -> 'FrozenReceipt':
+        """The snapshot of a receipt of the document, built once for each
+        receipt object: the Odoo objects are read only for new receipts"""
+
+        if self.columnar:
+            return rcpt.snapshot()
+        # end if
+
+        cached = self._receipt_snapshots.get(id(rcpt))
+        if cached is None:
+            # The receipt is kept too, so its id isn't reused
+            cached = self._receipt_snapshots[id(rcpt)] = (rcpt, rcpt.snapshot())
+        # end if
+        return cached[1]
+    # end _receipt_snapshot
+
+    def _records_renderer(self) -> 'CBIRecordsRenderer':
+        from .records import CBIRecordsRenderer
+        return CBIRecordsRenderer(self)
+    # end _records_renderer
+
+    def _group_receipts(self, policy: 'grouping.GroupingPolicy' = None):
+        from . import grouping
+
+        # Group the receipts in linear time, keeping the order of the receipts
+        return [
+            ReceiptGroup(receipts)
+            for receipts in grouping.group(self._receipts, policy or grouping.by_debtor_bank_duedate)
         ]
-        
-        return rcpt_groups
     # end _group_receipts
 # end Document
+
+
+class _RenderedBlocks:
+    """Records of the disposizioni of a document rendered with a grouping,
+    kept for each position with the snapshot of the line they were rendered
+    from: a block is rendered again only when a different line takes its
+    position"""
+
+    def __init__(self, group_key):
+        # Name of the grouping, see func:`ribalta.cache.grouping_name`, or
+        # the policy itself when it has no name
+        self.group_key = group_key
+        self._snapshots = list()
+        self._blocks = list()
+        # The blocks joined, None when a block changed
+        self._body = None
+    # end __init__
+
+    @property
+    def body(self) -> str:
+        """The records of all the disposizioni"""
+        if self._body is None:
+            self._body = ''.join(self._blocks)
+        # end if
+        return self._body
+    # end body
+
+    def update(
+            self, renderer: 'CBIRecordsRenderer', lines: typing.Sequence,
+            receipt_snapshot: typing.Callable[[typing.Any], 'FrozenReceipt']
+    ) -> int:
+        """Render the blocks of the lines that changed, from the snapshots
+        of their receipts, and return their number"""
+
+        snapshots = self._snapshots
+        blocks = self._blocks
+
+        # Removed lines
+        if len(lines) < len(blocks):
+            del snapshots[len(lines):]
+            del blocks[len(lines):]
+            self._body = None
+        # end if
+
+        rendered = 0
+        for position, line in enumerate(lines):
+            if isinstance(line, ReceiptGroup):
+                snapshot = tuple(receipt_snapshot(rcpt) for rcpt in line.grouped_receipts)
+            else:
+                snapshot = receipt_snapshot(line)
+            # end if
+
+            if position < len(snapshots):
+                previous = snapshots[position]
+                if previous is snapshot or previous == snapshot:
+                    continue
+                # end if
+            # end if
+
+            if isinstance(snapshot, tuple):
+                block = renderer.render_block(ReceiptGroup(list(snapshot)), position + 1)
+            else:
+                block = renderer.render_block(snapshot, position + 1)
+            # end if
+
+            if position < len(snapshots):
+                snapshots[position] = snapshot
+                blocks[position] = block
+            else:
+                snapshots.append(snapshot)
+                blocks.append(block)
+            # end if
+            rendered += 1
+        # end for
+
+        if rendered:
+            self._body = None
+        # end if
+
+        return rendered
+    # end update
+# end _RenderedBlocks
+
+
+class _CancellableLines(list):
+    """Lines of a document raising RenderCancelledError while they're
+    iterated as soon as the rendering is cancelled"""
+
+    def __init__(self, lines, cancel_event: threading.Event):
+        super().__init__(lines)
+        self._cancel_event = cancel_event
+    # end __init__
+
+    def __iter__(self):
+        cancel_event = self._cancel_event
+        for index, line in enumerate(super().__iter__()):
+            if index % CANCEL_CHECK_INTERVAL == 0 and cancel_event.is_set():
+                raise RenderCancelledError(_('Rendering of the RiBa document cancelled'))
+            # end if
+            yield line
+        # end for
+    # end __iter__
+# end _CancellableLines
+
+
+def _render_snapshot(
+        doc: Document, group, backend: str, cancel_event: threading.Event = None
+) -> str:
+    """Render a snapshot of a document, run by the executors of
+    :meth:`Document.render_cbi_async`"""
+    doc._cancel_event = cancel_event
+    return doc.render_cbi(group, backend)
+# end _render_snapshot
+
+
+def _is_process_pool(executor) -> bool:
+    if executor is None:
+        return False
+    # end if
+    from concurrent.futures import ProcessPoolExecutor
+    return isinstance(executor, ProcessPoolExecutor)
+# end _is_process_pool
@@ -0,0 +1,645 @@
+"""Columnar storage of the receipts of very large documents.
+
+A class:`ReceiptTable` stores the fields of the receipts in columns instead
+of keeping an object for each receipt:
+
+- amounts in cents and move line ids as 64 bit integers;
+- due dates and invoice dates as ordinals, ABI and CAB as 32 bit integers;
+- the fields that are different for almost every receipt (invoice numbers,
+  communications, addresses) as UTF-8 text written one after the other in a
+  single buffer, each receipt holding the offset where its text ends;
+- the other fields (names, fiscal codes, banks...) dictionary-encoded: each
+  distinct value is stored once and each receipt holds a 32 bit code.
+
+The columns are class:`array.array` objects, so no per-receipt object is
+kept in memory. Values that can't be encoded (e.g. ABI codes that aren't
+five digits or missing due dates) are stored as INVALID_CODE, with the
+original value kept apart: the table stores any receipt, the errors are
+reported by the validators as for the other documents. When NumPy is installed the numeric columns are also
+available as NumPy arrays (see :meth:`ReceiptTable.column`) and the totals
+are computed by NumPy.
+
+Iterating the table returns class:`ReceiptRow` objects: light cursors
+holding only the table and the position of the receipt, exposing the same
+attributes of class:`ribalta.riba.FrozenReceipt`, so they can be grouped and
+rendered like any other receipt. Due dates are returned as class:`date`
+objects and amounts as class:`Decimal` objects.
+
+    riba_doc = Document(company, bank_account, columnar=True)
+"""
+
+from array import array
+from datetime import date, datetime
+import typing
+
+from .utils.money import from_cents
+
+
+# Type codes of the numeric columns
+INT64 = 'q'
+INT32 = 'i'
+
+# Numeric columns: name -> type code
+NUMERIC_COLUMNS = {
+    'amount_cents': INT64,
+    'move_line_id': INT64,
+    'duedate': INT32,
+    'invoice_date': INT32,
+    'debtor_bank_abi': INT32,
+    'debtor_bank_cab': INT32,
+}
+
+# Dictionary-encoded columns: few distinct values
+DICTIONARY_COLUMNS = (
+    'debtor_partner_id',
+    'debtor_name',
+    'debtor_client_code',
+    'debtor_fiscalcode',
+    'debtor_vat_number',
+    'debtor_fiscode_or_vat',
+    'debtor_city',
+    'debtor_state',
+    'debtor_zip',
+    'debtor_bank_name',
+)
+
+# Text columns: a different value for (almost) every receipt
+TEXT_COLUMNS = (
+    'debtor_address',
+    'invoice_number',
+    'communication',
+)
+
+# Encoding of the buffers of the text columns
+TEXT_ENCODING = 'utf-8'
+
+# Number of digits of the ABI and CAB codes
+BANK_CODE_DIGITS = 5
+
+# Value of the numeric columns for the values that can't be encoded
+INVALID_CODE = -1
+
+# NumPy dtypes of the type codes
+_NUMPY_DTYPES = {INT64: 'int64', INT32: 'int32'}
+
+# NumPy module, False until the first import attempt
+_numpy_module = False
+
+
+def _numpy():
+    """NumPy, imported on first use, None if it's not installed"""
+    global _numpy_module
+    if _numpy_module is False:
+        try:
+            import numpy
+        except ImportError:
+            numpy = None
+        # end try / except
+        _numpy_module = numpy
+    # end if
+    return _numpy_module
+# end _numpy
+
+
+class DictionaryColumn:
+    """
+    Column storing each distinct value once, the rows hold the codes of the
+    values
+
+    :param values: initial values of the column
+    """
+
+    __slots__ = ('codes', 'values', '_index', '_bool_index')
+
+    def __init__(self, values: typing.Iterable = ()):
+        self.codes = array(INT32)
+        self.values = list()
+
+        # Value -> code. False and 0 (or True and 1) are equal but must be
+        # kept distinct: the booleans have their own index
+        self._index = dict()
+        self._bool_index = dict()
+
+        for value in values:
+            self.append(value)
+        # end for
+    # end __init__
+
+    def append(self, value) -> None:
+        index = self._bool_index if value.__class__ is bool else self._index
+        code = index.get(value)
+        if code is None:
+            code = len(self.values)
+            self.values.append(value)
+            index[value] = code
+        # end if
+        self.codes.append(code)
+    # end append
+
+    def copy(self) -> 'DictionaryColumn':
+        column = DictionaryColumn()
+        column.codes = array(INT32, self.codes)
+        column.values = list(self.values)
+        column._index = dict(self._index)
+        column._bool_index = dict(self._bool_index)
+        return column
+    # end copy
+
+    def reindex(self) -> None:
+        """Rebuild the index of the values, e.g. after unpickling"""
+        self._index.clear()
+        self._bool_index.clear()
+        for code, value in enumerate(self.values):
+            index = self._bool_index if value.__class__ is bool else self._index
+            index[value] = code
+        # end for
+    # end reindex
+
+    def __getitem__(self, index: int):
+        return self.values[self.codes[index]]
+    # end __getitem__
+
+    def __len__(self):
+        return len(self.codes)
+    # end __len__
+# end DictionaryColumn
+
+
+class TextColumn:
+    """
+    Column storing the values one after the other in a single buffer of
+    UTF-8 text: each row costs the length of its text plus the offset where
+    it ends. The values that aren't strings (e.g. False for empty Odoo
+    fields) are kept apart.
+
+    :param values: initial values of the column
+    """
+
+    __slots__ = ('ends', 'buffer', 'others')
+
+    def __init__(self, values: typing.Iterable = ()):
+        self.ends = array(INT64)
+        self.buffer = bytearray()
+
+        # Row -> value, for the values that aren't strings
+        self.others = dict()
+
+        for value in values:
+            self.append(value)
+        # end for
+    # end __init__
+
+    def append(self, value) -> None:
+        if isinstance(value, str):
+            self.buffer += value.encode(TEXT_ENCODING)
+        else:
+            self.others[len(self.ends)] = value
+        # end if
+        self.ends.append(len(self.buffer))
+    # end append
+
+    def copy(self) -> 'TextColumn':
+        column = TextColumn()
+        column.ends = array(INT64, self.ends)
+        column.buffer = bytearray(self.buffer)
+        column.others = dict(self.others)
+        return column
+    # end copy
+
+    @property
+    def memory_size(self) -> int:
+        """Size in bytes of the offsets and of the buffer"""
+        return self.ends.itemsize * len(self.ends) + len(self.buffer)
+    # end memory_size
+
+    def __getitem__(self, index: int):
+        if index in self.others:
+            return self.others[index]
+        # end if
+        start = self.ends[index - 1] if index else 0
+        return self.buffer[start:self.ends[index]].decode(TEXT_ENCODING)
+    # end __getitem__
+
+    def __delitem__(self, index: int) -> None:
+        ends = self.ends
+        start = ends[index - 1] if index else 0
+        length = ends[index] - start
+
+        del self.buffer[start:start + length]
+        del ends[index]
+        if length:
+            for row in range(index, len(ends)):
+                ends[row] -= length
+            # end for
+        # end if
+
+        self.others = {
+            row - (row > index): value for row, value in self.others.items() if row != index
+        }
+    # end __delitem__
+
+    def __len__(self):
+        return len(self.ends)
+    # end __len__
+# end TextColumn
+
+
+class ReceiptTable:
+    """
+    Columnar storage of receipts, see the module documentation
+
+    :param receipts: initial receipts of the table
+    :type receipts: iterable of class:`ribalta.riba.Receipt` or
+     class:`ribalta.riba.FrozenReceipt`
+    """
+
+    def __init__(self, receipts: typing.Iterable = ()):
+
+        self._numeric = {
+            name: array(type_code) for name, type_code in NUMERIC_COLUMNS.items()
+        }
+        self._dictionaries = {name: DictionaryColumn() for name in DICTIONARY_COLUMNS}
+        self._texts = {name: TextColumn() for name in TEXT_COLUMNS}
+
+        # Numeric column -> row -> value stored as INVALID_CODE
+        self._invalid = {name: dict() for name in NUMERIC_COLUMNS}
+
+        self._count = 0
+
+        for rcpt in receipts:
+            self.append(rcpt)
+        # end for
+    # end __init__
+
+    def append(self, rcpt) -> None:
+        """
+        Add a receipt to the table: its fields are read once, no reference
+        to the receipt is kept
+
+        :param rcpt: the receipt
+        """
+
+        numeric = self._numeric
+
+        # Read all the values before changing any column
+        raw_values = (
+            rcpt.amount_cents,
+            rcpt.move_line_id or 0,
+            rcpt.duedate,
+            rcpt.invoice_date,
+            rcpt.debtor_bank_abi,
+            rcpt.debtor_bank_cab,
+        )
+        amount_cents, move_line_id, duedate, invoice_date, abi, cab = raw_values
+        values = (
+            amount_cents,
+            move_line_id,
+            _date_to_ordinal(duedate),
+            _date_to_ordinal(invoice_date) if invoice_date else 0,
+            _encode_bank_code(abi),
+            _encode_bank_code(cab),
+        )
+        dictionary_values = [getattr(rcpt, name) for name in DICTIONARY_COLUMNS]
+        text_values = [getattr(rcpt, name) for name in TEXT_COLUMNS]
+
+        for name, value, raw_value in zip(NUMERIC_COLUMNS, values, raw_values):
+            if value is None:
+                self._invalid[name][self._count] = raw_value
+                value = INVALID_CODE
+            # end if
+            numeric[name].append(value)
+        # end for
+
+        for name, value in zip(DICTIONARY_COLUMNS, dictionary_values):
+            self._dictionaries[name].append(value)
+        # end for
+
+        for name, value in zip(TEXT_COLUMNS, text_values):
+            self._texts[name].append(value)
+        # end for
+
+        self._count += 1
+    # end append
+
+    def extend(self, receipts: typing.Iterable) -> None:
+        for rcpt in receipts:
+            self.append(rcpt)
+        # end for
+    # end extend
+
+    def __delitem__(self, index: int) -> None:
+        """Remove a receipt, the distinct values of the dictionaries are kept"""
+        if index < 0:
+            index += self._count
+        # end if
+        if not 0 <= index < self._count:
+            raise IndexError('receipt index out of range')
+        # end if
+
+        for column in self._numeric.values():
+            del column[index]
+        # end for
+        for column in self._dictionaries.values():
+            del column.codes[index]
+        # end for
+        for column in self._texts.values():
+            del column[index]
+        # end for
+        for name, invalid in self._invalid.items():
+            if invalid:
+                self._invalid[name] = {
+                    row - (row > index): value for row, value in invalid.items() if row != index
+                }
+            # end if
+        # end for
+
+        self._count -= 1
+    # end __delitem__
+
+    def copy(self) -> 'ReceiptTable':
+        """Return an independent copy of the table"""
+        table = ReceiptTable()
+        table._numeric = {name: array(col.typecode, col) for name, col in self._numeric.items()}
+        table._dictionaries = {name: col.copy() for name, col in self._dictionaries.items()}
+        table._texts = {name: col.copy() for name, col in self._texts.items()}
+        table._invalid = {name: dict(invalid) for name, invalid in self._invalid.items()}
+        table._count = self._count
+        return table
+    # end copy
+
+    def column(self, name: str):
+        """
+        Return a copy of a numeric column: a NumPy array if NumPy is
+        installed, an class:`array.array` otherwise
+
+        :param name: name of the column, one of NUMERIC_COLUMNS
+        :type name: str
+        :returns: the values of the column, dates are ordinals and ABI and
+         CAB are integers; the values that can't be encoded are INVALID_CODE
+        """
+        values = self._numeric[name]
+        numpy = _numpy()
+        if numpy is None:
+            return array(values.typecode, values)
+        # end if
+        return numpy.array(values, dtype=_NUMPY_DTYPES[values.typecode])
+    # end column
+
+    def dictionary(self, name: str) -> DictionaryColumn:
+        """
+        Return a dictionary-encoded column
+
+        :param name: name of the column, one of DICTIONARY_COLUMNS
+        :type name: str
+        :returns: the column, holding the codes and the distinct values
+        :rtype: class:`DictionaryColumn`
+        """
+        return self._dictionaries[name]
+    # end dictionary
+
+    @property
+    def total_amount_cents(self) -> int:
+        """Total amount of the receipts in cents of Euro"""
+        numpy = _numpy()
+        if numpy is None:
+            return sum(self._numeric['amount_cents'])
+        # end if
+        # The view on the column must be released before the column grows
+        amounts = self._numeric['amount_cents']
+        return int(numpy.frombuffer(amounts, dtype=_NUMPY_DTYPES[amounts.typecode]).sum())
+    # end total_amount_cents
+
+    def text(self, name: str) -> TextColumn:
+        """
+        Return a text column
+
+        :param name: name of the column, one of TEXT_COLUMNS
+        :type name: str
+        :rtype: class:`TextColumn`
+        """
+        return self._texts[name]
+    # end text
+
+    @property
+    def memory_size(self) -> int:
+        """Size in bytes of the columns, excluding the distinct values of
+        the dictionary-encoded columns"""
+        return sum(
+            col.itemsize * len(col) for col in self._numeric.values()
+        ) + sum(
+            col.codes.itemsize * len(col) for col in self._dictionaries.values()
+        ) + sum(
+            col.memory_size for col in self._texts.values()
+        )
+    # end memory_size
+
+    def __len__(self):
+        return self._count
+    # end __len__
+
+    def __getitem__(self, index: int) -> 'ReceiptRow':
+        if index < 0:
+            index += self._count
+        # end if
+        if not 0 <= index < self._count:
+            raise IndexError('receipt index out of range')
+        # end if
+        return ReceiptRow(self, index)
+    # end __getitem__
+
+    def __iter__(self) -> typing.Iterator['ReceiptRow']:
+        for index in range(self._count):
+            yield ReceiptRow(self, index)
+        # end for
+    # end __iter__
+
+    def __reduce__(self):
+        # Columns only, the indexes of the dictionaries are rebuilt
+        return _build_receipt_table, (
+            self._numeric,
+            {name: (col.codes, col.values) for name, col in self._dictionaries.items()},
+            {name: (col.ends, col.buffer, col.others) for name, col in self._texts.items()},
+            self._invalid,
+            self._count,
+        )
+    # end __reduce__
+# end ReceiptTable
+
+
+def _build_receipt_table(numeric, dictionaries, texts, invalid, count) -> ReceiptTable:
+    table = ReceiptTable()
+    table._numeric = numeric
+    for name, (codes, values) in dictionaries.items():
+        column = table._dictionaries[name]
+        column.codes = codes
+        column.values = values
+        column.reindex()
+    # end for
+    for name, (ends, buffer, others) in texts.items():
+        column = table._texts[name]
+        column.ends = ends
+        column.buffer = buffer
+        column.others = others
+    # end for
+    table._invalid = invalid
+    table._count = count
+    return table
+# end _build_receipt_table
+
+
+class ReceiptRow:
+    """
+    Cursor on a receipt of a class:`ReceiptTable`, exposing the same
+    attributes of class:`ribalta.riba.FrozenReceipt`. The values are read
+    from the columns on each access.
+    """
+
+    __slots__ = ('_table', '_index')
+
+    def __init__(self, table: ReceiptTable, index: int):
+        self._table = table
+        self._index = index
+    # end __init__
+
+    @property
+    def is_group(self):
+        return False
+    # end is_group
+
+    @property
+    def amount_cents(self) -> int:
+        return self._table._numeric['amount_cents'][self._index]
+    # end amount_cents
+
+    @property
+    def amount(self):
+        return from_cents(self.amount_cents)
+    # end amount
+
+    @property
+    def move_line_id(self):
+        return self._table._numeric['move_line_id'][self._index] or None
+    # end move_line_id
+
+    @property
+    def duedate(self) -> date:
+        ordinal = self._table._numeric['duedate'][self._index]
+        if ordinal == INVALID_CODE:
+            return self._table._invalid['duedate'][self._index]
+        # end if
+        return date.fromordinal(ordinal)
+    # end duedate
+
+    @property
+    def invoice_date(self):
+        ordinal = self._table._numeric['invoice_date'][self._index]
+        if ordinal == INVALID_CODE:
+            return self._table._invalid['invoice_date'][self._index]
+        # end if
+        return date.fromordinal(ordinal) if ordinal else False
+    # end invoice_date
+
+    @property
+    def debtor_bank_abi(self) -> str:
+        return self._bank_code('debtor_bank_abi')
+    # end debtor_bank_abi
+
+    @property
+    def debtor_bank_cab(self) -> str:
+        return self._bank_code('debtor_bank_cab')
+    # end debtor_bank_cab
+
+    def _bank_code(self, name: str) -> str:
+        code = self._table._numeric[name][self._index]
+        if code == INVALID_CODE:
+            return self._table._invalid[name][self._index]
+        # end if
+        return str(code).zfill(BANK_CODE_DIGITS)
+    # end _bank_code
+
+    @property
+    def grouping_key(self) -> tuple:
+        return (
+            str(self.debtor_partner_id),
+            self.debtor_bank_abi,
+            self.debtor_bank_cab,
+            self.duedate,
+        )
+    # end grouping_key
+
+    @property
+    def description(self) -> str:
+        if self.invoice_date:
+            return f'{self.invoice_number} ({self.invoice_date:%Y-%m-%d}) € {self.amount:.2f}'
+        else:
+            return f'{self.invoice_number} € {self.amount:.2f}'
+        # end if
+    # end description
+
+    def snapshot(self):
+        """Build a class:`ribalta.riba.FrozenReceipt` with the values of the row"""
+        from .riba import FrozenReceipt
+        return FrozenReceipt(**self.as_dict())
+    # end snapshot
+
+    def as_dict(self) -> typing.Dict[str, typing.Any]:
+        """Return the fields of the row, see class:`ribalta.riba.FrozenReceipt`"""
+        from .riba import FrozenReceipt
+        return {name: getattr(self, name) for name in FrozenReceipt.FIELDS}
+    # end as_dict
+
+    def __str__(self):
+        return (
+            f'{self.debtor_name} ({self.debtor_fiscode_or_vat}) - '
+            f'{self.invoice_number} - scad: {self.duedate:%Y-%m-%d} € {self.amount}'
+        )
+    # end __str__
+
+    def __repr__(self):
+        return f'<ReceiptRow {self._index}: {self}>'
+    # end __repr__
+# end ReceiptRow
+
+
+def _dictionary_property(name: str) -> property:
+    def getter(self):
+        column = self._table._dictionaries[name]
+        return column.values[column.codes[self._index]]
+    # end getter
+    return property(getter)
+# end _dictionary_property
+
+
+def _text_property(name: str) -> property:
+    def getter(self):
+        return self._table._texts[name][self._index]
+    # end getter
+    return property(getter)
+# end _text_property
+
+
+for _name in DICTIONARY_COLUMNS:
+    setattr(ReceiptRow, _name, _dictionary_property(_name))
+# end for
+for _name in TEXT_COLUMNS:
+    setattr(ReceiptRow, _name, _text_property(_name))
+# end for
+del _name
+
+
+def _date_to_ordinal(value) -> typing.Optional[int]:
+    """The ordinal of a date, None if the value isn't a date"""
+    if isinstance(value, datetime):
+        value = value.date()
+    # end if
+    return value.toordinal() if isinstance(value, date) else None
+# end _date_to_ordinal
+
+
+def _encode_bank_code(value) -> typing.Optional[int]:
+    """A bank code as an integer, None if it isn't made of five digits"""
+    if not isinstance(value, str) or len(value) != BANK_CODE_DIGITS or not value.isdigit():
+        return None
+    # end if
+    return int(value)
+# end _encode_bank_code
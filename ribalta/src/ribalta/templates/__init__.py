@@ -0,0 +1,114 @@
+"""Mako templates used to render the CBI documents.
+
+Compiling a Mako template means generating the Python source of the template
+module and compiling it: this is by far the most expensive step of the
+rendering of a small document, so the compiled templates are kept in a
+process-wide cache and, optionally, the generated modules are stored in a
+directory on disk so that new processes can skip the code generation too.
+
+Mako is imported only when the first template is compiled, so importing
+ribalta doesn't pay for it.
+"""
+
+import os
+import threading
+import typing
+
+if typing.TYPE_CHECKING:
+    from mako.template import Template
+# end if
+
+
+# Name of the Mako template file
+CBI_TEMPLATE_FILE = 'cbi.mako'
+
+# Name of the environment variable used to set the default directory where
+# Mako stores the Python modules generated from the templates
+MODULE_DIRECTORY_ENV_VAR = 'RIBALTA_TEMPLATES_MODULE_DIR'
+
+# Directory containing the templates files
+TEMPLATES_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+
+# Process-wide cache of the compiled templates: template file name -> Template
+_templates_cache = dict()
+_templates_cache_lock = threading.Lock()
+
+# Directory where the generated modules are stored (None: keep them in memory)
+_module_directory = os.environ.get(MODULE_DIRECTORY_ENV_VAR) or None
+
+
+def get_template(template_file: str = CBI_TEMPLATE_FILE) -> 'Template':
+    """
+    Return the compiled version of a template, compiling it only the first
+    time it's requested by the current process
+
+    :param template_file: name of the template file
+    :type template_file: str
+    :returns: the compiled template
+    :rtype: class:`mako.template.Template`
+    """
+
+    try:
+        return _templates_cache[template_file]
+    except KeyError:
+        pass
+    # end try / except
+
+    with _templates_cache_lock:
+        # Another thread may have compiled the template while this one
+        # was waiting for the lock
+        if template_file not in _templates_cache:
+            from mako.template import Template
+            _templates_cache[template_file] = Template(
+                filename=os.path.join(TEMPLATES_DIRECTORY, template_file),
+                module_directory=_module_directory,
+                input_encoding='utf-8',
+            )
+        # end if
+
+        return _templates_cache[template_file]
+    # end with
+# end get_template
+
+
+def preload_templates() -> None:
+    """
+    Compile all the templates in advance. Calling this function in the
+    parent process before forking the workers makes them start with the
+    compiled templates already in memory
+    """
+    get_template(CBI_TEMPLATE_FILE)
+# end preload_templates
+
+
+def set_module_directory(module_directory: str = None) -> None:
+    """
+    Set the directory where Mako stores the Python modules generated from the
+    templates, passing None the modules are kept in memory only. Since the
+    cached templates were compiled with the previous setting the cache is
+    cleared.
+
+    :param module_directory: path of the directory, None to disable
+    :type module_directory: str
+    """
+    global _module_directory
+
+    with _templates_cache_lock:
+        _module_directory = module_directory
+        _templates_cache.clear()
+    # end with
+# end set_module_directory
+
+
+def get_module_directory() -> str:
+    """Return the directory where the generated modules are stored"""
+    return _module_directory
+# end get_module_directory
+
+
+def clear_templates_cache() -> None:
+    """Remove all the compiled templates from the cache"""
+    with _templates_cache_lock:
+        _templates_cache.clear()
+    # end with
+# end clear_templates_cache
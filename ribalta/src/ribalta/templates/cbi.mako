@@ -14,7 +14,7 @@
 ##
 <%
     import re
-    from unidecode import unidecode
+    from ribalta.utils.text import to_ascii
 
     # Enable debug messages
     debug_active = False
@@ -46,26 +46,16 @@
 
     def riferimento_al_debito(receipt):
         # Get the communication message
-        msg = unidecode(receipt.communication)
+        msg = to_ascii(receipt.communication)
 
         # Format the message and return the result
         msg_formatted = msg.ljust(80, ' ')[:80]
         return msg_formatted
     # end riferimento_al_debito
 
-    def f_unidecode(content):
-        return unidecode(content)
-    # end f_unidecode
-
-    def f_acct_num(account_number):
-        # Take the last 12 characters of the supplied account number,
-        # this way we can safely manage Italian IBAN codes ...even if
-        # the supplied code is an IBAN code the account number will be
-        # extracted correctly.
-        # If the supplied number is less than 12 characters the whole
-        # code will be used.
-        return str(account_number).strip().rjust(12, '0')[-12:]
-    # end f_acct_num
+    def f_to_ascii(content):
+        return to_ascii(content)
+    # end f_to_ascii
 
     def loop_num_to_num_progr(loop_itration_number):
         return str(loop_itration_number + 1).rjust(7, '0')[:7]
@@ -78,44 +68,30 @@
     f_num_of_disposizioni = f_num_of_records
 
     def f_rjust_and_trim(content, width, fill_char):
-        return unidecode(str(content)).strip().rjust(width, fill_char)[:width]
+        return to_ascii(str(content)).strip().rjust(width, fill_char)[:width]
     # end ljust_and_trim
 
     f_zip_code = lambda content: f_rjust_and_trim(content, 5, '0')
     f_number_of_receipts = lambda content: f_rjust_and_trim(content, 10, '0')
     f_cab = lambda content: f_rjust_and_trim(content, 5, '0')
     f_abi = lambda content: f_rjust_and_trim(content, 5, '0')
-    f_sia = lambda content: f_rjust_and_trim(content, 5, '!')
 
     def f_ljust_and_trim(content, width, fill_char):
-        return unidecode(str(content)).strip().ljust(width, fill_char)[:width]
+        return to_ascii(str(content)).strip().ljust(width, fill_char)[:width]
     # end f_ljust_and_trim
 
-    f_ljust2 = lambda content: f_ljust_and_trim(content, 2, ' ')
-    f_ljust5 = lambda content: f_ljust_and_trim(content, 5, ' ')
-    f_ljust15 = lambda content: f_ljust_and_trim(content, 15, ' ')
     f_ljust16 = lambda content: f_ljust_and_trim(content, 16, ' ')
-    f_ljust20 = lambda content: f_ljust_and_trim(content, 20, ' ')
     f_ljust22 = lambda content: f_ljust_and_trim(content, 22, ' ')
-    f_ljust24 = lambda content: f_ljust_and_trim(content, 24, ' ')
     f_ljust25 = lambda content: f_ljust_and_trim(content, 25, ' ')
     f_ljust30 = lambda content: f_ljust_and_trim(content, 30, ' ')
     f_ljust50 = lambda content: f_ljust_and_trim(content, 50, ' ')
     f_ljust60 = lambda content: f_ljust_and_trim(content, 60, ' ')
-    
-    f_creditor_descr = f_ljust24
-    f_creditor_zip   = f_ljust5
-    f_creditor_city  = f_ljust15
-    f_creditor_state = f_ljust2
-    f_creditor_fiscode = lambda content: f_rjust_and_trim(content, 24, ' ')
 
-    def f_amount_line(amount):
-        amount_cents = int(round(float(amount) * 100))
+    def f_amount_line(amount_cents):
         return str(amount_cents).rjust(13, '0')
     # end f_amount_line
 
-    def f_amount_total(amount):
-        amount_cents = int(round(float(amount) * 100))
+    def f_amount_total(amount_cents):
         return str(amount_cents).rjust(15, '0')
     # end f_amount_total
 
@@ -127,6 +103,9 @@
         return docname.ljust(20, ' ')
     # end f_doc_name
 
+    # Creditor data formatted once for the whole document
+    creditor = doc.creditor_segments
+
 %>\
 ##
 ##
@@ -139,9 +118,9 @@
 ## 1-3 - ' IB'
 ${R_IB_START}\
 ## 4-8 - Mittente: codice SIA dell'azienda mittente
-${doc.sia_code | f_sia}\
+${creditor.sia_code}\
 ## 9-13 - Ricevente: ABI banca assuntrice
-${doc.creditor_bank_abi | f_abi}\
+${creditor.bank_abi}\
 ## 14-19 - Data creazione: data creazione del flusso da parte dell'azienda (GGMMAA)
 ${doc.creation_date.strftime('%d%m%y')}\
 ## 20-39 - Nome supporto: composizione libera, ma deve essere univoco nell'ambito della data di creazione a parità di mittente e ricevente
@@ -194,16 +173,14 @@ ${line.duedate.strftime('%d%m%y')}\
 ## 29-33 - Causale: assume valore fisso '30000'
 30000\
 ## 34-46 - Importo: importo della ricevuta in centesimi di Euro
-${line.amount | f_amount_line}\
+${line.amount_cents | f_amount_line}\
 ## 47 - Segno: assume valore fisso '-'
 -\
 ## Coordinate banca assuntrice
 ##     48-52 - ABI assuntrice
 ##     53-57 - CAB assuntrice
 ##     58-69 - Numero di conto
-${doc.creditor_bank_abi | f_abi}\
-${doc.creditor_bank_cab | f_cab}\
-${doc.creditor_bank_acc | f_acct_num}\
+${creditor.bank_coordinates}\
 ## - - - - - - - - - -
 ## Coordinate banca domiciliataria
 ##     70-74 - ABI domiciliataria
@@ -218,9 +195,9 @@ ${BLANK_CHAR * fldsz(80, 91)}\
 ##     97 - Tipo codice: assume valore fisso '4'
 ##     98-113 - Codice cliente debitore: codice con il quale il debitore è conosciuto dal creditore
 ##     114 - Flag tipo debitore: nel caso il debitore sia una banca va valorizzato con 'B', altrimenti va lasciato in bianco
-${doc.sia_code | f_sia}\
+${creditor.sia_code}\
 4\
-${line.debtor_client_code | f_unidecode,f_ljust16}\
+${line.debtor_client_code | f_to_ascii,f_ljust16}\
 ${BLANK_CHAR}\
 ## - - - - - - - - - -
 ## 115-119 - Filler
@@ -245,14 +222,8 @@ ${num_progr}\
 ##     35-58  - Descrizione del creditore: secondo segmento, testo libero -> Street
 ##     59-82  - Descrizione del creditore: terzo segmento, testo libero   -> "zip city state" with city trimmed to 15 chars
 ##     83-106 - Descrizione del creditore: quarto segmento, testo libero  -> fiscal code
-${doc.creditor_company_name        | f_creditor_descr}\
-${doc.creditor_company_addr_street | f_creditor_descr}\
-${doc.creditor_company_addr_zip    | f_creditor_zip}\
-${BLANK_CHAR}\
-${doc.creditor_company_addr_city   | f_creditor_city}\
-${BLANK_CHAR}\
-${doc.creditor_company_addr_state  | f_creditor_state}\
-${doc.creditor_fiscode_or_vat      | f_creditor_fiscode}\
+##     (formatted once for the whole document)
+${creditor.description}\
 ## - - - - - - - - - -
 ## 107-120 - Filler
 ${BLANK_CHAR * fldsz(107, 120)}\
@@ -295,7 +266,7 @@ ${num_progr}\
 ##     41-45 - CAP
 ##     46-70 - Comune e sigla della provincia
 ##     71-120 - Banca/sportello domiciliataria: eventuale denominazione in chiaro della banca/sportello domiciliataria/o
-${line.debtor_address | f_unidecode,f_ljust30}\
+${line.debtor_address | f_to_ascii,f_ljust30}\
 ${line.debtor_zip | f_zip_code}\
 ${f'{line.debtor_city}' | f_ljust22} ${f'{line.debtor_state}'.rjust(2, ' ')}\
 ${(line.debtor_bank_name or '') | f_ljust50}\
@@ -319,7 +290,7 @@ ${num_progr}\
 ##     101-116 - Codifica fiscale del creditore
 ${riferimento_al_debito(line)}\
 ${BLANK_CHAR * fldsz(91, 100)}\
-${doc.creditor_fiscode_or_vat | f_ljust16}\
+${creditor.fiscode}\
 ## - - - - - - - - - -
 ## 117-120 - Filler
 ${BLANK_CHAR * fldsz(117, 120)}\
@@ -339,7 +310,7 @@ ${num_progr}\
 ## 11-20 - Numero ricevuta: numero ricevuta attribuito al cliente
 ${(loop.index + 1) | f_number_of_receipts}\
 ## 11-40 - Denominazione creditore
-${doc.creditor_company_name | f_ljust20}\
+${creditor.name}\
 ## Bollo virtuale -- NON IMPLEMENTATO
 ##     41-55 - Provincia: provincia dell'Intendenza di Finanza che ha autorizzato il pagamento del bollo in modo virtuale
 ##     56-65 - Numero autorizzazione: numero dell'autorizzazione dall'Intendenza di Finanza
@@ -392,9 +363,9 @@ ${R_END}
 ## 1-3 - ' EF'
 ${R_EF_START}\
 ## 4-8 - UGUALE A CAMPO CORRISPONDENTE NEL RECORD ' IB' -> Mittente: codice SIA dell'azienda mittente
-${doc.sia_code| f_sia}\
+${creditor.sia_code}\
 ## 9-13 - UGUALE A CAMPO CORRISPONDENTE NEL RECORD ' IB' -> Ricevente: ABI banca assuntrice
-${doc.creditor_bank_abi | f_abi}\
+${creditor.bank_abi}\
 ## 14-19 - UGUALE A CAMPO CORRISPONDENTE NEL RECORD ' IB' -> Data creazione: data creazione del flusso da parte dell'azienda (GGMMAA)
 ${doc.creation_date.strftime('%d%m%y')}\
 ## 20-39 - UGUALE A CAMPO CORRISPONDENTE NEL RECORD ' IB' -> Nome supporto: composizione libera, ma deve essere univoco nell'ambito della data di creazione a parità di mittente e ricevente
@@ -404,7 +375,7 @@ ${BLANK_CHAR * fldsz(40, 45)}\
 ## 46-52 - Numero disposizioni: numero di ricevute Ri.Ba. contenute nel flusso
 ${num_progr | f_num_of_disposizioni}\
 ## 53-67 - Tot. importi negativi: totale (in centesimi di Euro) delle disposizioni contenute nel flusso
-${doc.total_amount | f_amount_total}\
+${doc.total_amount_cents | f_amount_total}\
 ## 68-82 - Tot. importi positivi: riempire con zeri
 ${'0' * fldsz(68, 82)}\
 ## 83-89 - Numero record: numero totale di records che compongono il flusso, nel conteggio sono compresi i record IB ed EF
@@ -31,6 +31,36 @@ class ABITypeError(UserError):
 # end ABITypeError
 
 
+class BatchValidationError(UserError):
+    pass
+# end BatchValidationError
+
+
+class CBIFormatError(UserError):
+    pass
+# end CBIFormatError
+
+
+class DuplicateReceiptError(UserError):
+    pass
+# end DuplicateReceiptError
+
+
+class InvalidRecordError(UserError):
+    pass
+# end InvalidRecordError
+
+
+class MixedDuedatesError(UserError):
+    pass
+# end MixedDuedatesError
+
+
+class RenderCancelledError(UserError):
+    pass
+# end RenderCancelledError
+
+
 class CABMissingError(UserError):
     pass
 # end CABMissingError
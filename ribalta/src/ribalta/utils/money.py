@@ -0,0 +1,40 @@
+from decimal import Decimal, ROUND_HALF_UP
+import typing
+
+
+CENTS_IN_EURO = 100
+
+
+def to_cents(amount: typing.Union[float, int, Decimal]) -> int:
+    """
+    Convert an amount in Euro to an integer number of cents of Euro
+
+    :param amount: the amount in Euro
+    :type amount: float, int or Decimal
+    :returns: the amount in cents
+    :rtype: int
+    """
+
+    if isinstance(amount, Decimal):
+        return int(
+            (amount * CENTS_IN_EURO).quantize(Decimal(1), rounding=ROUND_HALF_UP)
+        )
+    elif isinstance(amount, int):
+        return amount * CENTS_IN_EURO
+    else:
+        return int(round(float(amount) * CENTS_IN_EURO))
+    # end if
+# end to_cents
+
+
+def from_cents(cents: int) -> Decimal:
+    """
+    Convert an integer number of cents of Euro to an amount in Euro
+
+    :param cents: the amount in cents
+    :type cents: int
+    :returns: the amount in Euro, exact
+    :rtype: Decimal
+    """
+    return Decimal(cents) / CENTS_IN_EURO
+# end from_cents
@@ -0,0 +1,272 @@
+"""Unique "Nome supporto" for the CBI supports.
+
+The name of a support is made of its creation date, to the second, and of the
+SIA code of the creditor, so two supports of the same creditor created within
+the same second would get the same name. When a flow is split into many
+supports each one gets the common name followed by a sequence number, taken
+from a registry that never returns the same name twice.
+
+The default registry, class:`SupportNameRegistry`, is local to the process:
+processes splitting flows of the same creditor in the same second (e.g. the
+prefork workers of Odoo) must share a registry. class:`FileSupportNameRegistry`
+keeps the sequence numbers in a file locked by each reservation, and it's
+the default one when the RIBALTA_SUPPORT_NAMES_FILE environment variable is
+set (where file locks are available, the process registry is used otherwise
+with a warning). Any object with the same reserve() method can be used instead, e.g. one
+taking the numbers from a sequence of the database:
+
+    set_support_names(FileSupportNameRegistry('/var/lib/ribalta/support_names.json'))
+"""
+
+from collections import OrderedDict
+from datetime import datetime
+import logging
+import os
+import threading
+import typing
+
+
+# Maximum length of the name of the support (field 20-39 of the IB record)
+SUPPORT_NAME_LENGTH = 20
+
+# Number of digits of the sequence number appended to the names
+SEQUENCE_DIGITS = 3
+
+# Number of base names remembered by the registry: the base names contain
+# the creation time, so only the most recent ones can be requested again
+REGISTRY_SIZE = 1024
+
+# Environment variable with the path of the file shared by the processes
+SUPPORT_NAMES_FILE_ENV_VAR = 'RIBALTA_SUPPORT_NAMES_FILE'
+
+_logger = logging.getLogger(__name__)
+
+
+def support_name(creation_date: datetime, sia_code: str) -> str:
+    """
+    The name of a support, before any sequence number is added
+
+    :param creation_date: creation date of the support
+    :type creation_date: datetime
+    :param sia_code: SIA code of the creditor
+    :type sia_code: str
+    :returns: the name
+    :rtype: str
+    """
+    return creation_date.strftime('%d%m%y%H%M%S') + str(sia_code)
+# end support_name
+
+
+class SupportNameRegistry:
+    """
+    Thread-safe registry of the sequence numbers already used for each base
+    name. The registry is local to the process: supports rendered by other
+    processes should get their names from the parent process, processes
+    splitting flows independently should share a class:`FileSupportNameRegistry`.
+
+    :param size: number of base names remembered by the registry
+    :type size: int
+    """
+
+    def __init__(self, size: int = REGISTRY_SIZE):
+        self._size = size
+        self._lock = threading.Lock()
+
+        # Base name -> next sequence number, oldest base names first
+        self._next_sequence = OrderedDict()
+    # end __init__
+
+    def reserve(self, base_name: str, count: int = 1) -> typing.List[str]:
+        """
+        Reserve the names for a set of supports
+
+        :param base_name: the common part of the names
+        :type base_name: str
+        :param count: number of names to be reserved
+        :type count: int
+        :returns: the names, never returned before for the same base name
+        :rtype: list of str
+        """
+
+        _check_base_name(base_name)
+
+        with self._lock:
+            first = _next_sequences(self._next_sequence, base_name, count, self._size)
+        # end with
+
+        return _names(base_name, first, count)
+    # end reserve
+
+    def clear(self) -> None:
+        """Forget all the reserved names"""
+        with self._lock:
+            self._next_sequence.clear()
+        # end with
+    # end clear
+# end SupportNameRegistry
+
+
+class FileSupportNameRegistry:
+    """
+    Registry of the sequence numbers shared by the processes of a host: the
+    numbers are kept in a JSON file, locked while a reservation reads and
+    updates it. Only available where the fcntl module is (not on Windows).
+
+    :param path: path of the file, created on first use
+    :type path: str
+    :param size: number of base names remembered by the registry
+    :type size: int
+    :raises RuntimeError: if file locks are not available on the platform
+    """
+
+    def __init__(self, path: str, size: int = REGISTRY_SIZE):
+
+        try:
+            import fcntl  # noqa: F401
+        except ImportError:
+            # Not available on Windows
+            raise RuntimeError('File locks are not available on this platform') from None
+        # end try / except
+
+        self._path = path
+        self._size = size
+
+        # Serializes the threads of this process, the file lock the processes
+        self._lock = threading.Lock()
+    # end __init__
+
+    @property
+    def path(self) -> str:
+        return self._path
+    # end path
+
+    def reserve(self, base_name: str, count: int = 1) -> typing.List[str]:
+        """
+        Reserve the names for a set of supports, see
+        :meth:`SupportNameRegistry.reserve`
+        """
+
+        # Imported on first use: most processes never share the names
+        import fcntl
+        import json
+
+        _check_base_name(base_name)
+
+        with self._lock, open(os.open(self._path, os.O_RDWR | os.O_CREAT, 0o644), 'r+') as fp:
+            fcntl.flock(fp, fcntl.LOCK_EX)
+            try:
+                next_sequence = OrderedDict(self._read(fp))
+                first = _next_sequences(next_sequence, base_name, count, self._size)
+
+                fp.seek(0)
+                fp.truncate()
+                json.dump(list(next_sequence.items()), fp)
+                fp.flush()
+            finally:
+                fcntl.flock(fp, fcntl.LOCK_UN)
+            # end try / finally
+        # end with
+
+        return _names(base_name, first, count)
+    # end reserve
+
+    def clear(self) -> None:
+        """Forget all the reserved names"""
+        import fcntl
+
+        with self._lock, open(os.open(self._path, os.O_RDWR | os.O_CREAT, 0o644), 'r+') as fp:
+            fcntl.flock(fp, fcntl.LOCK_EX)
+            fp.truncate()
+        # end with
+    # end clear
+
+    # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+    # Private methods
+    # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+    @staticmethod
+    def _read(fp) -> typing.List[typing.List]:
+        import json
+
+        # Pairs of base name and next sequence number, oldest base names
+        # first; the file is empty when it's created
+        content = fp.read()
+        return json.loads(content) if content else []
+    # end _read
+# end FileSupportNameRegistry
+
+
+def set_support_names(registry=None) -> None:
+    """
+    Set the registry used by the documents of the current process
+
+    :param registry: the registry, any object with the reserve() method of
+     class:`SupportNameRegistry`; None restores the default one
+    """
+    global support_names
+    support_names = registry if registry is not None else _default_registry()
+# end set_support_names
+
+
+def _check_base_name(base_name: str) -> None:
+    if len(base_name) + SEQUENCE_DIGITS > SUPPORT_NAME_LENGTH:
+        raise ValueError(
+            f'Support name "{base_name}" too long to add a sequence number'
+        )
+    # end if
+# end _check_base_name
+
+
+def _next_sequences(next_sequence: OrderedDict, base_name: str, count: int, size: int) -> int:
+    """
+    Take count sequence numbers for a base name, updating the next sequence
+    numbers of the base names (oldest base names first)
+
+    :returns: the first sequence number
+    """
+
+    first = next_sequence.pop(base_name, 1)
+    last = first + count - 1
+
+    if last >= 10 ** SEQUENCE_DIGITS:
+        next_sequence[base_name] = first
+        raise ValueError(
+            f'No more names available for "{base_name}": '
+            f'{count} requested, {10 ** SEQUENCE_DIGITS - first} left'
+        )
+    # end if
+
+    next_sequence[base_name] = last + 1
+    while len(next_sequence) > size:
+        next_sequence.popitem(last=False)
+    # end while
+
+    return first
+# end _next_sequences
+
+
+def _names(base_name: str, first: int, count: int) -> typing.List[str]:
+    return [
+        f'{base_name}{sequence:0{SEQUENCE_DIGITS}d}'
+        for sequence in range(first, first + count)
+    ]
+# end _names
+
+
+def _default_registry():
+    path = os.environ.get(SUPPORT_NAMES_FILE_ENV_VAR)
+    if path:
+        try:
+            return FileSupportNameRegistry(path)
+        except RuntimeError as error:
+            _logger.warning(
+                '%s is set but %s: the support names are unique only within the process',
+                SUPPORT_NAMES_FILE_ENV_VAR, str(error).lower()
+            )
+        # end try / except
+    # end if
+    return SupportNameRegistry()
+# end _default_registry
+
+
+# Registry used by the documents of the current process, see set_support_names
+support_names = _default_registry()
@@ -0,0 +1,11 @@
+"""Names of the phases of the generation of the CBI documents, recorded by
+the profilers (see :mod:`ribalta.profiling`)."""
+
+
+PHASE_PREFETCH = 'prefetch'
+PHASE_RECEIPTS = 'receipts'
+PHASE_SNAPSHOTS = 'snapshots'
+PHASE_VALIDATION = 'validation'
+PHASE_GROUPING = 'grouping'
+PHASE_RENDERING = 'rendering'
+PHASE_WRITING = 'writing'
@@ -0,0 +1,78 @@
+import functools
+import re
+
+
+# Maximum number of transliterated strings kept in memory (debtor names,
+# cities and streets are repeated many times in large documents)
+TRANSLITERATION_CACHE_SIZE = 4096
+
+# Transliteration of the non-ASCII characters usually found in Italian
+# names and addresses (Latin-1 letters, typographic quotes and dashes, ...).
+# The transliterations are the same produced by unidecode.
+ASCII_TRANSLATION_TABLE = str.maketrans({
+    # Latin-1 uppercase letters
+    'À': 'A', 'Á': 'A', 'Â': 'A', 'Ã': 'A', 'Ä': 'A', 'Å': 'A', 'Æ': 'AE',
+    'Ç': 'C', 'È': 'E', 'É': 'E', 'Ê': 'E', 'Ë': 'E', 'Ì': 'I', 'Í': 'I',
+    'Î': 'I', 'Ï': 'I', 'Ð': 'D', 'Ñ': 'N', 'Ò': 'O', 'Ó': 'O', 'Ô': 'O',
+    'Õ': 'O', 'Ö': 'O', 'Ø': 'O', 'Ù': 'U', 'Ú': 'U', 'Û': 'U', 'Ü': 'U',
+    'Ý': 'Y', 'Þ': 'Th',
+    # Latin-1 lowercase letters
+    'ß': 'ss', 'à': 'a', 'á': 'a', 'â': 'a', 'ã': 'a', 'ä': 'a', 'å': 'a',
+    'æ': 'ae', 'ç': 'c', 'è': 'e', 'é': 'e', 'ê': 'e', 'ë': 'e', 'ì': 'i',
+    'í': 'i', 'î': 'i', 'ï': 'i', 'ð': 'd', 'ñ': 'n', 'ò': 'o', 'ó': 'o',
+    'ô': 'o', 'õ': 'o', 'ö': 'o', 'ø': 'o', 'ù': 'u', 'ú': 'u', 'û': 'u',
+    'ü': 'u', 'ý': 'y', 'þ': 'th', 'ÿ': 'y',
+    # Latin Extended-A letters found in Western European names
+    'Œ': 'OE', 'œ': 'oe', 'Š': 'S', 'š': 's', 'Ž': 'Z', 'ž': 'z', 'Ÿ': 'Y',
+    # Latin-1 symbols
+    ' ': ' ', '­': '', '´': "'", '°': 'deg', 'ª': 'a', 'º': 'o',
+    '«': '<<', '»': '>>', '·': '*', '×': 'x', '÷': '/',
+    # Typographic punctuation
+    '‘': "'", '’': "'", '‚': ',', '“': '"', '”': '"', '„': ',,',
+    '–': '-', '—': '--', '…': '...', '•': '*', '€': 'EUR',
+})
+
+# Runs of non-ASCII characters: str.translate() looks up every character in
+# the table, translating only these runs is much faster on long texts
+_NON_ASCII_RE = re.compile('[^\x00-\x7f]+')
+
+
+def to_ascii(text: str) -> str:
+    """
+    Transliterate a string to ASCII. Pure ASCII strings are returned
+    unchanged, the characters usually found in Italian names and addresses
+    are transliterated using a translation table and unidecode is used only
+    for the remaining characters. The results are cached.
+
+    :param text: the string to be transliterated
+    :type text: str
+    :returns: the transliterated string, the same returned by unidecode
+    :rtype: str
+    """
+    if text.isascii():
+        return text
+    else:
+        return _transliterate(text)
+    # end if
+# end to_ascii
+
+
+@functools.lru_cache(maxsize=TRANSLITERATION_CACHE_SIZE)
+def _transliterate(text: str) -> str:
+
+    result = _NON_ASCII_RE.sub(_translate_match, text)
+
+    if not result.isascii():
+        # Characters not in the translation table: unidecode is loaded
+        # only when it's actually needed
+        from unidecode import unidecode
+        result = unidecode(result)
+    # end if
+
+    return result
+# end _transliterate
+
+
+def _translate_match(match) -> str:
+    return match.group().translate(ASCII_TRANSLATION_TABLE)
+# end _translate_match
@@ -1,109 +1,123 @@
 import re
 import typing
-from datetime import date, timedelta
+from datetime import date, datetime, timedelta
 
 from .errors import (
     AcctNumberMissingError, AcctNumberInvalidError, AcctNumberTypeError,
     ABIMissingError, ABIInvalidError, ABITypeError,
+    BatchValidationError,
     CABMissingError, CABInvalidError, CABTypeError,
     DuedateMissingError, DuedateTooEarlyError, DuedateTypeError,
+    FiscalcodeAndVATMissingError,
     SIAMissingError, SIATypeError, SIAInvalidError,
     ZIPInvalidError, ZIPTypeError
 )
+from .odoo_stuff import UserError
+from .phases import PHASE_VALIDATION
+
+
+# Precompiled checks used by the validators
+RE_5_DIGITS = re.compile(r'[0-9]{5}')
+ZEROS_5 = '00000'
 
 
 # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
 # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
 
-def validate_abi(abi: typing.Union[str, int, bool, None], nome_soggetto: str):
+def check_abi(
+    abi: typing.Union[str, int, bool, None], nome_soggetto: str
+) -> typing.Optional[UserError]:
+    """Check an ABI code returning the error found, None if the code is correct"""
 
     if abi == '' or abi is False or abi is None:
-        raise ABIMissingError(f'Codice ABI mancante per "{nome_soggetto}"')
-
-    elif isinstance(abi, int):
-        validate_abi(str(abi).rjust(5, '0'), nome_soggetto)
-
-    elif isinstance(abi, str):
-        if not abi.isnumeric():
-            raise ABIInvalidError(
-                f'Codice ABI ({abi}) errato per "{nome_soggetto}".'
-                f' - '
-                f'Il codice ABI deve essere un numero di 5 cifre'
-            )
-
-        elif not len(abi) == 5:
-            raise ABIInvalidError(
-                f'Codice ABI ({abi}) errato per "{nome_soggetto}".'
-                f' - '
-                f'Il codice ABI deve essere un numero di 5 cifre'
-            )
-
-        elif int(abi) == 0:
-            raise ABIInvalidError(
-                f'Codice ABI ({abi}) errato per "{nome_soggetto}".'
-                f' - '
-                f'Il codice ABI non può essere composto da 5 zeri (00000)')
+        return ABIMissingError(f'Codice ABI mancante per "{nome_soggetto}"')
+    # end if
 
-        else:
-            # Codice ABI OK
-            return
-        # end if
+    if isinstance(abi, int):
+        abi = str(abi).rjust(5, '0')
+    # end if
 
-    else:
-        raise ABITypeError(
+    if not isinstance(abi, str):
+        return ABITypeError(
             f'Tipo dato non valido ({type(abi)}) '
             f'per il codice ABI di "{nome_soggetto}".'
             f' - '
             f'Il tipo può essere stringa (str) o numero intero (int)'
         )
-    # end if
-# end validate_abi
 
+    elif not RE_5_DIGITS.fullmatch(abi):
+        return ABIInvalidError(
+            f'Codice ABI ({abi}) errato per "{nome_soggetto}".'
+            f' - '
+            f'Il codice ABI deve essere un numero di 5 cifre'
+        )
 
-def validate_cab(cab: typing.Union[str, int, bool, None], nome_soggetto: str):
+    elif abi == ZEROS_5:
+        return ABIInvalidError(
+            f'Codice ABI ({abi}) errato per "{nome_soggetto}".'
+            f' - '
+            f'Il codice ABI non può essere composto da 5 zeri (00000)')
 
-    if cab == '' or cab is False or cab is None:
-        raise CABMissingError(f'Codice CAB mancante per "{nome_soggetto}"')
-    
-    elif isinstance(cab, int):
-        validate_cab(str(cab).rjust(5, '0'), nome_soggetto)
+    else:
+        # Codice ABI OK
+        return None
+    # end if
+# end check_abi
 
-    elif cab in ('', False, None):
-        raise CABMissingError(f'Codice CAB mancante per "{nome_soggetto}"')
 
-    elif isinstance(cab, str):
-        if not cab.isnumeric():
-            raise CABInvalidError(
-                f'Codice CAB ({cab}) errato per "{nome_soggetto}".'
-                f' - '
-                f'Il codice CAB deve essere un numero di 5 cifre'
-            )
+def validate_abi(abi: typing.Union[str, int, bool, None], nome_soggetto: str):
+    error = check_abi(abi, nome_soggetto)
+    if error:
+        raise error
+    # end if
+# end validate_abi
 
-        elif not len(cab) == 5:
-            raise CABInvalidError(
-                f'Codice CAB ({cab}) errato per "{nome_soggetto}".'
-                f' - '
-                f'Il codice CAB deve essere un numero di 5 cifre'
-            )
 
-        elif int(cab) == 0:
-            raise CABInvalidError(
-                f'Codice CAB ({cab}) errato per "{nome_soggetto}".'
-                f' - '
-                f'Il codice CAB non può essere composto da 5 zeri (00000)')
+def check_cab(
+    cab: typing.Union[str, int, bool, None], nome_soggetto: str
+) -> typing.Optional[UserError]:
+    """Check a CAB code returning the error found, None if the code is correct"""
 
-        else:
-            # Codice CAB OK
-            return
-        # end if
+    if cab == '' or cab is False or cab is None:
+        return CABMissingError(f'Codice CAB mancante per "{nome_soggetto}"')
+    # end if
 
-    else:
-        raise CABTypeError(
+    if isinstance(cab, int):
+        cab = str(cab).rjust(5, '0')
+    # end if
+
+    if not isinstance(cab, str):
+        return CABTypeError(
             f'Tipo dato non valido ({type(cab)}) '
             f'per il codice CAB di "{nome_soggetto}".'
             f' - '
             f'Il tipo può essere stringa (str) o numero intero (int)'
         )
+
+    elif not RE_5_DIGITS.fullmatch(cab):
+        return CABInvalidError(
+            f'Codice CAB ({cab}) errato per "{nome_soggetto}".'
+            f' - '
+            f'Il codice CAB deve essere un numero di 5 cifre'
+        )
+
+    elif cab == ZEROS_5:
+        return CABInvalidError(
+            f'Codice CAB ({cab}) errato per "{nome_soggetto}".'
+            f' - '
+            f'Il codice CAB non può essere composto da 5 zeri (00000)')
+
+    else:
+        # Codice CAB OK
+        return None
+    # end if
+# end check_cab
+
+
+def validate_cab(cab: typing.Union[str, int, bool, None], nome_soggetto: str):
+    error = check_cab(cab, nome_soggetto)
+    if error:
+        raise error
     # end if
 # end validate_cab
 
@@ -168,25 +182,32 @@ def validate_bank_account_number(
 # end validate_bank_account_number
 
 
-def validate_duedate(duedate: typing.Union[date, bool, None], nome_soggetto: str):
-    
-    tomorrow = date.today() + timedelta(days=1)
+def check_duedate(
+    duedate: typing.Union[date, bool, None],
+    nome_soggetto: str,
+    tomorrow: date = None
+) -> typing.Optional[UserError]:
+    """Check a due date returning the error found, None if the date is correct"""
+
+    if tomorrow is None:
+        tomorrow = date.today() + timedelta(days=1)
+    # end if
     
     if not duedate:
-        raise DuedateMissingError(
+        return DuedateMissingError(
             f'Data di scadenza mancante per "{nome_soggetto}"'
         )
     
     elif not isinstance(duedate, date):
-        raise DuedateTypeError(
+        return DuedateTypeError(
             f'Tipo dato non valido ({type(duedate)}) '
             f'per la data di scadenza di "{nome_soggetto}".'
             f' - '
             f'Il tipo deve essere datetime.date'
         )
     
-    elif not duedate >= tomorrow:
-        raise DuedateTooEarlyError(
+    elif not _as_date(duedate) >= tomorrow:
+        return DuedateTooEarlyError(
             f'Data scadenza pagamento ({duedate}) troppo vicina nel tempo '
             f'per "{nome_soggetto}".'
             f' - '
@@ -194,7 +215,15 @@ def validate_duedate(duedate: typing.Union[date, bool, None], nome_soggetto: str
         )
     
     else:
-        pass
+        return None
+    # end if
+# end check_duedate
+
+
+def validate_duedate(duedate: typing.Union[date, bool, None], nome_soggetto: str):
+    error = check_duedate(duedate, nome_soggetto)
+    if error:
+        raise error
     # end if
 # end validate_duedate
 
@@ -229,40 +258,269 @@ def validate_sia(sia_code: typing.Union[str, bool, None]) -> None:
 # end validate zip
 
 
-def validate_zip(zip_code: typing.Union[str, int, bool, None]) -> None:
+def check_zip(
+    zip_code: typing.Union[str, int, bool, None]
+) -> typing.Optional[UserError]:
+    """Check a ZIP code returning the error found, None if the code is correct"""
+
     # Verifica CAP: se c'è deve essere numerico e di 5 caratteri,
     # ma può tranquillamente non esserci!!
 
     if zip_code == '' or zip_code is False or zip_code is None:
         # Empty ZIP code is OK!
-        return
-
-    elif isinstance(zip_code, int):
-        validate_zip(str(zip_code).rjust(5, '0'))
-
-    elif isinstance(zip_code, str):
-        if not zip_code.isnumeric():
-            raise ZIPInvalidError(
-                'CAP errato. Il CAP deve essere un numero di 5 cifre')
-
-        elif len(zip_code) != 5:
-            raise ZIPInvalidError(
-                'CAP errato. Il CAP deve essere un numero di 5 cifre')
-
-        elif int(zip_code) == 0:
-            raise ZIPInvalidError(
-                'CAP errato. Il CAP non può essere composto da 5 zeri (00000)')
+        return None
+    # end if
 
-        else:
-            # Codice ZIP OK
-            return
-        # end if
+    if isinstance(zip_code, int):
+        zip_code = str(zip_code).rjust(5, '0')
+    # end if
 
-    else:
-        raise ZIPTypeError(
+    if not isinstance(zip_code, str):
+        return ZIPTypeError(
             f'Tipo dato non valido per il CAP: {type(zip_code)}'
             f' - '
             f'Il tipo può essere stringa (str) o numero intero (int)'
         )
+
+    elif not RE_5_DIGITS.fullmatch(zip_code):
+        return ZIPInvalidError(
+            'CAP errato. Il CAP deve essere un numero di 5 cifre')
+
+    elif zip_code == ZEROS_5:
+        return ZIPInvalidError(
+            'CAP errato. Il CAP non può essere composto da 5 zeri (00000)')
+
+    else:
+        # Codice ZIP OK
+        return None
+    # end if
+# end check_zip
+
+
+def validate_zip(zip_code: typing.Union[str, int, bool, None]) -> None:
+    error = check_zip(zip_code)
+    if error:
+        raise error
     # end if
 # end validate zip
+
+
+def _as_date(value: date) -> date:
+    # datetime objects can't be compared with date objects
+    return value.date() if isinstance(value, datetime) else value
+# end _as_date
+
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+# Batch validation
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+class ValidationIssue(typing.NamedTuple):
+    """Error found validating a receipt"""
+
+    # Position of the receipt in the validated batch (starting from 0)
+    index: int
+    # The receipt
+    receipt: typing.Any
+    # Name of the receipt field containing the error
+    field: str
+    # The error (not raised)
+    error: UserError
+
+    @property
+    def error_type(self) -> str:
+        return type(self.error).__name__
+    # end error_type
+
+    @property
+    def message(self) -> str:
+        return str(self.error)
+    # end message
+
+    def __str__(self):
+        return f'#{self.index + 1} {self.field}: {self.message}'
+    # end __str__
+# end ValidationIssue
+
+
+class BatchValidationReport:
+    """
+    Result of the validation of a batch of receipts
+
+    :param issues: the errors found
+    :type issues: List of class:`ValidationIssue`
+    :param receipts_count: number of validated receipts
+    :type receipts_count: int
+    """
+
+    def __init__(self, issues: typing.List[ValidationIssue], receipts_count: int):
+        self._issues = issues
+        self._receipts_count = receipts_count
+    # end __init__
+
+    @property
+    def issues(self) -> typing.List[ValidationIssue]:
+        return self._issues
+    # end issues
+
+    @property
+    def receipts_count(self) -> int:
+        return self._receipts_count
+    # end receipts_count
+
+    @property
+    def is_valid(self) -> bool:
+        return not self._issues
+    # end is_valid
+
+    @property
+    def invalid_indexes(self) -> typing.List[int]:
+        """Positions of the receipts containing at least one error"""
+        return sorted({issue.index for issue in self._issues})
+    # end invalid_indexes
+
+    def by_receipt(self) -> typing.Dict[int, typing.List[ValidationIssue]]:
+        """The errors grouped by position of the receipt"""
+        result = dict()
+        for issue in self._issues:
+            result.setdefault(issue.index, []).append(issue)
+        # end for
+        return result
+    # end by_receipt
+
+    def as_dicts(self) -> typing.List[typing.Dict[str, typing.Any]]:
+        """The errors as plain dictionaries (e.g. to be serialized)"""
+        return [
+            {
+                'index': issue.index,
+                'field': issue.field,
+                'error_type': issue.error_type,
+                'message': issue.message,
+            }
+            for issue in self._issues
+        ]
+    # end as_dicts
+
+    def raise_if_invalid(self) -> None:
+        """Raise a single exception listing all the errors found"""
+        if self._issues:
+            raise BatchValidationError(str(self))
+        # end if
+    # end raise_if_invalid
+
+    def __str__(self):
+        if self.is_valid:
+            return f'{self._receipts_count} ricevute valide'
+        # end if
+
+        lines = [
+            f'{len(self.invalid_indexes)} ricevute errate '
+            f'su {self._receipts_count} ({len(self._issues)} errori):'
+        ]
+        lines.extend(str(issue) for issue in self._issues)
+        return '\n'.join(lines)
+    # end __str__
+# end BatchValidationReport
+
+
+def validate_batch(
+    receipts: typing.Iterable, check_duedate_too_early: bool = False,
+    profiler=None
+) -> BatchValidationReport:
+    """
+    Validate all the receipts in a single pass collecting all the errors
+    instead of stopping at the first one. The receipts should be built
+    without validation, e.g. Receipt(payment_line, validate=False).
+
+    :param receipts: the receipts (class:`Receipt` or class:`FrozenReceipt`)
+    :param check_duedate_too_early: check the due dates are after today
+    :type check_duedate_too_early: bool
+    :param profiler: records the duration of the validation, any object
+     with the phase() method of class:`ribalta.profiling.RenderProfiler`
+    :returns: the report listing the errors found
+    :rtype: class:`BatchValidationReport`
+    """
+
+    if profiler is None:
+        return _validate_batch(receipts, check_duedate_too_early)
+    # end if
+
+    with profiler.phase(PHASE_VALIDATION) as phase:
+        report = _validate_batch(receipts, check_duedate_too_early)
+        phase.items = report.receipts_count
+    # end with
+
+    return report
+# end validate_batch
+
+
+def _validate_batch(receipts: typing.Iterable, check_duedate_too_early: bool) -> BatchValidationReport:
+
+    issues = list()
+    tomorrow = date.today() + timedelta(days=1) if check_duedate_too_early else None
+    receipts_count = 0
+
+    for index, rcpt in enumerate(receipts):
+        receipts_count += 1
+        issues.extend(check_receipt(index, rcpt, tomorrow))
+    # end for
+
+    return BatchValidationReport(issues, receipts_count)
+# end _validate_batch
+
+
+def check_receipt(index: int, rcpt, tomorrow: date = None) -> typing.List[ValidationIssue]:
+    """
+    Check a single receipt, returning the errors instead of raising them.
+    Used to validate the receipts one at a time while they are streamed.
+
+    :param index: position of the receipt (starting from 0)
+    :type index: int
+    :param rcpt: the receipt (class:`Receipt` or class:`FrozenReceipt`)
+    :param tomorrow: first valid due date, None to skip the check of the
+     due date
+    :type tomorrow: date
+    :returns: the errors found
+    :rtype: List of class:`ValidationIssue`
+    """
+
+    issues = list()
+    name = rcpt.debtor_name
+
+    # CAB and ABI required
+    error = check_abi(rcpt.debtor_bank_abi, name)
+    if error:
+        issues.append(ValidationIssue(index, rcpt, 'debtor_bank_abi', error))
+    # end if
+
+    error = check_cab(rcpt.debtor_bank_cab, name)
+    if error:
+        issues.append(ValidationIssue(index, rcpt, 'debtor_bank_cab', error))
+    # end if
+
+    # Fiscal code or VAT required
+    if not rcpt.debtor_fiscalcode and not rcpt.debtor_vat_number:
+        issues.append(ValidationIssue(
+            index, rcpt, 'debtor_fiscode_or_vat',
+            FiscalcodeAndVATMissingError(
+                f'Fiscalcode and VAT missing for debtor {name}'
+            )
+        ))
+    # end if
+
+    # ZIP code (optional)
+    error = check_zip(rcpt.debtor_zip)
+    if error:
+        issues.append(ValidationIssue(index, rcpt, 'debtor_zip', error))
+    # end if
+
+    # Due date
+    if tomorrow is not None:
+        error = check_duedate(rcpt.duedate, name, tomorrow)
+        if error:
+            issues.append(ValidationIssue(index, rcpt, 'duedate', error))
+        # end if
+    # end if
+
+    return issues
+# end check_receipt
@@ -0,0 +1,130 @@
+import asyncio
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import threading
+
+import pytest
+
+from .tools.data_load import build_document
+
+from ribalta import riba
+from ribalta.riba import RENDER_BACKENDS
+from ribalta.utils.errors import RenderCancelledError
+
+
+def run(coroutine):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
+    # end try / finally
+# end run
+
+
+@pytest.mark.parametrize('backend', RENDER_BACKENDS)
+@pytest.mark.parametrize('group', [False, True])
+def test_render_async(backend, group):
+
+    riba_doc = build_document('riba_collapsible_ok')
+    expected = riba_doc.render_cbi(group, backend)
+
+    # Default executor of the event loop
+    assert run(riba_doc.render_cbi_async(group, backend)) == expected
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        assert run(riba_doc.render_cbi_async(group, backend, executor)) == expected
+    # end with
+
+# end test_render_async
+
+
+def test_render_async_process_pool():
+
+    riba_doc = build_document('riba_collapsible_ok')
+
+    with ProcessPoolExecutor(max_workers=1) as executor:
+        cbi_doc = run(riba_doc.render_cbi_async(True, executor=executor))
+    # end with
+
+    assert cbi_doc == riba_doc.render_cbi(True)
+
+# end test_render_async_process_pool
+
+
+def test_render_async_cancel(monkeypatch):
+
+    riba_doc = build_document('riba_ok', 3000)
+
+    started = threading.Event()
+    outcome = dict()
+    render_snapshot = riba._render_snapshot
+
+    def tracked_render_snapshot(doc, group, backend, cancel_event):
+        started.set()
+        # Give the event loop the time to cancel the task
+        cancel_event.wait(5)
+        try:
+            outcome['cbi'] = render_snapshot(doc, group, backend, cancel_event)
+        except RenderCancelledError as e:
+            outcome['error'] = e
+            raise
+        # end try / except
+    # end tracked_render_snapshot
+
+    monkeypatch.setattr(riba, '_render_snapshot', tracked_render_snapshot)
+
+    async def render_and_cancel(executor):
+        task = asyncio.ensure_future(riba_doc.render_cbi_async(executor=executor))
+        while not started.is_set():
+            await asyncio.sleep(0.001)
+        # end while
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        # end with
+    # end render_and_cancel
+
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        run(render_and_cancel(executor))
+    # end with
+
+    # The rendering running in the thread has been stopped
+    assert 'cbi' not in outcome
+    assert isinstance(outcome['error'], RenderCancelledError)
+
+# end test_render_async_cancel
+
+
+class _CancelAfterChecks(threading.Event):
+    """Event set after a number of checks, i.e. while the lines are rendered"""
+
+    def __init__(self, checks: int):
+        super().__init__()
+        self.checks = checks
+    # end __init__
+
+    def is_set(self) -> bool:
+        self.checks -= 1
+        return self.checks < 0
+    # end is_set
+# end _CancelAfterChecks
+
+
+@pytest.mark.parametrize('backend', RENDER_BACKENDS)
+def test_render_cancel_mid_render(backend, caplog, capsys):
+
+    riba_doc = build_document('riba_ok', 3000)
+    cancel_event = _CancelAfterChecks(2)
+
+    with pytest.raises(RenderCancelledError):
+        riba._render_snapshot(riba_doc.snapshot(), False, backend, cancel_event)
+    # end with
+
+    # Stopped after some lines were rendered
+    assert cancel_event.checks == -1
+
+    # A cancellation is not a template error: nothing logged or printed
+    assert not [record for record in caplog.records if record.levelname == 'ERROR']
+    assert capsys.readouterr().out == ''
+
+# end test_render_cancel_mid_render
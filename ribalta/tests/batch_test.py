@@ -0,0 +1,124 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+import pickle
+
+import pytest
+
+from .tools.data_load import build_document
+
+from ribalta import grouping
+from ribalta.batch import BatchJob, render_batch, render_job
+from ribalta.riba import Document, FrozenCreditor, RENDER_BACKEND_MAKO, RENDER_BACKEND_RECORDS
+from ribalta.utils.errors import ABIInvalidError
+
+
+CREATION_DATE = datetime(2021, 3, 1, 10, 30, 15)
+
+
+def test_creditor_snapshot():
+
+    riba_doc = build_document('riba_ok', creation_date=CREATION_DATE)
+    creditor = riba_doc.creditor_snapshot
+
+    unpickled = pickle.loads(pickle.dumps(creditor))
+    assert unpickled == creditor
+    assert hash(unpickled) == hash(creditor)
+
+    with pytest.raises(AttributeError):
+        creditor.sia_code = 'X'
+    # end with
+
+    snapshot_doc = Document.from_snapshot(creditor, CREATION_DATE)
+    for rcpt in riba_doc.receipts:
+        snapshot_doc.add_receipt(rcpt.snapshot())
+    # end for
+
+    assert snapshot_doc.creditor_company is None
+    assert snapshot_doc.name == riba_doc.name
+    assert snapshot_doc.render_cbi() == riba_doc.render_cbi()
+
+    with pytest.raises(ABIInvalidError):
+        Document.from_snapshot(
+            FrozenCreditor(**dict(creditor.as_dict(), creditor_bank_iban='IT00X0000000000000000000000'))
+        )
+    # end with
+
+# end test_creditor_snapshot
+
+
+@pytest.mark.parametrize('backend', [RENDER_BACKEND_MAKO, RENDER_BACKEND_RECORDS])
+@pytest.mark.parametrize('group', [False, True, grouping.by_debtor_bank_any_duedate])
+def test_render_batch(backend, group):
+
+    datasets = ['riba_ok', 'riba_collapsible_ok', 'riba_cred_no_fiscode']
+    docs = [build_document(name, creation_date=CREATION_DATE) for name in datasets]
+    jobs = [BatchJob.from_document(name, doc) for name, doc in zip(datasets, docs)]
+
+    results = render_batch(jobs, group=group, backend=backend, max_workers=2)
+
+    assert [result.key for result in results] == datasets
+    for doc, result in zip(docs, results):
+        assert result.ok
+        assert result.name == doc.name
+        assert result.cbi == doc.render_cbi(group=group, backend=backend)
+    # end for
+
+# end test_render_batch
+
+
+def test_render_batch_errors():
+
+    riba_doc = build_document('riba_ok', creation_date=CREATION_DATE)
+    good_job = BatchJob.from_document('good', riba_doc)
+    bad_job = good_job._replace(
+        key='bad',
+        creditor=FrozenCreditor(**dict(good_job.creditor.as_dict(), creditor_bank_iban='IT00X0000000000000000000000')),
+    )
+
+    # Local functions can't be sent to the worker processes
+    results = render_batch([good_job, bad_job], group=lambda rcpt: rcpt.debtor_name, max_workers=2)
+    assert [result.ok for result in results] == [False, False]
+
+    results = render_batch([good_job, bad_job], max_workers=2)
+    assert results[0].ok
+    assert not results[1].ok
+    assert isinstance(results[1].error, ABIInvalidError)
+    assert results[1].cbi is None
+
+    # Same results in the current process and on a caller provided executor
+    with ThreadPoolExecutor(2) as executor:
+        for other_results in [render_batch([good_job, bad_job], max_workers=1),
+                              render_batch([good_job, bad_job], executor=executor)]:
+            assert other_results[0] == results[0]
+            assert type(other_results[1].error) is type(results[1].error)
+        # end for
+    # end with
+
+    assert render_job(good_job) == results[0]
+
+# end test_render_batch_errors
+
+
+def test_render_batch_names():
+
+    riba_doc = build_document('riba_ok')
+    job = BatchJob.from_document('job', riba_doc)._replace(creation_date=None, name=None)
+    other_job = job._replace(key='other', creditor=FrozenCreditor(**dict(job.creditor.as_dict(), sia_code='A1234')))
+
+    # Same creditor: the creation date is taken once, the names are reserved
+    results = render_batch([job, job._replace(key='copy'), other_job], max_workers=2)
+    assert all(result.ok for result in results)
+    first, copy, other = results
+    assert first.name[:-3] == copy.name[:-3] == other.name[:12] + riba_doc.sia_code
+    assert first.name != copy.name
+    # Only the IB and EF records hold the name
+    assert first.cbi.split('\r\n')[1:-2] == copy.cbi.split('\r\n')[1:-2]
+
+    # The only document of its creditor keeps the plain name
+    assert other.name == other.name[:12] + 'A1234'
+
+    # Named jobs are left alone
+    named = job._replace(creation_date=CREATION_DATE, name='SUPPORT')
+    assert [result.name for result in render_batch([named, named], max_workers=1)] == ['SUPPORT', 'SUPPORT']
+
+# end test_render_batch_names
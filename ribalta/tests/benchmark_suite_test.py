@@ -0,0 +1,70 @@
+from ribalta.riba import Document, Receipt
+from ribalta.utils.validators import validate_batch
+
+from .benchmarks.suite import (
+    PHASE_RENDER_MAKO, PHASE_VALIDATION, RENDER_PHASES, PhaseResult,
+    compare, load_baseline, run_size, save_baseline
+)
+from .benchmarks.synthetic import synthetic_order
+
+
+def test_synthetic_order():
+
+    order = synthetic_order(600, grouping_ratio=3)
+    receipts = [Receipt(payment_line, validate=False) for payment_line in order.receipts]
+    assert len(receipts) == 600
+
+    # Valid, repeatable and with accented names
+    assert validate_batch(receipts).is_valid
+    assert [r.debtor_name for r in receipts] == [
+        payment_line.partner_id.name for payment_line in synthetic_order(600).receipts
+    ]
+    assert any(not r.debtor_name.isascii() for r in receipts)
+
+    riba_doc = Document(**order.head)
+    for rcpt in receipts:
+        riba_doc.add_receipt(rcpt)
+    # end for
+    assert len(riba_doc.dispositions(True)) == order.groups_count == 200
+    assert riba_doc.render_cbi(True).isascii()
+
+    # No grouping
+    order = synthetic_order(50, grouping_ratio=1)
+    riba_doc = Document(**order.head)
+    for payment_line in order.receipts:
+        riba_doc.add_receipt(Receipt(payment_line))
+    # end for
+    assert len(riba_doc.dispositions(True)) == 50
+
+# end test_synthetic_order
+
+
+def test_baseline_comparison(tmp_path):
+
+    results = {200: run_size(200, repetitions=1)}
+    assert set(RENDER_PHASES) <= set(results[200])
+    assert all(result.peak_memory is not None for result in results[200].values())
+
+    path = str(tmp_path / 'baseline.json')
+    save_baseline(results, path)
+    baseline = load_baseline(path)
+    assert baseline == results
+
+    slower = {200: dict(results[200])}
+    slower[200][PHASE_RENDER_MAKO] = PhaseResult(1.0, 64 * 2 ** 20)
+    slower[200][PHASE_VALIDATION] = PhaseResult(1.0, None)
+    baseline[200][PHASE_RENDER_MAKO] = PhaseResult(0.5, 32 * 2 ** 20)
+
+    regressions = compare(slower, baseline)
+    assert [(r.phase, r.measure) for r in regressions] == [
+        (PHASE_RENDER_MAKO, 'seconds'), (PHASE_RENDER_MAKO, 'peak_memory'),
+    ]
+    assert regressions[0].ratio == 2
+
+    # Measures too small to be compared
+    assert compare({200: dict(results[200])}, {200: {
+        name: PhaseResult(result.seconds / 10, result.peak_memory) for name, result in results[200].items()
+        if result.seconds < 0.05
+    }}) == []
+
+# end test_baseline_comparison
@@ -0,0 +1,49 @@
+"""Benchmark of the rendering of many documents on a pool of processes.
+
+Run from the ribalta directory with:
+
+    python -m tests.benchmarks.batch_scaling [number_of_documents] [receipts_per_document]
+"""
+
+import os
+import sys
+import time
+
+from ribalta.batch import BatchJob, render_batch
+
+from ..tools.data_load import build_document
+from .render_backends import DATASET_NAME
+
+
+def run(number_of_documents: int = 32, receipts_per_document: int = 2000) -> dict:
+    doc = build_document(DATASET_NAME, receipts_per_document)
+    jobs = [BatchJob.from_document(i, doc) for i in range(number_of_documents)]
+
+    results = dict()
+    workers = 1
+    while workers <= (os.cpu_count() or 1):
+        start = time.perf_counter()
+        render_batch(jobs, max_workers=workers)
+        results[workers] = time.perf_counter() - start
+        workers *= 2
+    # end while
+
+    return results
+# end run
+
+
+def main():
+    number_of_documents = int(sys.argv[1]) if len(sys.argv) > 1 else 32
+    receipts_per_document = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+
+    results = run(number_of_documents, receipts_per_document)
+    for workers, seconds in results.items():
+        speedup = results[1] / seconds
+        print(f'{workers:>3} workers {seconds * 1000:10.1f} ms  x{speedup:.2f}')
+    # end for
+# end main
+
+
+if __name__ == '__main__':
+    main()
+# end if
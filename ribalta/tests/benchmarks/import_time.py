@@ -0,0 +1,147 @@
+"""Benchmark of the time needed to import ribalta.
+
+Each measure is taken in a new interpreter, since modules are imported only
+once per process. The standard library modules already loaded by Odoo are
+imported before starting the timer, so only the cost paid by a recycled Odoo
+worker is measured. The modules are imported from their compiled bytecode,
+written to a private directory by a first import that is not measured, as in
+a deployed installation.
+
+The time needed to start a bare interpreter is measured too, as the
+reference the import times are compared with.
+
+Run from the ribalta directory with:
+
+    python -m tests.benchmarks.import_time [repetitions]
+"""
+
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import typing
+
+
+# Modules imported by Odoo long before ribalta gets imported
+ODOO_PRELOADED_MODULES = (
+    'datetime', 'decimal', 'functools', 'io', 'logging', 're', 'threading',
+    'typing',
+)
+
+# Modules that must be loaded only when they are needed (first render,
+# non-ASCII text, memory tracing, process pools...)
+HEAVY_MODULES = ('mako', 'unidecode', 'tracemalloc', 'json', 'multiprocessing')
+
+# Modules to be measured
+IMPORTED_MODULES = ('ribalta', 'ribalta.riba', 'ribalta.batch', 'ribalta.parser')
+
+# The best of the repetitions is kept
+DEFAULT_REPETITIONS = 5
+
+# Directory of the bytecode compiled by the measured interpreters
+_bytecode_directory = None
+
+MEASURE_SCRIPT = '''
+import sys, time
+for name in {preloaded!r}:
+    __import__(name)
+start = time.perf_counter()
+__import__({module!r})
+elapsed = time.perf_counter() - start
+loaded = [m for m in {heavy!r} if m in sys.modules]
+import json
+print(json.dumps({{'seconds': elapsed, 'loaded': loaded}}))
+'''
+
+
+class ImportMeasure(typing.NamedTuple):
+    module: str
+    # Time needed to import the module in seconds
+    seconds: float
+    # Heavy modules loaded by the import
+    loaded: typing.List[str]
+# end ImportMeasure
+
+
+def measure_import(module: str = 'ribalta', repetitions: int = DEFAULT_REPETITIONS) -> ImportMeasure:
+    """Import a module in new interpreters and keep the fastest measure"""
+
+    script = MEASURE_SCRIPT.format(
+        preloaded=ODOO_PRELOADED_MODULES, module=module, heavy=HEAVY_MODULES,
+    )
+
+    # The first import compiles the bytecode
+    _run_interpreter(script)
+
+    measures = list()
+    for _ in range(repetitions):
+        result = json.loads(_run_interpreter(script))
+        measures.append(ImportMeasure(module, result['seconds'], result['loaded']))
+    # end for
+
+    return min(measures, key=lambda measure: measure.seconds)
+# end measure_import
+
+
+def measure_startup(repetitions: int = DEFAULT_REPETITIONS) -> float:
+    """Seconds needed to start a bare interpreter and exit, the best of the
+    repetitions"""
+
+    _run_interpreter('pass')
+
+    timings = list()
+    for _ in range(repetitions):
+        start = time.perf_counter()
+        _run_interpreter('pass')
+        timings.append(time.perf_counter() - start)
+    # end for
+
+    return min(timings)
+# end measure_startup
+
+
+def _run_interpreter(script: str) -> str:
+    """Run a script in a new interpreter, return its output"""
+    global _bytecode_directory
+
+    if _bytecode_directory is None:
+        _bytecode_directory = tempfile.mkdtemp(prefix='ribalta-bytecode-')
+    # end if
+
+    # The child interpreter must find ribalta where this one finds it and
+    # must be able to write the bytecode
+    env = dict(
+        os.environ,
+        PYTHONPATH=os.pathsep.join(p for p in sys.path if p),
+        PYTHONPYCACHEPREFIX=_bytecode_directory,
+    )
+    env.pop('PYTHONDONTWRITEBYTECODE', None)
+
+    return subprocess.run(
+        [sys.executable, '-c', script],
+        env=env, check=True, stdout=subprocess.PIPE, universal_newlines=True,
+    ).stdout
+# end _run_interpreter
+
+
+def run(repetitions: int = DEFAULT_REPETITIONS) -> typing.Dict[str, ImportMeasure]:
+    return {module: measure_import(module, repetitions) for module in IMPORTED_MODULES}
+# end run
+
+
+def main():
+    repetitions = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_REPETITIONS
+
+    print(f'{"interpreter startup":<20} {measure_startup(repetitions) * 1000:10.3f} ms')
+    for label, measure in run(repetitions).items():
+        loaded = ', '.join(measure.loaded) or '-'
+        print(f'{label:<20} {measure.seconds * 1000:10.3f} ms   heavy modules: {loaded}')
+    # end for
+# end main
+
+
+if __name__ == '__main__':
+    main()
+# end if
@@ -0,0 +1,53 @@
+"""Benchmark comparing the Mako and the records rendering backends.
+
+Run from the ribalta directory with:
+
+    python -m tests.benchmarks.render_backends [number_of_receipts]
+"""
+
+import sys
+import time
+
+from ribalta.riba import RENDER_BACKENDS
+
+from ..tools.data_load import build_document
+
+
+DATASET_NAME = 'riba_collapsible_ok'
+
+
+def run(number_of_receipts: int = 10000, repetitions: int = 5) -> dict:
+    riba_doc = build_document(DATASET_NAME, number_of_receipts)
+    results = dict()
+
+    for backend in RENDER_BACKENDS:
+        # First render compiles the Mako template, don't count it
+        riba_doc.render_cbi(backend=backend)
+
+        # Keep the best time to reduce the noise
+        timings = list()
+        for _ in range(repetitions):
+            start = time.perf_counter()
+            riba_doc.render_cbi(backend=backend)
+            timings.append(time.perf_counter() - start)
+        # end for
+        results[backend] = min(timings)
+    # end for
+
+    return results
+# end run
+
+
+def main():
+    number_of_receipts = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+
+    results = run(number_of_receipts)
+    for backend, seconds in results.items():
+        print(f'{backend:<10} {seconds * 1000:10.1f} ms')
+    # end for
+# end main
+
+
+if __name__ == '__main__':
+    main()
+# end if
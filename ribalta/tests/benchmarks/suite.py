@@ -0,0 +1,306 @@
+"""Benchmark suite of the generation of the CBI flows, on synthetic payment
+orders of growing size (see :mod:`tests.benchmarks.synthetic`).
+
+For each size the duration and the peak of the memory allocated by each phase
+are measured: construction of the receipts, validation, creation of the
+document, grouping and rendering (Mako and records backends, with and
+without grouping). The results can be saved as the baseline and the
+following runs are compared with it, failing when a phase got slower or
+needs more memory than allowed by the tolerance.
+
+Run from the ribalta directory with:
+
+    python -m tests.benchmarks.suite [--sizes 1000 10000] [--save] [--compare]
+
+Durations depend on the machine: the baseline should be saved on the same
+machine used to compare the results.
+"""
+
+import argparse
+import gc
+import json
+import os
+import platform
+import sys
+import typing
+
+from ribalta.profiling import RenderProfiler
+from ribalta.riba import Document, Receipt, RENDER_BACKEND_MAKO, RENDER_BACKEND_RECORDS
+from ribalta.utils.validators import validate_batch
+
+from .synthetic import DEFAULT_GROUPING_RATIO, ORDER_SIZES, synthetic_order
+
+
+# Phases of the suite, in the order they run
+PHASE_RECEIPTS = 'receipts'
+PHASE_VALIDATION = 'validation'
+PHASE_DOCUMENT = 'document'
+PHASE_GROUPING = 'grouping'
+PHASE_RENDER_MAKO = 'render_mako'
+PHASE_RENDER_MAKO_GROUPED = 'render_mako_grouped'
+PHASE_RENDER_RECORDS = 'render_records'
+PHASE_RENDER_RECORDS_GROUPED = 'render_records_grouped'
+
+# Phases rendering the document: backend, grouping
+RENDER_PHASES = {
+    PHASE_RENDER_MAKO: (RENDER_BACKEND_MAKO, False),
+    PHASE_RENDER_MAKO_GROUPED: (RENDER_BACKEND_MAKO, True),
+    PHASE_RENDER_RECORDS: (RENDER_BACKEND_RECORDS, False),
+    PHASE_RENDER_RECORDS_GROUPED: (RENDER_BACKEND_RECORDS, True),
+}
+
+# Sizes measured by default: tracing the memory slows down the code about
+# ten times, the largest orders take many minutes (see --no-memory)
+DEFAULT_SIZES = ORDER_SIZES[:2]
+
+# The best duration of the repetitions is kept
+DEFAULT_REPETITIONS = 3
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), 'baseline.json')
+
+# Allowed increase of the durations and of the memory peaks over the baseline
+DEFAULT_TIME_TOLERANCE = 0.5
+DEFAULT_MEMORY_TOLERANCE = 0.1
+
+# Smaller measures are dominated by the noise and they're not compared
+MIN_COMPARED = {'seconds': 0.05, 'peak_memory': 2 ** 20}
+
+
+class PhaseResult(typing.NamedTuple):
+    # Best duration in seconds
+    seconds: float
+    # Peak of the memory allocated in bytes, None if not measured
+    peak_memory: typing.Optional[int]
+# end PhaseResult
+
+
+class Regression(typing.NamedTuple):
+    size: int
+    phase: str
+    # 'seconds' or 'peak_memory'
+    measure: str
+    baseline: float
+    current: float
+
+    @property
+    def ratio(self) -> float:
+        return self.current / self.baseline
+    # end ratio
+
+    def __str__(self):
+        return (
+            f'{self.size} receipts, {self.phase}: {self.measure} '
+            f'{self.baseline:.6g} -> {self.current:.6g} (x{self.ratio:.2f})'
+        )
+    # end __str__
+# end Regression
+
+
+# Results of a run: size -> phase name -> result
+SuiteResults = typing.Dict[int, typing.Dict[str, PhaseResult]]
+
+
+def run_pipeline(order, profiler: RenderProfiler) -> None:
+    """Run all the phases on a payment order, measured by the profiler"""
+
+    with profiler.phase(PHASE_RECEIPTS, len(order.receipts)):
+        receipts = [Receipt(payment_line, validate=False) for payment_line in order.receipts]
+    # end with
+
+    with profiler.phase(PHASE_VALIDATION, len(receipts)):
+        validate_batch(receipts).raise_if_invalid()
+    # end with
+
+    with profiler.phase(PHASE_DOCUMENT, len(receipts)):
+        riba_doc = Document(**order.head)
+        for rcpt in receipts:
+            riba_doc.add_receipt(rcpt)
+        # end for
+    # end with
+
+    with profiler.phase(PHASE_GROUPING, len(receipts)):
+        riba_doc.dispositions(True)
+    # end with
+
+    for name, (backend, group) in RENDER_PHASES.items():
+        with profiler.phase(name, len(receipts)):
+            riba_doc.render_cbi(group, backend)
+        # end with
+    # end for
+# end run_pipeline
+
+
+def run_size(
+        receipts_count: int, grouping_ratio: float = DEFAULT_GROUPING_RATIO,
+        repetitions: int = DEFAULT_REPETITIONS, trace_memory: bool = True
+) -> typing.Dict[str, PhaseResult]:
+    """
+    Measure the phases on an order of the given size. The durations are the
+    best of the repetitions; the memory is measured by another run, since
+    tracing the allocations slows down the code.
+    """
+
+    order = synthetic_order(receipts_count, grouping_ratio)
+
+    best = dict()
+    for _ in range(repetitions):
+        # Don't charge the garbage of the previous run to this one
+        gc.collect()
+        profiler = RenderProfiler()
+        run_pipeline(order, profiler)
+        for phase in profiler.report().phases:
+            best[phase.name] = min(best.get(phase.name, phase.duration), phase.duration)
+        # end for
+    # end for
+
+    peaks = dict()
+    if trace_memory:
+        profiler = RenderProfiler(trace_memory=True)
+        run_pipeline(order, profiler)
+        peaks = {phase.name: phase.peak_memory for phase in profiler.report().phases}
+    # end if
+
+    return {name: PhaseResult(seconds, peaks.get(name)) for name, seconds in best.items()}
+# end run_size
+
+
+def run(
+        sizes: typing.Iterable[int] = DEFAULT_SIZES, grouping_ratio: float = DEFAULT_GROUPING_RATIO,
+        repetitions: int = DEFAULT_REPETITIONS, trace_memory: bool = True
+) -> SuiteResults:
+    # The Mako template is compiled once per process: don't measure it
+    run_pipeline(synthetic_order(10), RenderProfiler())
+
+    return {
+        size: run_size(size, grouping_ratio, repetitions, trace_memory)
+        for size in sizes
+    }
+# end run
+
+
+def compare(
+        results: SuiteResults, baseline: SuiteResults,
+        time_tolerance: float = DEFAULT_TIME_TOLERANCE,
+        memory_tolerance: float = DEFAULT_MEMORY_TOLERANCE
+) -> typing.List[Regression]:
+    """
+    Compare the results with the baseline, the sizes and phases missing from
+    the baseline and the measures smaller than MIN_COMPARED are skipped
+
+    :returns: the measures exceeding the baseline by more than the tolerance
+    """
+    regressions = list()
+
+    for size, phases in results.items():
+        for name, result in phases.items():
+            reference = baseline.get(size, {}).get(name)
+            if reference is None:
+                continue
+            # end if
+
+            for measure, tolerance in (('seconds', time_tolerance), ('peak_memory', memory_tolerance)):
+                current = getattr(result, measure)
+                previous = getattr(reference, measure)
+                if current is None or previous is None or previous < MIN_COMPARED[measure]:
+                    continue
+                # end if
+                if current > previous * (1 + tolerance):
+                    regressions.append(Regression(size, name, measure, previous, current))
+                # end if
+            # end for
+        # end for
+    # end for
+
+    return regressions
+# end compare
+
+
+def save_baseline(results: SuiteResults, path: str = BASELINE_PATH, grouping_ratio: float = None) -> None:
+    data = {
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'grouping_ratio': grouping_ratio,
+        'results': {
+            str(size): {name: result._asdict() for name, result in phases.items()}
+            for size, phases in results.items()
+        },
+    }
+    with open(path, 'w') as fp:
+        json.dump(data, fp, indent=2, sort_keys=True)
+        fp.write('\n')
+    # end with
+# end save_baseline
+
+
+def load_baseline(path: str = BASELINE_PATH) -> SuiteResults:
+    with open(path) as fp:
+        data = json.load(fp)
+    # end with
+    return {
+        int(size): {name: PhaseResult(**result) for name, result in phases.items()}
+        for size, phases in data['results'].items()
+    }
+# end load_baseline
+
+
+def format_results(results: SuiteResults) -> str:
+    lines = list()
+    for size, phases in results.items():
+        lines.append(f'{size} receipts')
+        for name, result in phases.items():
+            memory = '' if result.peak_memory is None else f'{result.peak_memory / 2 ** 20:10.1f} MiB'
+            per_receipt = result.seconds / size * 1e6
+            lines.append(
+                f'  {name:<24} {result.seconds * 1000:10.1f} ms {per_receipt:8.2f} us/receipt {memory}'
+            )
+        # end for
+    # end for
+    return '\n'.join(lines)
+# end format_results
+
+
+def main(argv: typing.List[str] = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog='python -m tests.benchmarks.suite', description='ribalta benchmark suite',
+    )
+    parser.add_argument(
+        '--sizes', type=int, nargs='+', default=list(DEFAULT_SIZES), metavar='N',
+        help=f'numbers of receipts of the orders (default: {" ".join(map(str, DEFAULT_SIZES))})',
+    )
+    parser.add_argument('--ratio', type=float, default=DEFAULT_GROUPING_RATIO,
+                        help='average number of receipts grouped together')
+    parser.add_argument('--repetitions', type=int, default=DEFAULT_REPETITIONS,
+                        help='the best duration of the repetitions is kept')
+    parser.add_argument('--no-memory', action='store_true', help="don't measure the memory")
+    parser.add_argument('--baseline', default=BASELINE_PATH, help='path of the baseline')
+    parser.add_argument('--save', action='store_true', help='save the results as the baseline')
+    parser.add_argument('--compare', action='store_true', help='compare the results with the baseline')
+    parser.add_argument('--time-tolerance', type=float, default=DEFAULT_TIME_TOLERANCE)
+    parser.add_argument('--memory-tolerance', type=float, default=DEFAULT_MEMORY_TOLERANCE)
+    args = parser.parse_args(argv)
+
+    results = run(args.sizes, args.ratio, args.repetitions, not args.no_memory)
+    print(format_results(results))
+
+    exit_code = 0
+    if args.compare:
+        regressions = compare(
+            results, load_baseline(args.baseline), args.time_tolerance, args.memory_tolerance
+        )
+        for regression in regressions:
+            print(f'REGRESSION {regression}')
+        # end for
+        exit_code = 1 if regressions else 0
+    # end if
+
+    if args.save:
+        save_baseline(results, args.baseline, args.ratio)
+    # end if
+
+    return exit_code
+# end main
+
+
+if __name__ == '__main__':
+    sys.exit(main())
+# end if
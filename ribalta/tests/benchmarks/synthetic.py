@@ -0,0 +1,198 @@
+"""Synthetic payment orders of any size, for the benchmarks.
+
+The orders are made of the same fake Odoo records used by the tests (see
+:mod:`tests.tools.fakes`): the receipts of the same debtor share its partner
+and bank account records, like the records of the Odoo ORM, so orders with a
+million lines fit in memory. Names and addresses contain accented letters,
+so the transliteration of the text is measured too.
+
+    order = synthetic_order(100000, grouping_ratio=3)
+
+    riba_doc = Document(**order.head)
+    for payment_line in order.receipts:
+        riba_doc.add_receipt(Receipt(payment_line))
+"""
+
+from datetime import date, timedelta
+import random
+from types import SimpleNamespace
+import typing
+
+from ..tools.fakes import BankAccountFake, CompanyFake, PartnerFake, PaymentLineFake
+
+
+# Sizes of the orders measured by the benchmarks
+ORDER_SIZES = (1000, 10000, 100000, 1000000)
+
+# Average number of receipts rendered as a single disposizione when grouping
+DEFAULT_GROUPING_RATIO = 3
+
+# Number of due dates of each debtor
+DUEDATES_PER_DEBTOR = 3
+
+DEFAULT_SEED = 20201120
+
+FIRST_DATE = date(2021, 1, 31)
+
+NAME_PREFIXES = (
+    'Caffè', 'Pasticceria', 'Società Agricola', 'Cantina', 'Libreria',
+    'Bottega', 'Trattoria', 'Gelateria', 'Officina', 'Ferramenta',
+)
+
+NAME_SURNAMES = (
+    'Niccolò', 'Ferrù', 'Città', 'Perché', 'Forlì', 'Mosè', 'Galilèo',
+    'Lucà', 'Bernabè', 'Nicolò', 'Schönberg', 'Müller', 'Jiménez',
+)
+
+NAME_SUFFIXES = ('S.r.l.', 'S.p.A.', 'S.n.c.', 'di Rossi & C.', 'S.a.s.', '')
+
+STREETS = (
+    'Via Santa Lucìa', 'Piazza Unità d\'Italia', 'Corso Vittorio Emanuele',
+    'Via dei Mille', 'Viale Libertà', 'Vicolo San Niccolò',
+)
+
+CITIES = (
+    ('Forlì', 'FC', '47121'), ('Cantù', 'CO', '22063'), ('Padova', 'PD', '35121'),
+    ('Sant\'Agata li Battiati', 'CT', '95030'), ('Mondovì', 'CN', '12084'),
+    ('Canicattì', 'AG', '92024'), ('Bolzano', 'BZ', '39100'),
+)
+
+BANK_NAMES = (
+    'Banca Etica', 'Banca Popolare dell\'Alto Adige', 'Cassa di Risparmio di Forlì',
+    'Crédit Agricole Italia', 'Banca di Credito Cooperativo di Cantù',
+)
+
+
+class SyntheticOrder(typing.NamedTuple):
+    """A payment order with the same attributes of
+    class:`tests.tools.data_load.FakeData`"""
+
+    # Arguments of the class:`ribalta.riba.Document` constructor
+    head: typing.Dict[str, typing.Any]
+    # The payment lines
+    receipts: typing.List[PaymentLineFake]
+    # Number of distinct debtor, bank and due date: the disposizioni when grouping
+    groups_count: int
+# end SyntheticOrder
+
+
+def synthetic_creditor() -> typing.Dict[str, typing.Any]:
+    """Arguments of the class:`ribalta.riba.Document` constructor"""
+    return {
+        'creditor_company': CompanyFake(
+            partner={
+                'id': 1,
+                'name': 'Distribuzione Caffè & Pasticcerìa Niccolò S.p.A.',
+                'vat': 'IT04218940155',
+                'fiscalcode': '04218940155',
+                'street': 'Via Altinate, 108',
+                'city': 'Padova',
+                'zip': '35121',
+                'state_id': {'code': 'PD'},
+            },
+            sia_code='F8007',
+        ),
+        'creditor_bank_account': BankAccountFake(
+            bank_name='Banca Adria Colli Euganei',
+            iban='IT31Z0898262680000022224466',
+        ),
+    }
+# end synthetic_creditor
+
+
+def synthetic_order(
+        receipts_count: int,
+        grouping_ratio: float = DEFAULT_GROUPING_RATIO,
+        seed: int = DEFAULT_SEED
+) -> SyntheticOrder:
+    """
+    Build a payment order of random receipts, the same for the same arguments
+
+    :param receipts_count: number of payment lines
+    :param grouping_ratio: average number of receipts with the same debtor,
+     bank and due date, grouped in a single disposizione (1 for no grouping)
+    :param seed: seed of the random generator
+    :returns: the order
+    :rtype: class:`SyntheticOrder`
+    """
+
+    if grouping_ratio < 1:
+        raise ValueError(f'Invalid grouping ratio: {grouping_ratio}')
+    # end if
+
+    rng = random.Random(seed)
+
+    groups_count = max(1, round(receipts_count / grouping_ratio))
+    debtors_count = max(1, groups_count // DUEDATES_PER_DEBTOR)
+
+    # Records shared by the receipts of the same debtor, built on first use
+    debtors = dict()
+
+    # Each group gets at least a receipt, the others are spread randomly
+    group_indexes = list(range(min(groups_count, receipts_count)))
+    group_indexes.extend(rng.randrange(groups_count) for _ in range(receipts_count - len(group_indexes)))
+    rng.shuffle(group_indexes)
+
+    receipts = list()
+    for number, group_index in enumerate(group_indexes, 1):
+        debtor_index = group_index % debtors_count
+        debtor = debtors.get(debtor_index)
+        if debtor is None:
+            debtor = debtors[debtor_index] = _synthetic_debtor(debtor_index, rng)
+        # end if
+        partner, bank_account = debtor
+
+        duedate = FIRST_DATE + timedelta(days=30 * (group_index // debtors_count))
+        invoice_date = duedate - timedelta(days=rng.randrange(30, 90))
+        amount = rng.randrange(100, 1000000) / 100
+
+        invoice = SimpleNamespace(number=f'FATT/2021/{number:06d}', date_invoice=invoice_date)
+        move_line = SimpleNamespace(
+            id=number, date_maturity=duedate, amount_residual=amount,
+            invoice_id=invoice, name=invoice.number, move_id=None,
+        )
+        receipts.append(PaymentLineFake(
+            move_line_id=move_line,
+            partner_id=partner,
+            partner_bank_id=bank_account,
+            communication=(
+                f'FATT. {invoice.number} DEL {invoice_date:%d/%m/%Y} IMP {amount:.2f} - '
+                f'Caparra già versata, saldo entro la scadenza'
+            ),
+        ))
+    # end for
+
+    return SyntheticOrder(synthetic_creditor(), receipts, len(set(group_indexes)))
+# end synthetic_order
+
+
+def _synthetic_debtor(index: int, rng: random.Random):
+    """The partner and the bank account of a debtor"""
+
+    city, state, zip_code = rng.choice(CITIES)
+    vat_number = f'{10000000000 + index * 7919:011d}'[-11:]
+
+    partner = PartnerFake(
+        id=100 + index,
+        name=' '.join(filter(None, (
+            rng.choice(NAME_PREFIXES), rng.choice(NAME_SURNAMES), rng.choice(NAME_SUFFIXES)
+        ))),
+        ref=f'C{index:06d}',
+        # Half of the debtors have the VAT number, the others the fiscal code
+        vat=f'IT{vat_number}' if index % 2 else '',
+        fiscalcode=vat_number,
+        street=f'{rng.choice(STREETS)} {rng.randrange(1, 200)}',
+        city=city,
+        zip=zip_code,
+        state_id={'code': state},
+    )
+
+    abi = f'{rng.randrange(1000, 99999):05d}'
+    cab = f'{rng.randrange(1000, 99999):05d}'
+    bank_account = BankAccountFake(
+        bank_name=rng.choice(BANK_NAMES),
+        iban=f'IT60X{abi}{cab}{rng.randrange(10 ** 12):012d}',
+    )
+
+    return partner, bank_account
+# end _synthetic_debtor
@@ -0,0 +1,70 @@
+"""Benchmark of the compiled templates cache.
+
+Run from the ribalta directory with:
+
+    python -m tests.benchmarks.template_cache [repetitions]
+"""
+
+import sys
+import tempfile
+import time
+
+from ribalta import templates
+from ribalta.riba import Document
+
+from ..tools.data_load import build_document
+
+
+DATASET_NAME = 'riba_collapsible_ok'
+
+
+def time_render(riba_doc: Document) -> float:
+    start = time.perf_counter()
+    riba_doc.render_cbi()
+    return time.perf_counter() - start
+# end time_render
+
+
+def run(repetitions: int = 100) -> dict:
+    riba_doc = build_document(DATASET_NAME)
+    results = dict()
+
+    # Cold render: the template is compiled in memory
+    templates.set_module_directory(None)
+    results['cold (in memory)'] = time_render(riba_doc)
+
+    # Warm renders: the compiled template is taken from the cache
+    results['warm (avg)'] = sum(
+        time_render(riba_doc) for _ in range(repetitions)
+    ) / repetitions
+
+    with tempfile.TemporaryDirectory() as module_dir:
+        # Cold render with an empty modules directory: the generated
+        # module is written to disk
+        templates.set_module_directory(module_dir)
+        results['cold (module dir, empty)'] = time_render(riba_doc)
+
+        # Cold render with the modules directory already populated: this is
+        # what happens in a new process, no code generation is performed
+        templates.clear_templates_cache()
+        results['cold (module dir, populated)'] = time_render(riba_doc)
+    # end with
+
+    templates.set_module_directory(None)
+
+    return results
+# end run
+
+
+def main():
+    repetitions = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+
+    for label, seconds in run(repetitions).items():
+        print(f'{label:<30} {seconds * 1000:10.3f} ms')
+    # end for
+# end main
+
+
+if __name__ == '__main__':
+    main()
+# end if
@@ -0,0 +1,66 @@
+from .tools.data_load import FakeData
+from .tools.fakes import RecordsetFake
+
+from ribalta.riba import Document, FrozenReceipt, Receipt
+
+
+def build_payment_lines(number_of_lines: int) -> RecordsetFake:
+    # Reload the dataset to get independent objects for each line
+    payment_lines = list()
+    while len(payment_lines) < number_of_lines:
+        payment_lines.extend(
+            FakeData.build_from_test_data('riba_collapsible_ok').receipts
+        )
+    # end while
+
+    return RecordsetFake(payment_lines[:number_of_lines])
+# end build_payment_lines
+
+
+def test_from_payment_lines_same_receipts():
+
+    test_data = FakeData.build_from_test_data('riba_collapsible_ok')
+
+    single = [Receipt(line) for line in test_data.receipts]
+    bulk = Receipt.from_payment_lines(RecordsetFake(test_data.receipts))
+
+    assert [str(r) for r in single] == [str(r) for r in bulk]
+
+    snapshots = Receipt.from_payment_lines(
+        RecordsetFake(test_data.receipts), snapshot=True
+    )
+    assert all(isinstance(r, FrozenReceipt) for r in snapshots)
+    assert snapshots == [r.snapshot() for r in single]
+
+# end test_from_payment_lines_same_receipts
+
+
+def test_from_payment_lines_query_count():
+
+    # Receipts built one at a time: queries grow with the number of lines
+    payment_lines = build_payment_lines(50)
+    for line in payment_lines:
+        Receipt(line)
+    # end for
+    queries_one_by_one = payment_lines.counter.count
+
+    # Receipts built in bulk: constant number of queries
+    small = build_payment_lines(5)
+    Receipt.from_payment_lines(small)
+
+    large = build_payment_lines(50)
+    Receipt.from_payment_lines(large)
+
+    assert small.counter.count == large.counter.count
+    assert large.counter.count < queries_one_by_one
+
+    # No query is performed once the receipts are built
+    queries_before_render = large.counter.count
+    riba_doc = Document(**FakeData.build_from_test_data('riba_collapsible_ok').head)
+    for rcpt in Receipt.from_payment_lines(large):
+        riba_doc.add_receipt(rcpt)
+    # end for
+    riba_doc.render_cbi()
+    assert large.counter.count == queries_before_render
+
+# end test_from_payment_lines_query_count
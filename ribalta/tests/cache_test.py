@@ -0,0 +1,179 @@
+from datetime import datetime
+import os
+
+import pytest
+
+from .tools.data_load import build_document
+
+from ribalta import grouping
+from ribalta.cache import DirectoryRenderCache, MemoryRenderCache, document_key
+from ribalta.records.cbi import RECORD_SIZE
+
+
+# Receipts of the riba_collapsible_ok dataset
+COLLAPSIBLE_RECEIPTS = 11
+
+
+@pytest.mark.parametrize('group', [False, True, grouping.by_debtor_bank_any_duedate])
+def test_cached_rendering(group):
+
+    cache = MemoryRenderCache()
+    riba_doc = build_document('riba_collapsible_ok', snapshots=True)
+    expected = riba_doc.render_cbi(group)
+
+    assert riba_doc.render_cbi(group, cache=cache) == expected
+    assert (cache.hits, cache.misses, len(cache)) == (0, 1, 1)
+    assert riba_doc.render_cbi(group, cache=cache) == expected
+    assert cache.hits == 1
+
+    # A new creation date changes only the IB and EF records
+    other_doc = build_document('riba_collapsible_ok', creation_date=datetime(2021, 1, 15, 8, 0), snapshots=True)
+    cbi_str = other_doc.render_cbi(group, cache=cache)
+    assert cache.hits == 2
+    assert cbi_str == other_doc.render_cbi(group)
+    assert cbi_str[RECORD_SIZE:-RECORD_SIZE] == expected[RECORD_SIZE:-RECORD_SIZE]
+    assert cbi_str[:RECORD_SIZE] != expected[:RECORD_SIZE]
+
+# end test_cached_rendering
+
+
+def test_document_key():
+
+    riba_doc = build_document('riba_collapsible_ok', snapshots=True)
+    key = document_key(riba_doc)
+
+    assert key == document_key(build_document('riba_collapsible_ok', creation_date=datetime(2022, 3, 1), snapshots=True))
+    assert key != document_key(riba_doc, group=True)
+    assert key != document_key(build_document('riba_collapsible_ok', 2 * COLLAPSIBLE_RECEIPTS, snapshots=True))
+    assert key != document_key(build_document('riba_ok', snapshots=True))
+
+    # Windows of the same width have the same name
+    window = grouping.by_duedate_window(5)
+    assert document_key(riba_doc, window) == document_key(riba_doc, grouping.by_duedate_window(5))
+    assert document_key(riba_doc, window) != document_key(riba_doc, grouping.by_duedate_window(6))
+
+    # Policies without a stable name are rendered without the cache
+    cache = MemoryRenderCache()
+    anonymous = lambda rcpt: window(rcpt)  # noqa: E731
+    assert document_key(riba_doc, anonymous) is None
+    assert riba_doc.render_cbi(anonymous, cache=cache) == riba_doc.render_cbi(window)
+    assert len(cache) == 0
+
+# end test_document_key
+
+
+def test_eviction():
+
+    documents = [build_document('riba_collapsible_ok', n * COLLAPSIBLE_RECEIPTS, snapshots=True) for n in (1, 2, 3)]
+    body_sizes = [len(doc.render_cbi()) - 2 * RECORD_SIZE for doc in documents]
+
+    cache = MemoryRenderCache(max_bytes=body_sizes[1] + body_sizes[2])
+    for riba_doc in documents[:2]:
+        riba_doc.render_cbi(cache=cache)
+    # end for
+    assert cache.size == body_sizes[0] + body_sizes[1]
+
+    # The least recently used body is evicted
+    documents[0].render_cbi(cache=cache)
+    documents[2].render_cbi(cache=cache)
+    assert cache.size <= cache.max_bytes
+    assert document_key(documents[1]) not in cache
+    assert document_key(documents[0]) in cache
+
+    # Bodies larger than the bound are not cached
+    small_cache = MemoryRenderCache(max_bytes=body_sizes[0] - 1)
+    documents[0].render_cbi(cache=small_cache)
+    assert len(small_cache) == 0
+
+    cache.clear()
+    assert (len(cache), cache.size) == (0, 0)
+
+# end test_eviction
+
+
+def test_directory_cache(tmp_path):
+
+    riba_doc = build_document('riba_collapsible_ok', snapshots=True)
+    expected = riba_doc.render_cbi(group=True)
+
+    cache = DirectoryRenderCache(str(tmp_path / 'cache'))
+    assert riba_doc.render_cbi(True, cache=cache) == expected
+    assert len(list((tmp_path / 'cache').iterdir())) == 1
+
+    # The bodies survive the cache object
+    other_cache = DirectoryRenderCache(str(tmp_path / 'cache'), max_bytes=cache.size)
+    assert other_cache.size == cache.size
+    assert riba_doc.render_cbi(True, cache=other_cache) == expected
+    assert other_cache.hits == 1
+
+    # Bodies removed by other processes are rendered again
+    other_cache.clear()
+    assert riba_doc.render_cbi(True, cache=cache) == expected
+    assert cache.misses == 2
+    assert len(list((tmp_path / 'cache').iterdir())) == 1
+
+# end test_directory_cache
+
+
+def test_directory_cache_processes(tmp_path):
+
+    documents = [build_document('riba_collapsible_ok', n * COLLAPSIBLE_RECEIPTS, snapshots=True) for n in (1, 2)]
+    expected = [riba_doc.render_cbi() for riba_doc in documents]
+
+    # Two processes sharing the directory
+    directory = str(tmp_path / 'cache')
+    cache = DirectoryRenderCache(directory)
+    other_cache = DirectoryRenderCache(directory)
+
+    # Bodies stored by the other process are found on disk
+    assert documents[0].render_cbi(cache=cache) == expected[0]
+    assert documents[0].render_cbi(cache=other_cache) == expected[0]
+    assert other_cache.hits == 1 and other_cache.misses == 0
+
+    # The bound applies to the bodies of both processes
+    bounded_cache = DirectoryRenderCache(directory, max_bytes=2 * cache.size + 16)
+    assert documents[1].render_cbi(cache=bounded_cache) == expected[1]
+    assert [path.name for path in (tmp_path / 'cache').iterdir()] == [document_key(documents[1]) + '.cbibody']
+
+    # Malformed files are missed and replaced
+    path = tmp_path / 'cache' / (document_key(documents[1]) + '.cbibody')
+    path.write_bytes(b'garbage')
+    assert documents[1].render_cbi(cache=other_cache) == expected[1]
+    assert other_cache.misses == 1
+    assert documents[1].render_cbi(cache=other_cache) == expected[1]
+    assert other_cache.hits == 2
+
+# end test_directory_cache_processes
+
+
+def test_directory_cache_scans(tmp_path, monkeypatch):
+
+    documents = [build_document('riba_collapsible_ok', n * COLLAPSIBLE_RECEIPTS, snapshots=True) for n in (1, 2, 3)]
+    expected = [riba_doc.render_cbi() for riba_doc in documents]
+
+    # Directories scanned
+    scans = []
+    scandir = os.scandir
+    monkeypatch.setattr(os, 'scandir', lambda path: scans.append(path) or scandir(path))
+
+    # The directory is scanned when the cache is opened, not by each body stored
+    directory = str(tmp_path / 'cache')
+    cache = DirectoryRenderCache(directory)
+    for riba_doc, cbi in zip(documents, expected):
+        assert riba_doc.render_cbi(cache=cache) == cbi
+    # end for
+    assert len(scans) == 1
+    assert len(cache) == 3
+
+    # ...and again only when a body would exceed the bound
+    scans.clear()
+    bounded_cache = DirectoryRenderCache(directory, max_bytes=cache.size)
+    assert len(bounded_cache) == 3 and len(scans) == 1
+    riba_doc = build_document('riba_collapsible_ok', 4 * COLLAPSIBLE_RECEIPTS, snapshots=True)
+    assert riba_doc.render_cbi(cache=bounded_cache) == riba_doc.render_cbi()
+    assert len(scans) == 2
+    assert document_key(riba_doc) in bounded_cache
+    assert document_key(documents[0]) not in bounded_cache
+    assert bounded_cache.size <= bounded_cache.max_bytes
+
+# end test_directory_cache_scans
@@ -0,0 +1,225 @@
+import csv
+from datetime import date, datetime
+import json
+
+import pytest
+
+from .tools.data_load import FakeData
+
+from ribalta.cli import main
+from ribalta.plain_data import receipt_from_record
+from ribalta.riba import Document, FrozenCreditor, Receipt
+
+
+CREATION_DATE = datetime(2020, 11, 20, 10, 30)
+
+
+def plain_value(value):
+    if isinstance(value, datetime):
+        return value.date().isoformat()
+    elif isinstance(value, date):
+        return value.isoformat()
+    else:
+        return value
+    # end if
+# end plain_value
+
+
+def write_dataset(dataset_name: str, directory, repetitions: int = 1):
+    """Write the creditor and the receipts of a dataset as plain data files,
+    return the paths and the document built from the same data"""
+
+    test_data = FakeData.build_from_test_data(dataset_name)
+    creditor = FrozenCreditor.from_records(**test_data.head)
+
+    riba_doc = Document.from_snapshot(creditor, CREATION_DATE)
+    records = list()
+    for _ in range(repetitions):
+        for payment_line in test_data.receipts:
+            rcpt = Receipt(payment_line).snapshot()
+            riba_doc.add_receipt(rcpt)
+            records.append({name: plain_value(value) for name, value in rcpt.as_dict().items()})
+        # end for
+    # end for
+
+    creditor_path = directory / 'creditor.json'
+    creditor_path.write_text(json.dumps(creditor.as_dict()))
+
+    jsonl_path = directory / 'receipts.jsonl'
+    jsonl_path.write_text(''.join(json.dumps(record) + '\n' for record in records))
+
+    csv_path = directory / 'receipts.csv'
+    with open(csv_path, 'w', newline='') as fp:
+        writer = csv.DictWriter(fp, fieldnames=list(records[0]))
+        writer.writeheader()
+        writer.writerows(records)
+    # end with
+
+    return creditor_path, jsonl_path, csv_path, riba_doc
+# end write_dataset
+
+
+def test_render_stream(tmp_path):
+
+    creditor_path, jsonl_path, csv_path, riba_doc = write_dataset('riba_collapsible_ok', tmp_path)
+    expected = riba_doc.render_cbi()
+
+    for receipts_path in (jsonl_path, csv_path):
+        output = tmp_path / 'riba.cbi'
+        exit_code = main([
+            'render', str(receipts_path), '--creditor', str(creditor_path),
+            '-o', str(output), '--creation-date', CREATION_DATE.isoformat(),
+        ])
+        assert exit_code == 0
+        assert output.read_bytes().decode('ascii') == expected
+    # end for
+
+    # Grouped
+    output = tmp_path / 'grouped.cbi'
+    exit_code = main([
+        'render', str(jsonl_path), '--creditor', str(creditor_path), '--group',
+        '-o', str(output), '--creation-date', CREATION_DATE.isoformat(),
+    ])
+    assert exit_code == 0
+    assert output.read_bytes().decode('ascii') == riba_doc.render_cbi(group=True)
+
+# end test_render_stream
+
+
+def test_render_split(tmp_path):
+
+    creditor_path, jsonl_path, _, riba_doc = write_dataset('riba_collapsible_ok', tmp_path)
+
+    for jobs in ('1', '2'):
+        output_dir = tmp_path / f'supports-{jobs}'
+        exit_code = main([
+            'render', str(jsonl_path), '--creditor', str(creditor_path),
+            '--split', '4', '--jobs', jobs, '--name', 'RIBA',
+            '-o', str(output_dir), '--creation-date', CREATION_DATE.isoformat(),
+        ])
+        assert exit_code == 0
+
+        supports = sorted(output_dir.iterdir())
+        assert len(supports) == 3
+        flows = [path.read_bytes().decode('ascii') for path in supports]
+        assert sum(flow.count('\r\n') for flow in flows) == riba_doc.receipts_count * 7 + 3 * 2
+    # end for
+
+# end test_render_split
+
+
+def test_render_invalid(tmp_path, capsys):
+
+    creditor_path, jsonl_path, _, _ = write_dataset('riba_ok', tmp_path)
+
+    lines = jsonl_path.read_text().splitlines()
+    record = json.loads(lines[1])
+    record['debtor_bank_abi'] = '123'
+    lines[1] = json.dumps(record)
+    jsonl_path.write_text('\n'.join(lines) + '\n')
+
+    output = tmp_path / 'riba.cbi'
+    exit_code = main(['render', str(jsonl_path), '--creditor', str(creditor_path), '-o', str(output)])
+
+    # Nothing written, the errors are printed
+    assert exit_code == 1
+    assert not output.exists()
+    assert list(tmp_path.glob('.ribalta-*')) == []
+    assert 'receipt 2' in capsys.readouterr().err
+
+    # Records that can't be read
+    jsonl_path.write_text(lines[0] + '\n{"debtor_name": "X"}\n')
+    exit_code = main(['render', str(jsonl_path), '--creditor', str(creditor_path), '-o', str(output)])
+    assert exit_code == 1
+    assert 'Line 2' in capsys.readouterr().err
+    assert not output.exists()
+
+# end test_render_invalid
+
+
+@pytest.mark.parametrize('options', [['--group'], ['--split', '2']])
+def test_render_invalid_in_memory(tmp_path, capsys, options):
+
+    creditor_path, jsonl_path, _, _ = write_dataset('riba_ok', tmp_path)
+
+    lines = jsonl_path.read_text().splitlines()
+    for position in (1, 2):
+        record = json.loads(lines[position])
+        record['debtor_bank_abi'] = '123'
+        lines[position] = json.dumps(record)
+    # end for
+    jsonl_path.write_text('\n'.join(lines) + '\n')
+
+    output = tmp_path / 'out'
+    output.mkdir()
+    exit_code = main(['render', str(jsonl_path), '--creditor', str(creditor_path), '-o', str(output / 'riba.cbi')] + options)
+
+    # All the receipts are read and the errors reported like when streaming
+    assert exit_code == 1
+    assert list(output.iterdir()) == []
+    err = capsys.readouterr().err
+    assert f'2 errors in {len(lines)} receipts' in err
+    assert 'receipt 2' in err and 'receipt 3' in err
+    assert 'debtor_bank_abi' in err
+
+# end test_render_invalid_in_memory
+
+
+def test_render_invalid_stdout(tmp_path, capsysbinary):
+
+    creditor_path, jsonl_path, _, riba_doc = write_dataset('riba_ok', tmp_path)
+
+    # Valid: the flow is written to the standard output
+    exit_code = main([
+        'render', str(jsonl_path), '--creditor', str(creditor_path),
+        '--creation-date', CREATION_DATE.isoformat(),
+    ])
+    assert exit_code == 0
+    assert capsysbinary.readouterr().out.decode('ascii') == riba_doc.render_cbi()
+
+    # Invalid: nothing is written
+    lines = jsonl_path.read_text().splitlines()
+    record = json.loads(lines[1])
+    # No IBAN and no bank codes
+    del record['debtor_bank_abi'], record['debtor_bank_cab']
+    lines[1] = json.dumps(record)
+    jsonl_path.write_text('\n'.join(lines) + '\n')
+
+    exit_code = main(['render', str(jsonl_path), '--creditor', str(creditor_path)])
+    assert exit_code == 1
+    assert capsysbinary.readouterr().out == b''
+
+    # Amounts that aren't numbers
+    record['amount'] = 'NaN'
+    jsonl_path.write_text(lines[0] + '\n' + json.dumps(record) + '\n')
+    exit_code = main(['render', str(jsonl_path), '--creditor', str(creditor_path)])
+    captured = capsysbinary.readouterr()
+    assert exit_code == 1
+    assert captured.out == b''
+    assert b'Line 2: Invalid amount' in captured.err
+
+    # Parallel rendering without splitting
+    exit_code = main(['render', str(jsonl_path), '--creditor', str(creditor_path), '--jobs', '2'])
+    assert exit_code == 1
+    assert b'--jobs requires --split' in capsysbinary.readouterr().err
+
+# end test_render_invalid_stdout
+
+
+def test_receipt_from_record():
+
+    rcpt = receipt_from_record({
+        'debtor_name': 'Kissa Komics S.R.L.',
+        'debtor_vat_number': 'IT04483400281',
+        'debtor_bank_iban': 'IT52 X050 1812 1011 2345 0054 321',
+        'duedate': '2020-12-28',
+        'amount': 36.6,
+    })
+
+    assert rcpt.debtor_fiscode_or_vat == '04483400281'
+    assert (rcpt.debtor_bank_abi, rcpt.debtor_bank_cab) == ('05018', '12101')
+    assert rcpt.duedate == date(2020, 12, 28)
+    assert rcpt.amount_cents == 3660
+    assert rcpt.invoice_date is False
+
+# end test_receipt_from_record
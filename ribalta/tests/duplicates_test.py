@@ -0,0 +1,154 @@
+import pytest
+
+from .tools.data_load import FakeData
+
+from ribalta.duplicates import (
+    DUPLICATE_FINGERPRINT, DUPLICATE_MOVE_LINE, DuplicateIndex, find_duplicates,
+)
+from ribalta.riba import (
+    Document, FrozenReceipt, Receipt, DUPLICATES_RAISE, DUPLICATES_REPORT,
+)
+from ribalta.utils.errors import DuplicateReceiptError
+
+
+def build_receipts(dataset_name: str):
+    test_data = FakeData.build_from_test_data(dataset_name)
+
+    # Distinct move lines
+    for move_line_id, payment_line in enumerate(test_data.receipts, 1):
+        payment_line.move_line_id.id = move_line_id
+    # end for
+
+    return test_data, [Receipt(payment_line) for payment_line in test_data.receipts]
+# end build_receipts
+
+
+def replace(rcpt, **changes) -> FrozenReceipt:
+    return FrozenReceipt(**dict(rcpt.snapshot().as_dict(), **changes))
+# end replace
+
+
+def test_duplicate_index():
+
+    _, receipts = build_receipts('riba_collapsible_ok')
+
+    index = DuplicateIndex(receipts)
+    assert len(index) == len(receipts)
+    assert not index.duplicates
+
+    # Same move line, whatever the amount
+    same_move_line = replace(receipts[3], amount=1.0)
+    duplicate = index.check(same_move_line)
+    assert duplicate.kind == DUPLICATE_MOVE_LINE
+    assert duplicate.original is receipts[3]
+    assert duplicate.original_position == 3
+    assert duplicate.position == len(receipts)
+
+    # check() doesn't change the index
+    assert len(index) == len(receipts)
+
+    # Same debtor, bank, due date and amount on another move line
+    same_fingerprint = replace(receipts[5], move_line_id=None)
+    assert index.add(same_fingerprint).kind == DUPLICATE_FINGERPRINT
+    assert 'receipt 6' in str(index.duplicates[0])
+
+    # Different amount and move line
+    assert index.add(replace(receipts[5], move_line_id=1000, amount=1.0)) is None
+    assert len(index.duplicates) == 1
+
+    index.clear()
+    assert len(index) == 0
+    assert index.add(receipts[0]) is None
+
+# end test_duplicate_index
+
+
+@pytest.mark.parametrize('columnar', [False, True])
+def test_remove_from_index(columnar):
+
+    test_data, receipts = build_receipts('riba_collapsible_ok')
+    same_move_line = replace(receipts[1], amount=1.0)
+    same_fingerprint = replace(receipts[1], move_line_id=None)
+    # Same fingerprint of a duplicate: not a duplicate while it's one
+    same_second_fingerprint = replace(same_move_line, move_line_id=None)
+
+    order = receipts[:3] + [same_move_line, same_fingerprint, same_second_fingerprint] + receipts[3:]
+    riba_doc = Document(**test_data.head, duplicates=DUPLICATES_REPORT, columnar=columnar)
+    for rcpt in order:
+        riba_doc.add_receipt(rcpt)
+    # end for
+    assert [(d.position, d.original_position) for d in riba_doc.duplicates] == [(3, 1), (4, 1)]
+
+    def summary(duplicates):
+        return [
+            (d.kind, d.position, d.original_position, d.receipt.amount_cents, d.original.amount_cents)
+            for d in duplicates
+        ]
+    # end summary
+
+    def check_index():
+        # The same duplicates of an index built again
+        assert summary(riba_doc.duplicates) == summary(find_duplicates(riba_doc.receipts))
+    # end check_index
+
+    # The removed original: its duplicates become originals or are reported
+    # against the receipts becoming originals
+    riba_doc.remove_receipt(1)
+    assert [(d.position, d.original_position) for d in riba_doc.duplicates] == [(4, 2)]
+    check_index()
+
+    # A removed duplicate moves back the following receipts
+    riba_doc.remove_receipt(0)
+    assert [(d.position, d.original_position) for d in riba_doc.duplicates] == [(3, 1)]
+    check_index()
+    assert riba_doc.duplicates[0].original.amount_cents == same_move_line.amount_cents
+
+    riba_doc.remove_receipt(-1)
+    check_index()
+
+    for position in range(riba_doc.receipts_count - 1, -1, -1):
+        riba_doc.remove_receipt(position)
+        check_index()
+    # end for
+    assert riba_doc.duplicates == []
+
+# end test_remove_from_index
+
+
+def test_document_duplicates():
+
+    test_data, receipts = build_receipts('riba_ok')
+    doubled = receipts + [Receipt(test_data.receipts[1])]
+
+    # Not checked while adding: computed on request
+    riba_doc = Document(**test_data.head)
+    for rcpt in doubled:
+        riba_doc.add_receipt(rcpt)
+    # end for
+    assert [d.original_position for d in riba_doc.duplicates] == [1]
+    assert find_duplicates(doubled)[0].kind == DUPLICATE_MOVE_LINE
+
+    # Reported
+    riba_doc = Document(**test_data.head, duplicates=DUPLICATES_REPORT)
+    for rcpt in doubled:
+        riba_doc.add_receipt(rcpt)
+    # end for
+    assert riba_doc.receipts_count == len(doubled)
+    assert [d.position for d in riba_doc.duplicates] == [len(receipts)]
+
+    # Refused
+    riba_doc = Document(**test_data.head, duplicates=DUPLICATES_RAISE)
+    for rcpt in receipts:
+        riba_doc.add_receipt(rcpt)
+    # end for
+    with pytest.raises(DuplicateReceiptError):
+        riba_doc.add_receipt(doubled[-1])
+    # end with
+    assert riba_doc.receipts_count == len(receipts)
+    assert riba_doc.total_amount_cents == sum(rcpt.amount_cents for rcpt in receipts)
+
+    with pytest.raises(ValueError):
+        Document(**test_data.head, duplicates='skip')
+    # end with
+
+# end test_document_duplicates
@@ -0,0 +1,137 @@
+import pytest
+
+from .tools.data_load import build_document, load_data_as_bytes
+
+from ribalta.flow_validator import (
+    ISSUE_FIELD, ISSUE_LENGTH, ISSUE_PROGRESSIVE, ISSUE_SEQUENCE, ISSUE_TOTALS,
+    validate_flow, validate_flow_file,
+)
+from ribalta.riba import RENDER_BACKENDS
+from ribalta.utils.errors import CBIFormatError
+
+
+RECORD_SIZE = 122
+
+
+def replace_record(cbi_doc: bytes, index: int, start: int, value: bytes) -> bytes:
+    """Replace part of a record, start is the position of the first
+    character to be replaced counting from 1"""
+    offset = index * RECORD_SIZE + start - 1
+    return cbi_doc[:offset] + value + cbi_doc[offset + len(value):]
+# end replace_record
+
+
+def issue_codes(report):
+    return [issue.code for issue in report.issues]
+# end issue_codes
+
+
+@pytest.mark.parametrize('backend', RENDER_BACKENDS)
+@pytest.mark.parametrize('group', [False, True])
+def test_valid_flow(backend, group):
+
+    riba_doc = build_document('riba_collapsible_ok')
+    report = validate_flow(riba_doc.render_cbi(group, backend))
+
+    assert report.is_valid, str(report)
+    assert report.dispositions_count == len(riba_doc.dispositions(group))
+    assert report.total_amount_cents == riba_doc.total_amount_cents
+    assert report.records_count == report.dispositions_count * 7 + 2
+    report.raise_if_invalid()
+
+    assert validate_flow(riba_doc.render_cbi_bytes(group)).is_valid
+
+# end test_valid_flow
+
+
+def test_invalid_flows():
+
+    cbi_doc = build_document('riba_ok').render_cbi().encode('ascii')
+
+    # Amount changed: the EF total doesn't match
+    report = validate_flow(replace_record(cbi_doc, 1, 34, b'0000000999999'))
+    assert issue_codes(report) == [ISSUE_TOTALS]
+    with pytest.raises(CBIFormatError):
+        report.raise_if_invalid()
+    # end with
+
+    # Wrong progressive numbers
+    report = validate_flow(replace_record(cbi_doc, 9, 4, b'0000003'))
+    assert issue_codes(report) == [ISSUE_PROGRESSIVE]
+    report = validate_flow(replace_record(cbi_doc, 6, 11, b'0000000009'))
+    assert issue_codes(report) == [ISSUE_PROGRESSIVE]
+
+    # Filler and numeric fields
+    report = validate_flow(replace_record(cbi_doc, 1, 12, b'X'))
+    assert issue_codes(report) == [ISSUE_FIELD, ISSUE_TOTALS]
+    assert '11-22' in report.issues[0].message
+    report = validate_flow(replace_record(cbi_doc, 1, 40, b'A'))
+    assert issue_codes(report) == [ISSUE_FIELD, ISSUE_TOTALS]
+    assert 'amount_cents' in report.issues[0].message
+
+    # Non ASCII text
+    report = validate_flow(cbi_doc.decode().replace('S.R.L.', 'S.R.È.', 1))
+    assert ISSUE_FIELD in issue_codes(report)
+
+    # Missing record
+    report = validate_flow(cbi_doc[:RECORD_SIZE * 2] + cbi_doc[RECORD_SIZE * 3:])
+    assert ISSUE_SEQUENCE in issue_codes(report)
+
+    # Truncated flow and wrong terminators
+    report = validate_flow(cbi_doc[:-1])
+    assert issue_codes(report)[0] == ISSUE_LENGTH
+    report = validate_flow(cbi_doc.replace(b'\r\n', b'\n'))
+    assert not report.is_valid
+    assert not validate_flow(b'').is_valid
+
+    # EF different from IB
+    report = validate_flow(replace_record(cbi_doc, 22, 20, b'X'))
+    assert issue_codes(report) == [ISSUE_TOTALS]
+
+# end test_invalid_flows
+
+
+def test_max_issues():
+
+    cbi_doc = build_document('riba_collapsible_ok').render_cbi().encode('ascii')
+
+    report = validate_flow(cbi_doc.replace(b' 20', b' 21'), max_issues=5)
+    assert len(report.issues) == 5
+    assert report.truncated
+    assert 'o piu' in str(report)
+
+# end test_max_issues
+
+
+def test_reference_diff(tmp_path):
+
+    reference = load_data_as_bytes('riba_ok.cbi_reference')
+    cbi_doc = build_document('riba_ok').render_cbi().encode('ascii')
+
+    # Creation date and name are ignored
+    report = validate_flow(cbi_doc, reference)
+    assert report.is_valid, str(report)
+
+    changed = replace_record(cbi_doc, 3, 11, b'X')
+    report = validate_flow(changed, reference)
+    assert not report.issues
+    assert [difference.index for difference in report.differences] == [3]
+    assert report.as_dicts()[0]['code'] == 'reference'
+    assert not report.is_valid
+
+    report = validate_flow(cbi_doc[:-RECORD_SIZE], reference)
+    assert report.differences[-1].found is None
+
+    cbi_file = tmp_path / 'riba.cbi'
+    cbi_file.write_bytes(changed)
+    reference_file = tmp_path / 'reference.cbi'
+    reference_file.write_bytes(reference)
+
+    report = validate_flow_file(cbi_file, reference_file)
+    assert [difference.index for difference in report.differences] == [3]
+
+    empty_file = tmp_path / 'empty.cbi'
+    empty_file.write_bytes(b'')
+    assert not validate_flow_file(empty_file).is_valid
+
+# end test_reference_diff
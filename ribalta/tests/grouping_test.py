@@ -0,0 +1,114 @@
+import logging
+
+import pytest
+
+from .tools.data_load import FakeData
+
+from ribalta import grouping
+from ribalta.riba import Document, Receipt
+from ribalta.utils.errors import MixedDuedatesError
+
+
+def build_receipts():
+    test_data = FakeData.build_from_test_data('riba_collapsible_ok')
+    return [Receipt(payment_line) for payment_line in test_data.receipts]
+# end build_receipts
+
+
+def test_group_first_seen_order():
+
+    receipts = build_receipts()
+    groups = grouping.group(receipts)
+
+    # Each receipt appears in exactly one group, in its original order
+    flattened = [rcpt for g in groups for rcpt in g]
+    assert sorted(map(id, flattened)) == sorted(map(id, receipts))
+    for g in groups:
+        positions = [receipts.index(rcpt) for rcpt in g]
+        assert positions == sorted(positions)
+        assert len({rcpt.grouping_key for rcpt in g}) == 1
+    # end for
+
+    # Groups are in order of first appearance
+    first_positions = [receipts.index(g[0]) for g in groups]
+    assert first_positions == sorted(first_positions)
+
+    # Same result on the same input
+    assert groups == grouping.group(receipts)
+
+# end test_group_first_seen_order
+
+
+def test_grouping_policies(caplog):
+
+    receipts = build_receipts()
+
+    # Different due dates are refused, unless explicitly merged
+    with pytest.raises(MixedDuedatesError):
+        grouping.group(receipts, grouping.by_debtor_bank)
+    # end with
+    same_duedate = [rcpt for rcpt in receipts if rcpt.duedate == receipts[0].duedate]
+    assert grouping.group(same_duedate, grouping.by_debtor_bank) == grouping.group(same_duedate)
+
+    with caplog.at_level(logging.INFO, logger=grouping.__name__):
+        by_debtor_bank = grouping.group(receipts, grouping.by_debtor_bank_any_duedate)
+    # end with
+    default = grouping.group(receipts)
+    assert len(by_debtor_bank) < len(default)
+    merged = [g for g in by_debtor_bank if len({rcpt.duedate for rcpt in g}) > 1]
+    assert len(caplog.records) == len(merged) > 0
+    assert str(merged[0][0].duedate.date()) in caplog.records[0].getMessage()
+
+    # A one day window is the same as grouping by due date
+    one_day = grouping.group(receipts, grouping.by_duedate_window(1))
+    assert [len(g) for g in one_day] == [len(g) for g in default]
+
+    # A very large window is the same as ignoring the due date
+    huge = grouping.group(receipts, grouping.by_duedate_window(1000000))
+    assert [len(g) for g in huge] == [len(g) for g in by_debtor_bank]
+
+    # Windows merging different due dates log them
+    caplog.clear()
+    with caplog.at_level(logging.INFO, logger=grouping.__name__):
+        grouping.group(receipts, grouping.by_duedate_window(1000000))
+    # end with
+    assert len(caplog.records) == len(merged)
+    assert str(merged[0][0].duedate.date()) in caplog.records[0].getMessage()
+
+    caplog.clear()
+    with caplog.at_level(logging.INFO, logger=grouping.__name__):
+        grouping.group(receipts, grouping.by_duedate_window(1))
+    # end with
+    assert caplog.records == []
+
+    with pytest.raises(ValueError):
+        grouping.by_duedate_window(0)
+    # end with
+
+# end test_grouping_policies
+
+
+def test_render_with_grouping_policy():
+
+    test_data = FakeData.build_from_test_data('riba_collapsible_ok')
+
+    riba_doc = Document(**test_data.head)
+    for payment_line in test_data.receipts:
+        riba_doc.add_receipt(Receipt(payment_line))
+    # end for
+
+    assert (
+        riba_doc.render_cbi(group=True)
+        == riba_doc.render_cbi(group=grouping.by_debtor_bank_duedate)
+    )
+
+    cbi_by_debtor_bank = riba_doc.render_cbi(group=grouping.by_debtor_bank_any_duedate)
+    records_count = len(cbi_by_debtor_bank.split('\r\n')) - 1
+    expected_lines = len(grouping.group(riba_doc._receipts, grouping.by_debtor_bank_any_duedate))
+    assert records_count == expected_lines * 7 + 2
+
+    with pytest.raises(MixedDuedatesError):
+        riba_doc.render_cbi(group=grouping.by_debtor_bank)
+    # end with
+
+# end test_render_with_grouping_policy
@@ -0,0 +1,59 @@
+import os
+import subprocess
+import sys
+
+from .benchmarks.import_time import IMPORTED_MODULES, measure_import, measure_startup
+
+
+# Upper bound of the import time, relative to the time needed to start a bare
+# interpreter so that it scales with the speed of the machine: importing any
+# ribalta module costs less than starting Python (ribalta itself about a
+# third of it)
+MAX_IMPORT_STARTUP_RATIO = 1.0
+
+
+def test_import_is_light():
+
+    max_seconds = measure_startup(3) * MAX_IMPORT_STARTUP_RATIO
+
+    for module in IMPORTED_MODULES:
+        measure = measure_import(module, 3)
+        assert measure.loaded == [], module
+        assert measure.seconds < max_seconds, module
+    # end for
+
+# end test_import_is_light
+
+
+def test_deferred_modules():
+
+    # Imported by the code paths using them, not by ribalta
+    deferred = ('ribalta.duplicates', 'ribalta.grouping', 'ribalta.records', 'ribalta.table')
+
+    output = subprocess.run(
+        [sys.executable, '-c', f'import sys, ribalta; print([m for m in {deferred!r} if m in sys.modules])'],
+        env=dict(os.environ, PYTHONPATH=os.pathsep.join(p for p in sys.path if p)), check=True,
+        stdout=subprocess.PIPE, universal_newlines=True,
+    ).stdout
+    assert output.strip() == '[]'
+
+# end test_deferred_modules
+
+
+def test_lazy_submodules():
+
+    import ribalta
+
+    assert ribalta.parser.iter_records is sys.modules['ribalta.parser'].iter_records
+    assert 'reconciliation' in dir(ribalta)
+
+    try:
+        ribalta.not_a_module
+    except AttributeError:
+        pass
+    else:
+        assert False, 'AttributeError not raised'
+    # end try / except
+
+# end test_lazy_submodules
+
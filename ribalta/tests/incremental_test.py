@@ -0,0 +1,136 @@
+import pytest
+
+from .tools.data_load import FakeData
+
+from ribalta import grouping
+from ribalta.profiling import PHASE_RENDERING, RenderProfiler
+from ribalta.riba import (
+    DUPLICATES_RAISE, DUPLICATES_REPORT, RENDER_BACKEND_MAKO, RENDER_BACKEND_RECORDS, Document, Receipt,
+)
+from ribalta.utils.errors import DuplicateReceiptError
+
+
+def rendered_blocks(riba_doc: Document, group=False) -> int:
+    """Render the document incrementally, check the result and return the
+    number of blocks rendered"""
+    profiler = RenderProfiler()
+    cbi_str = riba_doc.render_cbi(group, profiler=profiler, incremental=True)
+    assert cbi_str == riba_doc.render_cbi(group)
+    return profiler.report().by_name()[PHASE_RENDERING].items
+# end rendered_blocks
+
+
+@pytest.mark.parametrize('columnar', [False, True])
+def test_incremental_rendering(columnar):
+
+    test_data = FakeData.build_from_test_data('riba_collapsible_ok')
+    receipts = [Receipt(payment_line) for payment_line in test_data.receipts]
+
+    riba_doc = Document(**test_data.head, columnar=columnar)
+    for rcpt in receipts[:5]:
+        riba_doc.add_receipt(rcpt)
+    # end for
+    assert rendered_blocks(riba_doc) == 5
+    assert rendered_blocks(riba_doc) == 0
+
+    # Appended receipts
+    riba_doc.add_receipt(receipts[5])
+    riba_doc.add_receipt(receipts[6])
+    assert rendered_blocks(riba_doc) == 2
+
+    # Removed receipts: only the following ones are renumbered
+    removed = riba_doc.remove_receipt(-1)
+    assert removed.debtor_name == receipts[6].debtor_name
+    assert rendered_blocks(riba_doc) == 0
+
+    riba_doc.remove_receipt(3)
+    assert riba_doc.receipts_count == 5
+    assert riba_doc.total_amount_cents == sum(
+        rcpt.amount_cents for rcpt in receipts[:3] + receipts[4:6]
+    )
+    assert rendered_blocks(riba_doc) == 2
+
+    # Another grouping renders all the blocks again
+    lines_count = len(riba_doc.dispositions(True))
+    assert rendered_blocks(riba_doc, True) == lines_count
+    riba_doc.add_receipt(receipts[3])
+    assert rendered_blocks(riba_doc, True) <= lines_count + 1
+
+    # Windows of the same width, built again for each rendering, keep the blocks
+    lines_count = len(riba_doc.dispositions(grouping.by_duedate_window(5)))
+    assert rendered_blocks(riba_doc, grouping.by_duedate_window(5)) == lines_count
+    assert rendered_blocks(riba_doc, grouping.by_duedate_window(5)) == 0
+    assert rendered_blocks(riba_doc, grouping.by_duedate_window(6)) == len(riba_doc.dispositions(
+        grouping.by_duedate_window(6)
+    ))
+
+    with pytest.raises(IndexError):
+        riba_doc.remove_receipt(riba_doc.receipts_count)
+    # end with
+
+    with pytest.raises(ValueError):
+        riba_doc.render_cbi(incremental=True, cache=object())
+    # end with
+    with pytest.raises(ValueError):
+        riba_doc.render_cbi(incremental=True, backend=RENDER_BACKEND_MAKO)
+    # end with
+    assert riba_doc.render_cbi(incremental=True, backend=RENDER_BACKEND_RECORDS) == riba_doc.render_cbi()
+
+# end test_incremental_rendering
+
+
+@pytest.mark.parametrize('group', [False, True])
+def test_incremental_reads(monkeypatch, group):
+
+    test_data = FakeData.build_from_test_data('riba_collapsible_ok')
+    receipts = [Receipt(payment_line) for payment_line in test_data.receipts]
+
+    riba_doc = Document(**test_data.head)
+    for rcpt in receipts[:-1]:
+        riba_doc.add_receipt(rcpt)
+    # end for
+
+    # Each snapshot reads all the fields of the Odoo objects
+    snapshots = list()
+    snapshot = Receipt.snapshot
+    monkeypatch.setattr(Receipt, 'snapshot', lambda rcpt: snapshots.append(rcpt) or snapshot(rcpt))
+
+    riba_doc.render_cbi(group, incremental=True)
+    assert len(snapshots) == len(receipts) - 1
+
+    # Only the new receipts are read
+    snapshots.clear()
+    riba_doc.add_receipt(receipts[-1])
+    assert rendered_blocks(riba_doc, group) >= 1
+    assert snapshots == [receipts[-1]]
+
+    snapshots.clear()
+    riba_doc.remove_receipt(0)
+    riba_doc.render_cbi(group, incremental=True)
+    assert snapshots == []
+
+# end test_incremental_reads
+
+
+def test_remove_duplicates():
+
+    test_data = FakeData.build_from_test_data('riba_ok')
+    rcpt = Receipt(test_data.receipts[0])
+
+    riba_doc = Document(**test_data.head, duplicates=DUPLICATES_REPORT)
+    riba_doc.add_receipt(rcpt)
+    riba_doc.add_receipt(rcpt)
+    assert len(riba_doc.duplicates) == 1
+
+    riba_doc.remove_receipt(0)
+    assert riba_doc.duplicates == []
+
+    strict_doc = Document(**test_data.head, duplicates=DUPLICATES_RAISE)
+    strict_doc.add_receipt(rcpt)
+    strict_doc.remove_receipt(0)
+    strict_doc.add_receipt(rcpt)
+    with pytest.raises(DuplicateReceiptError):
+        strict_doc.add_receipt(rcpt)
+    # end with
+
+# end test_remove_duplicates
@@ -0,0 +1,60 @@
+from decimal import Decimal
+
+from .tools.data_load import FakeData
+
+from ribalta.riba import Document, Receipt, ReceiptGroup
+from ribalta.utils.money import from_cents, to_cents
+
+
+def test_to_cents():
+
+    assert to_cents(36.6) == 3660
+    assert to_cents(42.7) == 4270
+    assert to_cents(0.1 + 0.2) == 30
+    assert to_cents(12) == 1200
+    assert to_cents(Decimal('1.005')) == 101
+    assert to_cents(Decimal('19.99')) == 1999
+
+    assert from_cents(1999) == Decimal('19.99')
+
+# end test_to_cents
+
+
+def test_document_running_totals():
+
+    test_data = FakeData.build_from_test_data('riba_ok')
+
+    riba_doc = Document(**test_data.head)
+    assert riba_doc.total_amount_cents == 0
+    assert riba_doc.receipts_count == 0
+
+    receipts = [Receipt(payment_line) for payment_line in test_data.receipts]
+    for _ in range(1000):
+        for rcpt in receipts:
+            riba_doc.add_receipt(rcpt)
+        # end for
+    # end for
+
+    # 36.60 + 42.70 + 42.70 = 122.00, repeated 1000 times without float drift
+    assert riba_doc.receipts_count == 3000
+    assert riba_doc.total_amount_cents == 12200000
+    assert riba_doc.total_amount == Decimal('122000')
+
+    # The EF record carries the running total
+    ef = riba_doc.render_cbi().split('\r\n')[-2]
+    assert ef[52:67] == '000000012200000'
+
+# end test_document_running_totals
+
+
+def test_receipt_group_amount():
+
+    test_data = FakeData.build_from_test_data('riba_collapsible_ok')
+
+    receipts = [Receipt(payment_line) for payment_line in test_data.receipts]
+    group = ReceiptGroup(receipts)
+
+    assert group.amount_cents == sum(r.amount_cents for r in receipts)
+    assert group.amount == from_cents(group.amount_cents)
+
+# end test_receipt_group_amount
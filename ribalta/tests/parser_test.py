@@ -0,0 +1,106 @@
+import pytest
+
+from .tools.data_load import build_document
+
+from ribalta.parser import CBIReader, CBIRecord, RECORD_CLASSES, iter_dispositions, iter_records
+from ribalta.utils.errors import CBIFormatError
+
+
+@pytest.mark.parametrize('terminator', ['\r\n', '\n', ''])
+def test_parse_file(tmp_path, terminator):
+
+    riba_doc = build_document('riba_collapsible_ok')
+    cbi_doc = riba_doc.render_cbi().replace('\r\n', terminator)
+
+    cbi_file = tmp_path / 'riba.cbi'
+    cbi_file.write_text(cbi_doc, encoding='ascii', newline='')
+
+    with CBIReader(cbi_file) as reader:
+        assert reader.stride == 120 + len(terminator)
+        assert len(reader) == 7 * riba_doc.receipts_count + 2
+        assert reader[0].record_type == 'IB'
+        assert reader[-1].record_type == 'EF'
+    # end with
+
+    records = list(iter_records(cbi_file))
+    assert [type(record) for record in records[:8]] == [
+        RECORD_CLASSES[record_type]
+        for record_type in ('IB', '14', '20', '30', '40', '50', '51', '70')
+    ]
+
+    ib, ef = records[0], records[-1]
+    assert ib.name == ef.name == riba_doc.name
+    assert ib.creation_date == riba_doc.creation_date.date()
+    assert ef.num_disposizioni == riba_doc.receipts_count
+    assert ef.total_amount_cents == riba_doc.total_amount_cents
+    assert ef.num_records == len(records)
+
+    dispositions = list(iter_dispositions(records))
+    assert len(dispositions) == riba_doc.receipts_count
+
+    for progressive, (rcpt, disposition) in enumerate(zip(riba_doc.receipts, dispositions), 1):
+        r14, r20, r30, r40, r50, r51, r70 = disposition
+        assert r14.num_progr == r51.num_progr == progressive
+        assert r14.duedate == rcpt.duedate.date()
+        assert r14.amount_cents == rcpt.amount_cents
+        assert r14.debtor_bank_abi == rcpt.debtor_bank_abi
+        assert r30.debtor_fiscode_or_vat == rcpt.debtor_fiscode_or_vat
+        assert r30['debtor_name'] == r30.get('debtor_name') == r30.as_dict()['debtor_name']
+    # end for
+
+# end test_parse_file
+
+
+def test_parse_bytes():
+
+    cbi_doc = build_document('riba_ok').render_cbi()
+
+    reader = CBIReader.from_bytes(cbi_doc)
+    assert [record.text for record in reader] == cbi_doc.split('\r\n')[:-1]
+    assert list(reader) == list(CBIReader.from_bytes(cbi_doc.encode()))
+
+    r14 = reader[1]
+    assert 'amount_cents' in r14.field_names
+    assert r14.get('missing_field', 0) == 0
+    with pytest.raises(KeyError):
+        r14['missing_field']
+    # end with
+    with pytest.raises(IndexError):
+        reader[len(reader)]
+    # end with
+
+    # Unknown record types are returned untyped
+    unknown = CBIReader.from_bytes(' XX'.ljust(120))[0]
+    assert type(unknown) is CBIRecord
+    assert unknown.record_type == 'XX'
+    assert unknown.as_dict() == {}
+
+    assert len(CBIReader.from_bytes(b'')) == 0
+
+# end test_parse_bytes
+
+
+def test_parse_invalid():
+
+    cbi_doc = build_document('riba_ok').render_cbi()
+
+    with pytest.raises(CBIFormatError):
+        CBIReader.from_bytes(cbi_doc[:-10])
+    # end with
+
+    # Disposizione without record 70
+    records = list(CBIReader.from_bytes(cbi_doc))
+    with pytest.raises(CBIFormatError):
+        list(iter_dispositions(records[:-2]))
+    # end with
+
+    # Due date of the record 14 (columns 23-28) not a date
+    lines = cbi_doc.split('\r\n')
+    lines[1] = lines[1][:22] + '310299' + lines[1][28:]
+    record = list(CBIReader.from_bytes('\r\n'.join(lines)))[1]
+    assert record.record_type == '14'
+    with pytest.raises(CBIFormatError):
+        record.duedate
+    # end with
+
+# end test_parse_invalid
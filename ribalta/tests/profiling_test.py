@@ -0,0 +1,157 @@
+import io
+import json
+import time
+import tracemalloc
+
+import pytest
+
+from .tools.data_load import FakeData
+from .tools.fakes import RecordsetFake
+
+from ribalta.profiling import (
+    PHASE_GROUPING, PHASE_PREFETCH, PHASE_RECEIPTS, PHASE_RENDERING, PHASE_SNAPSHOTS,
+    PHASE_VALIDATION, PHASE_WRITING, PhaseStats, RenderProfiler,
+)
+from ribalta.riba import Document, Receipt, RENDER_BACKENDS
+from ribalta.utils.validators import validate_batch
+
+
+def test_profiled_document(tmp_path):
+
+    test_data = FakeData.build_from_test_data('riba_collapsible_ok')
+
+    finished = list()
+    profiler = RenderProfiler(trace_memory=True, callback=finished.append)
+
+    receipts = Receipt.from_payment_lines(
+        RecordsetFake(test_data.receipts), snapshot=True, validate=False, profiler=profiler
+    )
+    validate_batch(receipts, profiler=profiler)
+
+    riba_doc = Document(**test_data.head)
+    for rcpt in receipts:
+        riba_doc.add_receipt(rcpt)
+    # end for
+
+    for backend in RENDER_BACKENDS:
+        riba_doc.render_cbi(group=True, backend=backend, profiler=profiler)
+    # end for
+    riba_doc.render_cbi_bytes(profiler=profiler)
+    records_count = riba_doc.write_cbi(io.BytesIO(), profiler=profiler)
+
+    report = profiler.report()
+    assert report.phases == finished
+    assert [phase.name for phase in report.phases] == [
+        PHASE_PREFETCH, PHASE_RECEIPTS, PHASE_SNAPSHOTS, PHASE_VALIDATION,
+        PHASE_GROUPING, PHASE_RENDERING,
+        PHASE_GROUPING, PHASE_RENDERING,
+        PHASE_GROUPING, PHASE_RENDERING,
+        PHASE_GROUPING, PHASE_WRITING,
+    ]
+
+    receipts_count = len(test_data.receipts)
+    groups_count = len(riba_doc.dispositions(True))
+    by_name = report.by_name()
+    assert by_name[PHASE_RECEIPTS].items == receipts_count
+    assert by_name[PHASE_VALIDATION].items == receipts_count
+    assert by_name[PHASE_RENDERING].items == groups_count * 2 + receipts_count
+    assert by_name[PHASE_WRITING].items == records_count
+
+    assert all(phase.duration >= 0 for phase in report.phases)
+    assert all(phase.peak_memory is not None for phase in report.phases)
+    assert report.total_duration == pytest.approx(sum(phase.duration for phase in report.phases))
+
+    data = json.loads(report.as_json())
+    assert [phase['name'] for phase in data['phases']] == [phase.name for phase in report.phases]
+    assert str(report).startswith('total:')
+
+    profiler.reset()
+    assert not profiler.report().phases
+
+# end test_profiled_document
+
+
+def test_profiler_phase():
+
+    profiler = RenderProfiler()
+
+    with profiler.phase('custom', 10):
+        pass
+    # end with
+
+    with pytest.raises(ZeroDivisionError):
+        with profiler.phase('failing') as phase:
+            phase.items = 1
+            1 / 0
+        # end with
+    # end with
+
+    custom, failing = profiler.report().phases
+    assert custom.items == 10 and custom.peak_memory is None
+    assert failing.name == 'failing' and failing.items == 1
+
+    assert PhaseStats('x', 0.5, 10).items_per_second == 20
+    assert PhaseStats('x', 0.5).items_per_second is None
+
+# end test_profiler_phase
+
+
+@pytest.mark.parametrize('reset_peak', [True, False])
+def test_nested_phases_memory(reset_peak, monkeypatch):
+
+    if not reset_peak:
+        # Python < 3.9
+        monkeypatch.delattr(tracemalloc, 'reset_peak', raising=False)
+    # end if
+
+    profiler = RenderProfiler(trace_memory=True)
+    size = 4 * 2 ** 20
+
+    with profiler.phase('outer'):
+        buffer = bytearray(size)
+        del buffer
+        with profiler.phase('inner'):
+            buffer = bytearray(size // 2)
+        # end with
+        with profiler.phase('second inner'):
+            pass
+        # end with
+    # end with
+    del buffer
+
+    inner, second_inner, outer = profiler.report().phases
+    assert size // 2 <= inner.peak_memory < size
+    assert second_inner.peak_memory < size // 4
+    # The peak of the outer phase was before the nested ones
+    assert outer.peak_memory >= size
+
+    assert not tracemalloc.is_tracing()
+
+# end test_nested_phases_memory
+
+
+def test_nested_phases_duration():
+
+    profiler = RenderProfiler()
+
+    with profiler.phase('outer'):
+        with profiler.phase('inner'):
+            time.sleep(0.02)
+        # end with
+    # end with
+    with profiler.phase('other'):
+        pass
+    # end with
+
+    report = profiler.report()
+    inner, outer, other = report.phases
+    assert (inner.depth, outer.depth, other.depth) == (1, 0, 0)
+
+    # The nested phase is part of the outer one
+    assert report.total_duration == outer.duration + other.duration
+    assert report.total_duration < outer.duration + inner.duration
+    assert report.as_dict()['total_duration'] == report.total_duration
+
+    assert report.by_name()['inner'].depth == 1
+
+# end test_nested_phases_duration
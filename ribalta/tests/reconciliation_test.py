@@ -0,0 +1,109 @@
+import pytest
+
+from .tools.data_load import build_document
+
+from ribalta.parser import CBIReader
+from ribalta.reconciliation import ReconciliationIndex, iter_returned_dispositions
+
+
+@pytest.mark.parametrize('group', [False, True])
+def test_reconcile_same_flow(tmp_path, group):
+
+    riba_doc = build_document('riba_collapsible_ok')
+    index = ReconciliationIndex.from_document(riba_doc, group)
+    dispositions = riba_doc.dispositions(group)
+    assert len(index) == len(dispositions)
+
+    cbi_file = tmp_path / 'returned.cbi'
+    with open(cbi_file, 'wb') as fp:
+        riba_doc.write_cbi(fp, group)
+    # end with
+
+    result = index.reconcile_file(cbi_file)
+
+    assert not result.unmatched
+    assert not result.ambiguous
+    assert not result.repeated
+    assert len(result.matched) == len(dispositions)
+    for match in result.matched:
+        assert match.returned.progressive == match.issued.progressive
+        assert str(match.issued.issued) == str(dispositions[match.issued.progressive - 1])
+        assert match.returned.amount_cents == match.issued.issued.amount_cents
+        assert len(match.returned.records) == 7
+    # end for
+
+# end test_reconcile_same_flow
+
+
+def test_reconcile_renumbered_flow():
+
+    # Progressive numbers of the returned flow don't match the issued ones
+    riba_doc = build_document('riba_ok')
+    returned_doc = build_document('riba_ok', reverse=True)
+
+    index = ReconciliationIndex.from_document(riba_doc)
+    result = index.reconcile(CBIReader.from_bytes(returned_doc.render_cbi()))
+
+    assert len(result.matched) == 3
+    for match in result.matched:
+        assert match.issued.issued.amount_cents == match.returned.amount_cents
+        assert match.issued.issued.duedate.date() == match.returned.duedate
+    # end for
+
+# end test_reconcile_renumbered_flow
+
+
+def test_reconcile_unmatched_and_ambiguous():
+
+    riba_doc = build_document('riba_ok', 6)
+    index = ReconciliationIndex.from_document(riba_doc)
+
+    # Same receipts in reverse order: the one keeping its progressive number
+    # matches, each one of the others matches two issued disposizioni
+    returned_doc = build_document('riba_ok', reverse=True)
+    result = index.reconcile(CBIReader.from_bytes(returned_doc.render_cbi()))
+    assert [match.issued.progressive for match in result.matched] == [2]
+    assert len(result.ambiguous) == 2
+    assert all(len(ambiguous.candidates) == 2 for ambiguous in result.ambiguous)
+
+    # A returned disposizione can't match twice the same issued one
+    twice = riba_doc.render_cbi().split('\r\n')
+    records = list(CBIReader.from_bytes(''.join(twice[1:8]) * 2))
+    result = ReconciliationIndex.from_document(build_document('riba_ok')).reconcile(records)
+    assert len(result.matched) == 1
+    assert not result.ambiguous
+    assert len(result.repeated) == 1
+    assert result.repeated[0].reconciled == (result.matched[0].issued,)
+
+    # When the issued disposizione with the same progressive number is already
+    # matched, the other ones with the same data are looked up
+    result = index.reconcile(records)
+    assert [match.issued.progressive for match in result.matched] == [1, 4]
+    assert not result.ambiguous and not result.repeated
+
+    # Receipts never issued
+    other_doc = build_document('riba_collapsible_ok')
+    result = index.reconcile(CBIReader.from_bytes(other_doc.render_cbi()))
+    assert len(result.unmatched) == other_doc.receipts_count
+
+# end test_reconcile_unmatched_and_ambiguous
+
+
+def test_returned_dispositions_partial_records():
+
+    # Returned flows may contain only some of the records of each disposizione
+    cbi_doc = build_document('riba_ok').render_cbi()
+    records = [
+        record for record in CBIReader.from_bytes(cbi_doc)
+        if record.record_type in ('IB', '14', '30', 'EF')
+    ]
+
+    returned = list(iter_returned_dispositions(records))
+    assert [item.progressive for item in returned] == [1, 2, 3]
+    assert all(item.fiscode_or_vat == '04483400281' for item in returned)
+    assert all(len(item.records) == 2 for item in returned)
+
+    returned = list(iter_returned_dispositions(r for r in records if r.record_type != '30'))
+    assert all(item.fiscode_or_vat is None for item in returned)
+
+# end test_returned_dispositions_partial_records
@@ -0,0 +1,152 @@
+import pytest
+
+from .tools.data_load import build_document
+from .tools.validators import CBIReferenceModelValidator, CBIFormatValidator
+
+from ribalta.records import Constant, Field, Filler, RecordLayout, JUSTIFY_RIGHT, compile_records
+from ribalta.riba import RENDER_BACKEND_MAKO, RENDER_BACKEND_RECORDS
+
+
+DATASETS = [
+    'riba_ok',
+    'riba_debt_fiscode_empty_str',
+    'riba_debt_fiscode_false',
+    'riba_cred_no_fiscode',
+    'riba_collapsible_ok',
+]
+
+
+@pytest.mark.parametrize('dataset_name', DATASETS)
+@pytest.mark.parametrize('group', [False, True])
+def test_records_backend_same_output_as_mako(dataset_name, group):
+
+    riba_doc = build_document(dataset_name)
+
+    cbi_mako = riba_doc.render_cbi(group=group, backend=RENDER_BACKEND_MAKO)
+    cbi_records = riba_doc.render_cbi(group=group, backend=RENDER_BACKEND_RECORDS)
+
+    assert cbi_mako.encode() == cbi_records.encode()
+
+# end test_records_backend_same_output_as_mako
+
+
+@pytest.mark.parametrize('dataset_name, reference_name', [
+    ('riba_ok', 'riba_ok'),
+    ('riba_cred_no_fiscode', 'riba_cred_no_fiscode'),
+])
+def test_records_backend_reference(dataset_name, reference_name):
+
+    cbi_doc = build_document(dataset_name).render_cbi(backend=RENDER_BACKEND_RECORDS)
+
+    CBIFormatValidator(cbi_doc).validate()
+    CBIReferenceModelValidator.build_from_reference_model(reference_name).validate_data(cbi_doc)
+
+# end test_records_backend_reference
+
+
+def test_records_backend_invalid():
+
+    riba_doc = build_document('riba_ok')
+
+    with pytest.raises(ValueError):
+        riba_doc.render_cbi(backend='jinja')
+    # end with
+
+# end test_records_backend_invalid
+
+
+def test_record_layout():
+
+    layout = RecordLayout('XX', [
+        Constant(1, ' XX'),
+        Field('number', 4, 8, JUSTIFY_RIGHT, '0'),
+        Filler(9, 10),
+        Field('text', 11, 15),
+    ], length=15)
+
+    assert layout.format({'number': 42, 'text': 'ab'}) == ' XX00042  ab   '
+    assert layout.format({'number': 1234567, 'text': 'abcdefgh'}) == ' XX12345  abcde'
+    assert layout.field_names == ['number', 'text']
+
+    # Gap between fields
+    with pytest.raises(ValueError):
+        RecordLayout('XX', [Constant(1, ' XX'), Field('text', 5, 15)], length=15)
+    # end with
+
+    # Fields not covering the whole record
+    with pytest.raises(ValueError):
+        RecordLayout('XX', [Constant(1, ' XX'), Field('text', 4, 10)], length=15)
+    # end with
+
+# end test_record_layout
+
+
+def test_record_layout_bind():
+
+    layout = RecordLayout('XX', [
+        Constant(1, ' XX'),
+        Field('number', 4, 8, JUSTIFY_RIGHT, '0'),
+        Filler(9, 10),
+        Field('text', 11, 15),
+    ], length=15)
+
+    bound = layout.bind({'number': 42})
+    assert bound.field_names == ['text']
+    assert bound.format({'text': 'ab'}) == layout.format({'number': 42, 'text': 'ab'})
+
+    assert layout.format_span({'number': 42}, 4, 10) == '00042  '
+
+    # Span not aligned to the fields
+    with pytest.raises(ValueError):
+        layout.format_span({'number': 42}, 5, 10)
+    # end with
+
+# end test_record_layout_bind
+
+
+def test_compile_records():
+
+    first = RecordLayout('XX', [
+        Constant(1, ' XX'),
+        Field('number', 4, 8, JUSTIFY_RIGHT, '0'),
+        Field('text', 9, 15, transform=str.upper),
+    ], length=15)
+    second = RecordLayout('YY', [
+        Constant(1, ' YY'),
+        Field('number', 4, 8, JUSTIFY_RIGHT, '0'),
+        Field('text', 9, 10),
+        Filler(11, 15),
+    ], length=15)
+
+    format_records = compile_records([first, second], '\r\n', arguments=('number',))
+
+    class Line:
+        text = 'abc'
+    # end Line
+
+    values = {'number': 42, 'text': 'abc'}
+    assert format_records(Line(), 42) == first.format(values) + '\r\n' + second.format(values) + '\r\n'
+    assert format_records(Line(), 42) == ' XX00042ABC    \r\n YY00042ab     \r\n'
+    assert compile_records([])(Line()) == ''
+
+# end test_compile_records
+
+
+def test_creditor_segments():
+
+    riba_doc = build_document('riba_ok')
+    segments = riba_doc.creditor_segments
+
+    # Formatted only once for each document
+    assert riba_doc.creditor_segments is segments
+
+    records = riba_doc.render_cbi(backend=RENDER_BACKEND_RECORDS).split('\r\n')
+    assert records[0][3:8] == segments.sia_code
+    assert records[0][8:13] == segments.bank_abi
+    assert records[1][47:69] == segments.bank_coordinates
+    assert records[1][91:96] == segments.sia_code
+    assert records[2][10:106] == segments.description
+    assert records[5][100:116] == segments.fiscode
+    assert records[6][20:40] == segments.name
+
+# end test_creditor_segments
@@ -0,0 +1,80 @@
+import pickle
+
+import pytest
+
+from .tools.data_load import FakeData
+
+from ribalta.riba import (
+    Document, FrozenReceipt, Receipt, RENDER_BACKEND_MAKO, RENDER_BACKEND_RECORDS
+)
+
+
+def test_snapshot_fields():
+
+    test_data = FakeData.build_from_test_data('riba_ok')
+
+    for payment_line in test_data.receipts:
+        rcpt = Receipt(payment_line)
+        snapshot = rcpt.snapshot()
+
+        for name in FrozenReceipt.FIELDS:
+            assert getattr(snapshot, name) == getattr(rcpt, name)
+        # end for
+
+        assert snapshot.grouping_key == rcpt.grouping_key
+        assert snapshot.description == rcpt.description
+        assert str(snapshot) == str(rcpt)
+        assert not snapshot.is_group
+        assert snapshot.snapshot() is snapshot
+    # end for
+
+# end test_snapshot_fields
+
+
+def test_snapshot_immutable_and_picklable():
+
+    test_data = FakeData.build_from_test_data('riba_ok')
+    snapshot = Receipt(test_data.receipts[0]).snapshot()
+
+    with pytest.raises(AttributeError):
+        snapshot.amount = 0
+    # end with
+
+    with pytest.raises(AttributeError):
+        snapshot.some_new_attribute = 0
+    # end with
+
+    unpickled = pickle.loads(pickle.dumps(snapshot))
+    assert unpickled == snapshot
+    assert hash(unpickled) == hash(snapshot)
+
+    with pytest.raises(TypeError):
+        FrozenReceipt(amount=10)
+    # end with
+
+# end test_snapshot_immutable_and_picklable
+
+
+@pytest.mark.parametrize('backend', [RENDER_BACKEND_MAKO, RENDER_BACKEND_RECORDS])
+@pytest.mark.parametrize('group', [False, True])
+def test_snapshot_rendering(backend, group):
+
+    test_data = FakeData.build_from_test_data('riba_collapsible_ok')
+
+    riba_doc = Document(**test_data.head)
+    snapshot_doc = Document(**test_data.head)
+    # Same creation date to get the same document name
+    snapshot_doc._creation_date = riba_doc.creation_date
+
+    for payment_line in test_data.receipts:
+        rcpt = Receipt(payment_line)
+        riba_doc.add_receipt(rcpt)
+        snapshot_doc.add_receipt(rcpt.snapshot())
+    # end for
+
+    assert (
+        riba_doc.render_cbi(group=group, backend=backend)
+        == snapshot_doc.render_cbi(group=group, backend=backend)
+    )
+
+# end test_snapshot_rendering
@@ -0,0 +1,200 @@
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import logging
+import sys
+
+import pytest
+
+from .tools.data_load import build_document
+from .tools.validators import CBIFormatValidator
+
+from ribalta import grouping
+from ribalta.batch import render_split
+from ribalta.riba import RENDER_BACKEND_RECORDS
+from ribalta.utils import naming
+from ribalta.utils.naming import FileSupportNameRegistry, SupportNameRegistry, support_names
+
+
+DATASET_NAME = 'riba_collapsible_ok'
+
+
+def test_split_not_needed():
+
+    riba_doc = build_document(DATASET_NAME, 10)
+    assert riba_doc.split(10) == [riba_doc]
+
+    with pytest.raises(ValueError):
+        riba_doc.split(0)
+    # end with
+
+# end test_split_not_needed
+
+
+def test_split():
+
+    riba_doc = build_document(DATASET_NAME, 25)
+    supports = riba_doc.split(10)
+
+    assert [support.receipts_count for support in supports] == [10, 10, 5]
+    assert sum(support.total_amount_cents for support in supports) == riba_doc.total_amount_cents
+    assert [rcpt for support in supports for rcpt in support.receipts] == list(riba_doc.receipts)
+
+    # Names are unique, also splitting again in the same second
+    names = [support.name for support in supports + riba_doc.split(10)]
+    assert len(set(names)) == len(names)
+    assert all(name.startswith(riba_doc.name) and len(name) <= 20 for name in names)
+
+    for support in supports:
+        cbi_doc = support.render_cbi()
+        CBIFormatValidator(cbi_doc).validate()
+        assert support.name in cbi_doc.split('\r\n')[0]
+        assert support.creditor_company is riba_doc.creditor_company
+    # end for
+
+# end test_split
+
+
+@pytest.mark.parametrize('group', [True, grouping.by_debtor_bank_any_duedate])
+def test_split_grouped(group):
+
+    riba_doc = build_document(DATASET_NAME, 40)
+    groups_count = len(riba_doc._lines(group))
+
+    supports = riba_doc.split(2, group=group)
+
+    assert sum(len(support._lines(group)) for support in supports) == groups_count
+    assert all(len(support._lines(group)) <= 2 for support in supports)
+    assert sum(support.total_amount_cents for support in supports) == riba_doc.total_amount_cents
+
+# end test_split_grouped
+
+
+def test_render_split():
+
+    riba_doc = build_document(DATASET_NAME, 25)
+
+    with ThreadPoolExecutor(4) as executor:
+        results = render_split(riba_doc, 10, executor=executor)
+    # end with
+
+    assert len(results) == 3
+    assert len({result.name for result in results}) == 3
+    for result in results:
+        assert result.ok
+        assert result.key == result.name
+        CBIFormatValidator(result.cbi).validate()
+    # end for
+
+    results = render_split(riba_doc, 10, backend=RENDER_BACKEND_RECORDS, max_workers=2)
+    assert all(result.ok for result in results)
+
+# end test_render_split
+
+
+def test_support_names_registry():
+
+    registry = SupportNameRegistry(size=2)
+
+    assert registry.reserve('A', 2) == ['A001', 'A002']
+    assert registry.reserve('A') == ['A003']
+    assert registry.reserve('B') == ['B001']
+
+    with pytest.raises(ValueError):
+        registry.reserve('A', 997)
+    # end with
+    assert registry.reserve('A', 996)[-1] == 'A999'
+
+    with pytest.raises(ValueError):
+        registry.reserve('X' * 18)
+    # end with
+
+    registry.clear()
+    assert registry.reserve('A') == ['A001']
+
+    assert isinstance(support_names, SupportNameRegistry)
+
+# end test_support_names_registry
+
+
+def reserve_from_file(path: str, base_name: str, count: int):
+    return FileSupportNameRegistry(path).reserve(base_name, count)
+# end reserve_from_file
+
+
+def test_file_support_names(tmp_path):
+
+    path = str(tmp_path / 'support_names.json')
+    registry = FileSupportNameRegistry(path, size=2)
+
+    assert registry.reserve('A', 2) == ['A001', 'A002']
+    assert FileSupportNameRegistry(path).reserve('A') == ['A003']
+    assert registry.reserve('B') == ['B001']
+    assert registry.reserve('C') == ['C001']
+    # Forgotten, like the oldest names of the registry of the process
+    assert registry.reserve('A') == ['A001']
+
+    assert registry.reserve('C', 998)[-1] == 'C999'
+    with pytest.raises(ValueError):
+        registry.reserve('C')
+    # end with
+
+    registry.clear()
+    assert registry.reserve('C') == ['C001']
+
+    # Processes sharing the file never get the same name
+    with ProcessPoolExecutor(2) as executor:
+        reserved = list(executor.map(reserve_from_file, [path] * 20, ['D'] * 20, [3] * 20))
+    # end with
+    names = [name for names in reserved for name in names]
+    assert sorted(names) == [f'D{sequence:03d}' for sequence in range(1, 61)]
+
+# end test_file_support_names
+
+
+def test_file_support_names_unavailable(tmp_path, monkeypatch, caplog):
+
+    # Platforms without fcntl (Windows)
+    monkeypatch.setitem(sys.modules, 'fcntl', None)
+    path = str(tmp_path / 'support_names.json')
+
+    with pytest.raises(RuntimeError):
+        FileSupportNameRegistry(path)
+    # end with
+
+    # The registry set by the environment falls back to the one of the process
+    monkeypatch.setenv(naming.SUPPORT_NAMES_FILE_ENV_VAR, path)
+    default = naming.support_names
+    try:
+        with caplog.at_level(logging.WARNING, logger=naming.__name__):
+            naming.set_support_names()
+        # end with
+        assert isinstance(naming.support_names, SupportNameRegistry)
+        assert naming.SUPPORT_NAMES_FILE_ENV_VAR in caplog.text
+    finally:
+        naming.set_support_names(default)
+    # end try / finally
+
+# end test_file_support_names_unavailable
+
+
+def test_split_names(tmp_path):
+
+    riba_doc = build_document(DATASET_NAME, 25)
+    registry = SupportNameRegistry()
+    registry.reserve(riba_doc.name, 5)
+
+    supports = riba_doc.split(10, names=registry)
+    assert [support.name for support in supports] == [f'{riba_doc.name}{sequence:03d}' for sequence in (6, 7, 8)]
+
+    # The registry of the process
+    default = naming.support_names
+    try:
+        naming.set_support_names(registry)
+        assert riba_doc.split(10)[0].name == f'{riba_doc.name}009'
+
+        naming.set_support_names()
+        assert isinstance(naming.support_names, SupportNameRegistry)
+    finally:
+        naming.set_support_names(default)
+    # end try / finally
+
+# end test_split_names
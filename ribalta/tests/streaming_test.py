@@ -0,0 +1,123 @@
+import io
+import tracemalloc
+
+import pytest
+
+from .tools.data_load import build_document
+from .tools.validators import CBIReferenceModelValidator, CBIFormatValidator
+
+from ribalta.records.cbi import flow_size
+from ribalta.riba import RENDER_BACKEND_RECORDS
+
+
+class NullWriter(io.RawIOBase):
+    """Binary destination discarding everything is written to it"""
+
+    def writable(self):
+        return True
+    # end writable
+
+    def write(self, b):
+        return len(b)
+    # end write
+# end NullWriter
+
+
+def test_iter_cbi_records():
+
+    riba_doc = build_document('riba_ok')
+
+    records = list(riba_doc.iter_cbi_records())
+    assert len(records) == 3 * 7 + 2
+    assert all(r.endswith('\r\n') for r in records)
+
+    cbi_doc = ''.join(records)
+    assert cbi_doc == riba_doc.render_cbi()
+
+    CBIFormatValidator(cbi_doc).validate()
+    CBIReferenceModelValidator.build_from_reference_model('riba_ok').validate_data(cbi_doc)
+
+# end test_iter_cbi_records
+
+
+def test_write_cbi():
+
+    riba_doc = build_document('riba_collapsible_ok')
+
+    for group in (False, True):
+        text_fp = io.StringIO()
+        binary_fp = io.BytesIO()
+
+        records_count = riba_doc.write_cbi(text_fp, group=group)
+        riba_doc.write_cbi(binary_fp, group=group)
+
+        cbi_doc = riba_doc.render_cbi(group=group)
+        assert text_fp.getvalue() == cbi_doc
+        assert binary_fp.getvalue() == cbi_doc.encode('ascii')
+        assert records_count == len(cbi_doc.split('\r\n')) - 1
+    # end for
+
+# end test_write_cbi
+
+
+def test_write_cbi_constant_memory():
+
+    def peak_memory(number_of_receipts):
+        riba_doc = build_document('riba_ok', number_of_receipts)
+
+        tracemalloc.start()
+        try:
+            riba_doc.write_cbi(NullWriter())
+            return tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+        # end try / finally
+    # end peak_memory
+
+    # Rendering ten times more receipts must not require (much) more memory
+    assert peak_memory(5000) < 2 * peak_memory(500)
+
+# end test_write_cbi_constant_memory
+
+
+@pytest.mark.parametrize('group', [False, True])
+def test_render_cbi_bytes(tmp_path, group):
+
+    riba_doc = build_document('riba_collapsible_ok')
+    cbi_bytes = riba_doc.render_cbi_bytes(group)
+
+    assert isinstance(cbi_bytes, memoryview)
+    assert len(cbi_bytes) == flow_size(len(riba_doc.dispositions(group)))
+    assert cbi_bytes == riba_doc.render_cbi(group).encode('ascii')
+
+    cbi_file = tmp_path / 'riba.cbi'
+    with open(cbi_file, 'wb') as fp:
+        fp.write(cbi_bytes)
+    # end with
+    CBIFormatValidator(cbi_file.read_bytes().decode('ascii')).validate()
+
+# end test_render_cbi_bytes
+
+
+def test_render_cbi_bytes_memory():
+
+    riba_doc = build_document('riba_collapsible_ok', 2000)
+    size = flow_size(riba_doc.receipts_count)
+
+    tracemalloc.start()
+    try:
+        riba_doc.render_cbi_bytes()
+        _, bytes_peak = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+
+        riba_doc.render_cbi(backend=RENDER_BACKEND_RECORDS).encode('ascii')
+        _, str_peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    # end try / finally
+
+    # Only the output buffer, no full copies of the document
+    assert bytes_peak < size * 1.1
+    assert bytes_peak < str_peak
+
+# end test_render_cbi_bytes_memory
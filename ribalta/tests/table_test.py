@@ -0,0 +1,171 @@
+import pickle
+import tracemalloc
+
+import pytest
+
+from .benchmarks.synthetic import synthetic_order
+from .tools.data_load import FakeData
+
+from ribalta.riba import Document, FrozenReceipt, Receipt, RENDER_BACKENDS
+from ribalta.table import INVALID_CODE, ReceiptTable, TextColumn
+from ribalta.utils.validators import validate_batch
+
+
+def build_documents(dataset_name: str, repetitions: int = 1):
+    """Build the same document with the receipts in a list and in a table"""
+    test_data = FakeData.build_from_test_data(dataset_name)
+
+    documents = list()
+    for columnar in (False, True):
+        riba_doc = Document(**test_data.head, columnar=columnar)
+        for _ in range(repetitions):
+            for rcpt in test_data.receipts:
+                riba_doc.add_receipt(Receipt(rcpt))
+            # end for
+        # end for
+        documents.append(riba_doc)
+    # end for
+
+    return documents
+# end build_documents
+
+
+@pytest.mark.parametrize('backend', RENDER_BACKENDS)
+@pytest.mark.parametrize('group', [False, True])
+def test_columnar_rendering(backend, group):
+
+    list_doc, table_doc = build_documents('riba_collapsible_ok', 2)
+
+    assert table_doc.columnar and not list_doc.columnar
+    assert table_doc.receipts_count == list_doc.receipts_count
+    assert table_doc.total_amount_cents == list_doc.total_amount_cents
+    assert table_doc.render_cbi(group, backend) == list_doc.render_cbi(group, backend)
+    assert bytes(table_doc.render_cbi_bytes(group)) == bytes(list_doc.render_cbi_bytes(group))
+
+# end test_columnar_rendering
+
+
+def test_receipt_rows():
+
+    list_doc, table_doc = build_documents('riba_collapsible_ok')
+
+    for rcpt, row in zip(list_doc.receipts, table_doc.receipts):
+        snapshot = rcpt.snapshot()
+        assert row.debtor_name == snapshot.debtor_name
+        assert row.debtor_bank_abi == snapshot.debtor_bank_abi
+        assert row.amount_cents == snapshot.amount_cents
+        assert row.duedate == snapshot.duedate.date()
+        assert row.description == snapshot.description
+        assert isinstance(row.snapshot(), FrozenReceipt)
+    # end for
+
+    table = table_doc._receipts
+    assert table[-1].debtor_name == list_doc.receipts[-1].debtor_name
+    with pytest.raises(IndexError):
+        table[len(table)]
+    # end with
+
+    assert list(table.column('amount_cents')) == [r.amount_cents for r in list_doc.receipts]
+    assert table.total_amount_cents == list_doc.total_amount_cents
+
+    # Distinct values stored once
+    names = table.dictionary('debtor_name')
+    assert len(names.values) == len({r.debtor_name for r in list_doc.receipts})
+
+    # Pickling and copies keep the values
+    for other in (pickle.loads(pickle.dumps(table)), table.copy()):
+        assert [r.as_dict() for r in other] == [r.as_dict() for r in table]
+    # end for
+
+    # Supports and snapshots of columnar documents are columnar
+    assert all(support.columnar for support in table_doc.split(3))
+    assert table_doc.snapshot().render_cbi() == table_doc.render_cbi()
+
+# end test_receipt_rows
+
+
+def test_invalid_values():
+
+    test_data = FakeData.build_from_test_data('riba_ok')
+    snapshots = [Receipt(payment_line).snapshot() for payment_line in test_data.receipts]
+    fields = snapshots[1].as_dict()
+    invalid = [
+        FrozenReceipt(**dict(fields, debtor_bank_abi='123')),
+        FrozenReceipt(**dict(fields, debtor_bank_cab=12101)),
+        FrozenReceipt(**dict(fields, duedate=False)),
+    ]
+
+    # Stored like any other receipt, with the original values
+    table = ReceiptTable(snapshots + invalid)
+    assert [(row.debtor_bank_abi, row.debtor_bank_cab, row.duedate) for row in table][-3:] == [
+        ('123', '12101', fields['duedate'].date()), ('05018', 12101, fields['duedate'].date()), ('05018', '12101', False),
+    ]
+    assert list(table.column('debtor_bank_abi'))[-3] == INVALID_CODE
+
+    # The same errors of the other documents
+    list_doc = Document(**test_data.head)
+    table_doc = Document(**test_data.head, columnar=True)
+    for rcpt in snapshots + invalid:
+        list_doc.add_receipt(rcpt)
+        table_doc.add_receipt(rcpt)
+    # end for
+    expected = [str(issue) for issue in validate_batch(list_doc.receipts).issues]
+    assert any('debtor_bank_abi' in issue for issue in expected)
+    assert [str(issue) for issue in validate_batch(table_doc.receipts).issues] == expected
+
+    # Removed, copied and pickled with the other values
+    del table[len(snapshots)]
+    assert table[-2].debtor_bank_cab == 12101
+    for other in (table.copy(), pickle.loads(pickle.dumps(table))):
+        assert [r.as_dict() for r in other] == [r.as_dict() for r in table]
+    # end for
+    assert table[-1].duedate is False
+
+# end test_invalid_values
+
+
+def test_columnar_memory():
+
+    # Realistic order: communications and invoice numbers differ for each
+    # receipt, the debtors repeat
+    receipts = [Receipt(payment_line, validate=False) for payment_line in synthetic_order(5000).receipts]
+
+    tracemalloc.start()
+    try:
+        snapshots = [rcpt.snapshot() for rcpt in receipts]
+        list_size = tracemalloc.get_traced_memory()[0]
+
+        del snapshots
+        table_start = tracemalloc.get_traced_memory()[0]
+        table = ReceiptTable(receipts)
+        table_size = tracemalloc.get_traced_memory()[0] - table_start
+    finally:
+        tracemalloc.stop()
+    # end try / finally
+
+    assert len(table) == len(receipts)
+    assert table_size * 1.8 < list_size
+
+# end test_columnar_memory
+
+
+def test_text_column():
+
+    values = ['FATT/1', False, '', 'Società Niccolò', None, 'FATT/2']
+    column = TextColumn(values)
+    assert list(column) == values
+    assert column.memory_size == 8 * len(values) + len('FATT/1Società NiccolòFATT/2'.encode('utf-8'))
+
+    del column[1]
+    del column[2]
+    del values[1]
+    del values[2]
+    assert [column[i] for i in range(len(column))] == values == ['FATT/1', '', None, 'FATT/2']
+
+    copy = column.copy()
+    copy.append('FATT/3')
+    assert len(column) == 4
+    assert copy[4] == 'FATT/3'
+    assert pickle.loads(pickle.dumps(ReceiptTable())).text('invoice_number').memory_size == 0
+
+# end test_text_column
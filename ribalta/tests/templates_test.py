@@ -0,0 +1,43 @@
+import os
+import tempfile
+
+from ribalta import templates
+
+
+def test_templates_cache():
+
+    templates.clear_templates_cache()
+
+    # The template gets compiled only the first time it's requested
+    first = templates.get_template(templates.CBI_TEMPLATE_FILE)
+    second = templates.get_template(templates.CBI_TEMPLATE_FILE)
+    assert first is second
+
+    # After clearing the cache the template gets compiled again
+    templates.clear_templates_cache()
+    third = templates.get_template(templates.CBI_TEMPLATE_FILE)
+    assert third is not first
+
+# end test_templates_cache
+
+
+def test_templates_module_directory():
+
+    previous_module_directory = templates.get_module_directory()
+
+    try:
+        with tempfile.TemporaryDirectory() as module_dir:
+            templates.set_module_directory(module_dir)
+            templates.get_template(templates.CBI_TEMPLATE_FILE)
+
+            # The generated module must be stored in the modules directory
+            generated_files = [
+                f for _, _, files in os.walk(module_dir) for f in files
+            ]
+            assert templates.CBI_TEMPLATE_FILE + '.py' in generated_files
+        # end with
+    finally:
+        templates.set_module_directory(previous_module_directory)
+    # end try / finally
+
+# end test_templates_module_directory
@@ -0,0 +1,36 @@
+from unidecode import unidecode
+
+from ribalta.utils.text import ASCII_TRANSLATION_TABLE, to_ascii
+
+
+def test_translation_table_same_as_unidecode():
+
+    for code_point, transliteration in ASCII_TRANSLATION_TABLE.items():
+        assert transliteration == unidecode(chr(code_point))
+    # end for
+
+# end test_translation_table_same_as_unidecode
+
+
+def test_to_ascii():
+
+    texts = [
+        '',
+        'Kissa Komics S.R.L.',
+        'Società Cooperativa Università',
+        'Via Cà Rossa, 3 – Forlì',
+        'L’Aquila “centro”',
+        'Ελληνικά 株式会社',
+    ]
+
+    for text in texts:
+        assert to_ascii(text) == unidecode(text)
+        # Cached result
+        assert to_ascii(text) == unidecode(text)
+    # end for
+
+    # ASCII strings are returned as they are
+    text = 'Padova'
+    assert to_ascii(text) is text
+
+# end test_to_ascii
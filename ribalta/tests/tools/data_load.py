@@ -1,4 +1,5 @@
 from collections import namedtuple
+from datetime import datetime
 from pathlib import Path
 import importlib.resources
 import json
@@ -79,4 +80,47 @@ class FakeData:
 # end Dataset
 
 
-
+def build_document(
+        dataset_name: str, number_of_receipts: int = None, creation_date: datetime = None,
+        snapshots: bool = False, reverse: bool = False, **document_args
+):
+    """
+    Build a document holding the receipts of a dataset stored in the
+    tests.data package
+
+    :param dataset_name: name of the dataset, without the '.json' suffix
+    :param number_of_receipts: number of receipts of the document, the
+     receipts of the dataset are repeated as many times as needed. Defaults
+     to the receipts of the dataset.
+    :param creation_date: creation date of the document, defaults to now
+    :param snapshots: add the snapshots of the receipts
+    :param reverse: add the receipts in reverse order
+    :param document_args: other arguments of the Document constructor
+    :rtype: class:`ribalta.riba.Document`
+    """
+    from ribalta.riba import Document, Receipt
+
+    test_data = FakeData.build_from_test_data(dataset_name)
+
+    if number_of_receipts is None:
+        number_of_receipts = len(test_data.receipts)
+    # end if
+
+    receipts = [
+        Receipt(test_data.receipts[i % len(test_data.receipts)])
+        for i in range(number_of_receipts)
+    ]
+    if snapshots:
+        receipts = [rcpt.snapshot() for rcpt in receipts]
+    # end if
+
+    riba_doc = Document(**test_data.head, **document_args)
+    if creation_date is not None:
+        riba_doc._creation_date = creation_date
+    # end if
+    for rcpt in (reversed(receipts) if reverse else receipts):
+        riba_doc.add_receipt(rcpt)
+    # end for
+
+    return riba_doc
+# end build_document
@@ -20,10 +20,13 @@ class InvoiceFake:
 
 
 class MoveLineFake:
-    def __init__(self, date_maturity, amount_residual, invoice_id):
+    def __init__(self, date_maturity, amount_residual, invoice_id, name='', move_id=None, id=None):
+        self.id = id
         self.date_maturity = dateutil.parser.parse(date_maturity)
         self.amount_residual = amount_residual
         self.invoice_id = invoice_id
+        self.name = name
+        self.move_id = move_id
     # end init
 # end InvoiceFake
 
@@ -68,3 +71,107 @@ class PaymentLineFake:
         self.communication = communication
     # end init
 # end CompanyFake
+
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+# Emulation of the Odoo lazy loading of the records
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+# Classes of the fake objects emulating Odoo records
+RECORD_FAKES = (
+    BankAccountFake, InvoiceFake, MoveLineFake, PartnerFake,
+    CompanyFake, PaymentLineFake, SimpleNamespace
+)
+
+
+class QueryCounterFake:
+    """Count the queries that would be performed by the Odoo ORM"""
+
+    def __init__(self):
+        self.count = 0
+    # end init
+# end QueryCounterFake
+
+
+class LazyRecordFake:
+    """Wrap a fake object emulating the lazy loading of Odoo records: the
+    first access to a field of a record costs one query, the following
+    accesses are served by the cache. The id is always available."""
+
+    def __init__(self, wrapped, counter: QueryCounterFake):
+        fields = {
+            name: LazyRecordFake(value, counter) if isinstance(value, RECORD_FAKES) else value
+            for name, value in vars(wrapped).items()
+        }
+        self.__dict__['_fields'] = fields
+        self.__dict__['_counter'] = counter
+        self.__dict__['_loaded'] = False
+    # end init
+
+    def _load(self):
+        if not self._loaded:
+            self._counter.count += 1
+            self.__dict__['_loaded'] = True
+        # end if
+    # end _load
+
+    def __getattr__(self, name):
+        if name != 'id':
+            self._load()
+        # end if
+        try:
+            return self._fields[name]
+        except KeyError:
+            raise AttributeError(name)
+        # end try / except
+    # end __getattr__
+# end LazyRecordFake
+
+
+class RecordsetFake:
+    """Emulate an Odoo recordset of fake records: iterating it returns the
+    records, mapped() loads a field path for all the records performing a
+    single query for each model along the path"""
+
+    def __init__(self, records, counter: QueryCounterFake = None):
+        self.counter = counter or QueryCounterFake()
+        self._records = [
+            r if isinstance(r, LazyRecordFake) else LazyRecordFake(r, self.counter)
+            for r in records
+        ]
+    # end init
+
+    def __iter__(self):
+        return iter(self._records)
+    # end __iter__
+
+    def __len__(self):
+        return len(self._records)
+    # end __len__
+
+    def mapped(self, path: str):
+        records = self._records
+        values = list()
+
+        for name in path.split('.'):
+
+            # Bulk load of all the records not yet loaded: one query
+            unloaded = [r for r in records if not r._loaded]
+            if unloaded:
+                self.counter.count += 1
+                for r in unloaded:
+                    r.__dict__['_loaded'] = True
+                # end for
+            # end if
+
+            values = [r._fields[name] for r in records]
+            records = [v for v in values if isinstance(v, LazyRecordFake)]
+        # end for
+
+        if records and len(records) == len([v for v in values if v]):
+            return RecordsetFake(records, self.counter)
+        else:
+            return values
+        # end if
+    # end mapped
+# end RecordsetFake
@@ -272,3 +272,48 @@ def test_validate_zip():
     validate_zip('00129')
     
 # end test_validate_zip
+
+
+def test_validate_batch():
+
+    # Imported here to keep the other tests independent from the data loading
+    from .tools.data_load import FakeData
+    from ribalta.riba import Receipt
+    from ribalta.utils.errors import BatchValidationError, FiscalcodeAndVATMissingError
+    from ribalta.utils.validators import validate_batch
+
+    # 3 valid receipts followed by a receipt without fiscal code and VAT
+    # and by 2 more valid receipts
+    payment_lines = FakeData.build_from_test_data('riba_ok').receipts
+    payment_lines += FakeData.build_from_test_data('riba_debt_no_fiscode_no_vat').receipts
+
+    # Break the data of the first receipt: wrong ABI and ZIP code
+    payment_lines[0].partner_bank_id.sanitized_acc_number = 'IT52X0000012101123450054321'
+    payment_lines[0].partner_id.zip = '3512'
+
+    receipts = [Receipt(line, validate=False) for line in payment_lines]
+
+    report = validate_batch(receipts)
+
+    assert not report.is_valid
+    assert report.receipts_count == len(receipts)
+    assert report.invalid_indexes == [0, 3]
+
+    errors = report.by_receipt()
+    assert [i.field for i in errors[0]] == ['debtor_bank_abi', 'debtor_zip']
+    assert isinstance(errors[0][0].error, ABIInvalidError)
+    assert isinstance(errors[0][1].error, ZIPInvalidError)
+    assert isinstance(errors[3][0].error, FiscalcodeAndVATMissingError)
+
+    assert len(report.as_dicts()) == len(report.issues)
+
+    with pytest.raises(BatchValidationError):
+        report.raise_if_invalid()
+    # end with
+
+    # Valid receipts
+    valid_report = validate_batch(receipts[1:3] + receipts[4:])
+    assert valid_report.is_valid
+    valid_report.raise_if_invalid()
+
+# end test_validate_batch